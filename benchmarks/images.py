@@ -0,0 +1,85 @@
+"""Time taken shaping commons geosearch responses of growing size into nearby image
+results, with the indexing used before it was made linear for comparison,
+writing the results as json.
+
+python -m benchmarks.images --counts 10 100 1000 10000 --output images.json"""
+import argparse
+import json
+import sys
+import time
+from typing import List, Optional, Sequence
+from benchmarks.memory import images_response
+from wikigeo.wikisearch import _nearby_image_records, _parse_nearby_images
+
+# largest response the quadratic indexing is timed for, as it takes seconds past this
+BEFORE_MAX = 2000
+
+
+def _quadratic_index(response: dict) -> dict:
+    """the indexing of images before, looping over every image for every key"""
+    imagedata = [
+        image.to_dict() for image in _nearby_image_records(response, False, False)
+    ]
+    return {
+        i: image_result for i in range(len(imagedata)) for image_result in imagedata
+    }
+
+
+def best_time(function, *args, runs: int = 5) -> float:
+    """fastest of runs calls of function, in seconds"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure(counts: Sequence[int], runs: int = 5) -> List[dict]:
+    """milliseconds taken and microseconds per image for each response size"""
+    results = []
+    for count in counts:
+        response = images_response(count)
+        seconds = best_time(_parse_nearby_images, response, False, False, runs=runs)
+        matched = best_time(_parse_nearby_images, response, "Place 1", 10, runs=runs)
+        result = {
+            "images": count,
+            "ms": round(seconds * 1000, 3),
+            "us_per_image": round(seconds / count * 1e6, 2),
+            "matched_ms": round(matched * 1000, 3),
+            "before_ms": None,
+        }
+        if count <= BEFORE_MAX:
+            before = best_time(_quadratic_index, response, runs=runs)
+            result["before_ms"] = round(before * 1000, 3)
+        results.append(result)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None, help="json file, stdout by default")
+    args = parser.parse_args(argv)
+    results = measure(args.counts, args.runs)
+    for result in results:
+        before = result["before_ms"]
+        print(
+            f"{result['images']:>7} images {result['ms']:>10}ms "
+            f"{result['us_per_image']:>7}us per image, "
+            f"before {'-' if before is None else before}ms",
+            file=sys.stderr,
+        )
+    report = {"python": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Cold start cost of importing the package, measured in fresh interpreters so
+nothing is already imported, writing the results as json.
+
+python -m benchmarks.importtime --runs 10 --output importtime.json"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+STATEMENTS = (
+    "import wikigeo",
+    "from wikigeo import WikiExtractor",
+    "from wikigeo import ConcurrentSearcher",
+    "import wikigeo.cli",
+)
+
+# third party modules that are slow to import, reported if a statement imports them
+HEAVY_MODULES = ("numpy", "requests", "lxml", "fuzzywuzzy", "requests_html")
+
+
+# run in each fresh interpreter, timing the statement and listing heavy modules
+_CHECK = """import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+heavy = [module for module in {heavy!r} if module in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))"""
+
+
+def measure(statement: str, runs: int = 10) -> dict:
+    """median time taken by statement in a fresh interpreter, and by the whole
+    interpreter run, with the heavy modules the statement imported"""
+    check = _CHECK.format(statement=statement, heavy=HEAVY_MODULES)
+    walls = []
+    imports = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", check], capture_output=True, text=True, check=True
+        )
+        walls.append(time.perf_counter() - start)
+        output = json.loads(process.stdout)
+        imports.append(output["seconds"])
+    return {
+        "statement": statement,
+        "runs": runs,
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "wall_ms": round(statistics.median(walls) * 1000, 1),
+        "heavy_modules": output["heavy"],
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default=None, help="json file, stdout by default")
+    args = parser.parse_args(argv)
+    results = [measure(statement, args.runs) for statement in STATEMENTS]
+    # start up of a bare interpreter, to compare the wall times against
+    baseline = measure("pass", args.runs)
+    report = {
+        "python": sys.version.split()[0],
+        "interpreter_ms": baseline["wall_ms"],
+        "results": results,
+    }
+    for result in results:
+        print(
+            f"{result['statement']:40} {result['import_ms']:>7}ms "
+            f"imports {', '.join(result['heavy_modules']) or 'nothing heavy'}",
+            file=sys.stderr,
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Memory held by search results as dictionaries, records and columnar batches,
+for synthetic responses of many pages, writing the results as json.
+
+python -m benchmarks.memory --results 100000 --output memory.json"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from typing import Callable, List, Optional
+from wikigeo.records import ResultBatch
+from wikigeo.wikisearch import (
+    _nearby_image_records,
+    _nearby_page_records,
+    _page_match_records,
+)
+
+SEARCH = (51.43, -0.51)
+
+
+def nearby_response(count: int) -> dict:
+    """geosearch response with count pages spread around the search point"""
+    return {
+        str(i): {
+            "pageid": i,
+            "title": f"Place {i}",
+            "coordinates": [{"lat": SEARCH[0] + i * 1e-6, "lon": SEARCH[1] - i * 1e-6}],
+            "terms": {"label": [f"Place {i}"], "description": ["place"]},
+        }
+        for i in range(count)
+    }
+
+
+def images_response(count: int) -> dict:
+    """commons geosearch response with count images"""
+    return {
+        str(i): {
+            "title": f"File:Place {i}.jpg",
+            "coordinates": [{"lat": SEARCH[0], "lon": SEARCH[1]}],
+            "imageinfo": [
+                {
+                    "url": f"https://upload.wikimedia.org/{i}.jpg",
+                    "descriptionurl": f"https://commons.wikimedia.org/wiki/File:{i}",
+                }
+            ],
+        }
+        for i in range(count)
+    }
+
+
+def retained(build: Callable[[], object]) -> int:
+    """bytes still allocated by the object build returns"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def measure(count: int) -> List[dict]:
+    """bytes per result held for each kind of result and form"""
+    nearby = nearby_response(count)
+    images = images_response(count)
+    kinds = {
+        "pages": lambda: _nearby_page_records(nearby),
+        "matches": lambda: _page_match_records(
+            nearby, "Place", SEARCH[0], SEARCH[1], False, 30, -1
+        ),
+        "images": lambda: _nearby_image_records(images, False, False),
+    }
+    results = []
+    for kind, records in kinds.items():
+        forms = {
+            "dicts": lambda: [record.to_dict() for record in records()],
+            "records": records,
+            "batch": lambda: ResultBatch.from_records(records()),
+        }
+        for form, build in forms.items():
+            size = retained(build)
+            results.append(
+                {
+                    "kind": kind,
+                    "form": form,
+                    "results": count,
+                    "bytes_per_result": round(size / count, 1),
+                }
+            )
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--results", type=int, default=100000)
+    parser.add_argument("--output", default=None, help="json file, stdout by default")
+    args = parser.parse_args(argv)
+    results = measure(args.results)
+    for result in results:
+        print(
+            f"{result['kind']:8} {result['form']:8} "
+            f"{result['bytes_per_result']:>8} bytes per result",
+            file=sys.stderr,
+        )
+    report = {"python": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Local stand-in for the Wikipedia and Commons APIs and article pages, replaying
+recorded responses from the fixtures folder"""
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, urlparse
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing pooled keep-alive connections isn't an error
+        pass
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixtures(folder: str = FIXTURES) -> dict:
+    """recorded geosearch, search and commons responses and an article page"""
+    fixtures = {}
+    for name in ("geosearch", "search", "commons"):
+        with open(os.path.join(folder, name + ".json")) as file:
+            fixtures[name] = json.load(file)
+    with open(os.path.join(folder, "article.html"), "rb") as file:
+        fixtures["article"] = file.read()
+    return fixtures
+
+
+def split_response(response: dict, continuations: int, part: int) -> dict:
+    """part of a response with its pages split across continuations + 1 responses,
+    with continue parameters in all but the last, as when props span responses"""
+    pages = list(response["query"]["pages"].items())
+    size = -(-len(pages) // (continuations + 1))
+    split = {
+        "query": dict(
+            response["query"], pages=dict(pages[part * size : (part + 1) * size])
+        )
+    }
+    if part < continuations:
+        split["continue"] = {"cocontinue": str(part + 1), "continue": "||"}
+    else:
+        split["batchcomplete"] = ""
+    return split
+
+
+class MockWiki:
+    """threaded http server answering API queries and article requests.
+
+    /w/api.php answers as the Wikipedia API, /commons/w/api.php as the Commons API
+    and /wiki/<title> with the article page
+
+    latency: seconds added to each response
+
+    jitter: max random seconds added to the latency
+
+    continuations: number of continuation responses geosearch results are split over
+
+    errorrate: fraction of API requests answered with a 503 and Retry-After: 0,
+    which clients retry
+
+    seed: seed for the random jitter and errors, so runs can be repeated"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        continuations: int = 0,
+        errorrate: float = 0.0,
+        seed: Optional[int] = 0,
+        fixtures: Optional[dict] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.continuations = continuations
+        self.errorrate = errorrate
+        self.fixtures = fixtures or load_fixtures()
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockWiki":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.requests += 1
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def _fail(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.errorrate
+            self.errors += failed
+            return failed
+
+    def answer(self, path: str, query: dict) -> dict:
+        """response to an API query"""
+        if path.startswith("/commons"):
+            return self.fixtures["commons"]
+        if query.get("generator") == "search":
+            return self.fixtures["search"]
+        if "titles" in query:
+            return self._titles(query["titles"].split("|"), query.get("prop"))
+        part = int(query.get("cocontinue", 0))
+        return split_response(self.fixtures["geosearch"], self.continuations, part)
+
+    def _titles(self, titles: list, prop: Optional[str]) -> dict:
+        """pages for a title or revision query, taken from the geosearch pages"""
+        known = {
+            page["title"]: page
+            for page in self.fixtures["geosearch"]["query"]["pages"].values()
+        }
+        pages = {}
+        for i, title in enumerate(titles):
+            page = dict(known.get(title, {"pageid": 5000 + i, "title": title}))
+            if prop == "info":
+                page = {"pageid": page["pageid"], "title": title, "lastrevid": 1}
+            else:
+                page["extract"] = f"{title} is a place."
+            pages[str(page["pageid"])] = page
+        return {"batchcomplete": "", "query": {"pages": pages}}
+
+    def _handler(self):
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, so without this small
+            # responses wait on delayed acks
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str, headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for header, value in headers:
+                    self.send_header(header, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                time.sleep(wiki._delay())
+                url = urlparse(self.path)
+                if url.path.startswith("/wiki/"):
+                    self._send(
+                        200, wiki.fixtures["article"], "text/html; charset=UTF-8"
+                    )
+                    return
+                if wiki._fail():
+                    self._send(503, b"", "text/plain", [("Retry-After", "0")])
+                    return
+                body = json.dumps(wiki.answer(url.path, dict(parse_qsl(url.query))))
+                self._send(200, body.encode(), "application/json")
+
+        return Handler
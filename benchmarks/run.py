@@ -0,0 +1,221 @@
+"""Benchmarks of the API wrapper, WikiExtractor and ConcurrentSearcher against MockWiki,
+writing throughput and latency percentiles as json so runs can be compared.
+
+python -m benchmarks.run --latency 0.05 --concurrency 1 4 16 --output results.json"""
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import platform
+import sys
+import time
+from typing import Callable, List, Optional
+from unittest import mock
+from benchmarks.mockwiki import MockWiki
+from wikigeo.cli import summary
+from wikigeo.wikimultisearch import ConcurrentSearcher
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.sessions import SessionPool
+from wikigeo.wikisource.singleflight import SingleFlight
+from wikigeo.wikisource.wikiapi import query_nearby
+
+LAT, LON = 51.43181, -0.51066
+# about 20km across, covered by a handful of 10km searches
+AREA = (51.35, -0.65, 51.5, -0.4)
+TITLES = ["Staines Bridge", "Runnymede", "Thorpe Park", "Royal Holloway"]
+
+
+def _searcher(
+    server: MockWiki,
+    concurrency: int,
+    rate: Optional[float],
+    singleflight: Optional[SingleFlight] = None,
+):
+    """searcher sending every request to the mock server, without a response cache
+    so calls after the warmup aren't answered from memory, and without sharing
+    identical requests unless singleflight is given"""
+    ratelimiter = RateLimiter(rate=rate, maxconcurrent=None)
+    searcher = ConcurrentSearcher(
+        "en", "benchmark", cache=None, ratelimiter=ratelimiter
+    )
+    wiki = searcher.wiki
+    wiki.sessionpool = SessionPool(maxsize=max(10, concurrency))
+    for api, path in (
+        (wiki.api, "/w/api.php"),
+        (wiki.commonsapi, "/commons/w/api.php"),
+    ):
+        api.url = server.url + path
+        api.session = wiki.sessionpool.get(api.url)
+        api.singleflight = singleflight
+    return searcher
+
+
+def cases(searcher, shared) -> dict:
+    """name: (function run once per call, number of items each call handles).
+    The multi_* cases are given distinct searches, as repeated ones are only sent
+    once, apart from the repeated case run by shared, a searcher sharing requests"""
+    wiki = searcher.wiki
+    batch = 10
+    # about 100m apart, so distinct after coordinates are rounded
+    coords = [(LAT + i / 1000, LON - i / 1000) for i in range(batch)]
+    names = [f"{TITLES[i % len(TITLES)]} {i}" for i in range(batch)]
+    return {
+        "WikipediaAPI.get_data": (
+            lambda: wiki.api.get_data(query_nearby(LAT, LON, 20, 10000)),
+            1,
+        ),
+        "WikiExtractor.get_nearby_pages": (
+            lambda: wiki.get_nearby_pages(LAT, LON, limit=20),
+            1,
+        ),
+        "WikiExtractor.get_nearby_images": (
+            lambda: wiki.get_nearby_images(LAT, LON, nametomatch="Staines Bridge"),
+            1,
+        ),
+        "WikiExtractor.get_page_match": (
+            lambda: wiki.get_page_match("Staines", LAT, LON, bestmatch="name"),
+            1,
+        ),
+        "WikiExtractor.get_page_text": (
+            lambda: wiki.get_page_text("Staines-upon-Thames", 1000),
+            1,
+        ),
+        "WikiExtractor.get_page_texts": (
+            lambda: wiki.get_page_texts(TITLES, 1000),
+            len(TITLES),
+        ),
+        "WikiExtractor.get_pages_in_area": (
+            lambda: list(wiki.get_pages_in_area(AREA)),
+            1,
+        ),
+        "WikiExtractor.get_pages_by_title": (
+            lambda: wiki.get_pages_by_title(TITLES),
+            1,
+        ),
+        "ConcurrentSearcher.multi_nearby_pages": (
+            lambda: searcher.multi_nearby_pages(coords, limit=20),
+            batch,
+        ),
+        "ConcurrentSearcher.multi_nearby_images": (
+            lambda: searcher.multi_nearby_images(coords, names),
+            batch,
+        ),
+        "ConcurrentSearcher.multi_page_match": (
+            lambda: searcher.multi_page_match(
+                [(name, lat, lon) for name, (lat, lon) in zip(names, coords)]
+            ),
+            batch,
+        ),
+        "ConcurrentSearcher.multi_page_text": (
+            lambda: searcher.multi_page_text(names, 1000),
+            batch,
+        ),
+        "ConcurrentSearcher.multi_nearby_pages_repeated": (
+            lambda: shared.multi_nearby_pages([(LAT, LON)] * batch, limit=20),
+            batch,
+        ),
+    }
+
+
+def measure(function: Callable, calls: int, concurrency: int, items: int = 1) -> dict:
+    """runs function calls times from concurrency threads, returning throughput
+    in items per second and latency percentiles of each call"""
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            function()
+            failed = False
+        except Exception:
+            failed = True
+        return time.perf_counter() - start, failed
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = list(executor.map(timed, range(calls)))
+    seconds = time.perf_counter() - start
+    result = summary([latency for latency, _ in timings], seconds)
+    result["errors"] = sum(failed for _, failed in timings)
+    result["items_per_second"] = round(calls * items / seconds, 2) if seconds else 0.0
+    return result
+
+
+def run(
+    server: MockWiki,
+    concurrency: List[int],
+    calls: int = 50,
+    rate: Optional[float] = None,
+    names: Optional[List[str]] = None,
+) -> List[dict]:
+    """benchmarks each case at each concurrency level"""
+    results = []
+    for level in concurrency:
+        searcher = _searcher(server, level, rate)
+        shared = _searcher(server, level, rate, SingleFlight())
+        article = server.url + "/wiki/"
+        with mock.patch(
+            "wikigeo.wikisource.wikitext.page_url",
+            lambda title, lang: article + title.replace(" ", "_"),
+        ):
+            for name, (function, items) in cases(searcher, shared).items():
+                if names and name not in names:
+                    continue
+                # warming up connections
+                function()
+                result = {"name": name, "concurrency": level, "calls": calls}
+                sent = server.requests
+                result.update(measure(function, calls, level, items))
+                # requests reaching the server, to check calls weren't answered locally
+                result["requests"] = server.requests - sent
+                results.append(result)
+                print(
+                    f"{name:45} x{level:<3} {result['items_per_second']:>9} items/s "
+                    f"p50 {result['p50_ms']}ms p99 {result['p99_ms']}ms "
+                    f"{result['requests']} requests",
+                    file=sys.stderr,
+                )
+        searcher.wiki.sessionpool.close()
+        shared.wiki.sessionpool.close()
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="seconds")
+    parser.add_argument("--continuations", type=int, default=1)
+    parser.add_argument("--errorrate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=None, help="requests per second")
+    parser.add_argument("--case", action="append", help="only run the named cases")
+    parser.add_argument("--output", default=None, help="json file, stdout by default")
+    args = parser.parse_args(argv)
+    # anything printed while running would break the json report
+    with contextlib.redirect_stdout(sys.stderr), MockWiki(
+        args.latency, args.jitter, args.continuations, args.errorrate
+    ) as server:
+        results = run(server, args.concurrency, args.calls, args.rate, args.case)
+        requests = server.requests
+    report = {
+        "python": platform.python_version(),
+        "server": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "continuations": args.continuations,
+            "errorrate": args.errorrate,
+            "requests": requests,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+
+if __name__ == "__main__":
+    main()
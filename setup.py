@@ -12,9 +12,12 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     author='Mary McGuire',
     author_email='marymcguire1718@gmail.com',
-    install_requires=["requests_html",
-    "fuzzywuzzy", "python-Levenshtein-wheels"],
-    extras_require={"pytest": "pytest==6.0.1", "tox": "tox==3.19.0"},
+    install_requires=["requests", "lxml",
+    "fuzzywuzzy", "python-Levenshtein-wheels", "numpy"],
+    extras_require={"pytest": "pytest==6.0.1", "tox": "tox==3.19.0",
+    "async": "aiohttp", "fast": "rapidfuzz", "parquet": "pyarrow",
+    "otel": "opentelemetry-api"},
+    entry_points={"console_scripts": ["wikigeo=wikigeo.cli:main"]},
     classifiers=[
         "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.7",
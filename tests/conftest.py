@@ -0,0 +1,10 @@
+import pytest
+from wikigeo.wikisource.ratelimit import DEFAULT_LIMITER
+
+
+@pytest.fixture(autouse=True)
+def reset_default_limiter():
+    """closes the circuit breakers shared by every test using the default limiter,
+    so tests failing to reach a wiki don't make later tests fail fast"""
+    DEFAULT_LIMITER.reset()
+    yield
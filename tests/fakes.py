@@ -0,0 +1,45 @@
+"""Stand-ins for requests sessions and responses shared by the tests"""
+import json
+
+
+class FakeResponse:
+    """stands in for a requests response with a json body"""
+
+    def __init__(self, data=None, status_code=200, headers=None):
+        self.data = {} if data is None else data
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.content = json.dumps(self.data).encode()
+
+    def json(self):
+        # a new copy each time, as merging continued results changes what it's given
+        return json.loads(self.content)
+
+
+class FakeSession:
+    """returns the given responses in turn, raising any that are exceptions,
+    and keeps the parameters sent"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.params = []
+
+    def get(self, url, params=None, headers=None):
+        self.params.append(params)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class RepeatSession:
+    """answers every query with the same data, keeping the parameters sent"""
+
+    def __init__(self, data):
+        self.data = data
+        self.params = []
+
+    def get(self, url, params=None, headers=None):
+        self.params.append(params)
+        return FakeResponse(self.data)
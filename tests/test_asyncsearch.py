@@ -0,0 +1,202 @@
+"""Test asyncio searches against a local stand-in for the Wikipedia API"""
+import asyncio
+import unittest
+from unittest import mock
+from aiohttp import web
+from wikigeo.asyncsearch import AsyncWikiExtractor
+from wikigeo.wikisource.errors import APIError, RequestError, ThrottledError
+from wikigeo.wikisource.ratelimit import RateLimiter
+
+NEARBY_PAGES = [
+    {
+        "continue": {"ggsoffset": "1", "continue": "ggsoffset||"},
+        "query": {
+            "pages": {
+                "1": {
+                    "pageid": 1,
+                    "title": "Staines Bridge",
+                    "coordinates": [{"lat": 51.4344, "lon": -0.5134}],
+                    "terms": {"label": ["Staines Bridge"], "description": ["bridge"]},
+                }
+            }
+        },
+    },
+    {
+        "batchcomplete": "",
+        "query": {
+            "pages": {
+                "2": {
+                    "pageid": 2,
+                    "title": "Staines Moor",
+                    "coordinates": [{"lat": 51.4460, "lon": -0.5020}],
+                }
+            }
+        },
+    },
+]
+
+SEARCH = {
+    "batchcomplete": "",
+    "query": {
+        "pages": {
+            "3": {
+                "pageid": 3,
+                "title": "Staines-upon-Thames",
+                "coordinates": [{"lat": 51.4340, "lon": -0.5110}],
+                "terms": {"label": ["Staines"], "description": ["town"]},
+            },
+            "4": {"pageid": 4, "title": "Staines (surname)"},
+        }
+    },
+}
+
+HTML = "<html><body><h2>History[edit]</h2><p>Staines is a town.</p></body></html>"
+
+
+async def api(request):
+    """returns canned responses for each kind of query"""
+    if request.query.get("generator") == "search":
+        return web.json_response(SEARCH)
+    page = 1 if "ggsoffset" in request.query else 0
+    return web.json_response(NEARBY_PAGES[page])
+
+
+async def unavailable(request):
+    """always answers that the server is unavailable"""
+    return web.Response(status=503)
+
+
+async def bad_query(request):
+    """answers with an API error"""
+    return web.json_response({"error": {"code": "badvalue", "info": "bad value"}})
+
+
+async def article(request):
+    """returns a canned article"""
+    return web.Response(text=HTML, content_type="text/html")
+
+
+class SlowArticle:
+    """returns the canned article after a delay, keeping the most requests in flight"""
+
+    def __init__(self):
+        self.inflight = 0
+        self.most = 0
+
+    async def handle(self, request):
+        self.inflight += 1
+        self.most = max(self.most, self.inflight)
+        await asyncio.sleep(0.02)
+        self.inflight -= 1
+        return await article(request)
+
+
+class FlakyArticle:
+    """answers that the server is unavailable the first time, then with the article"""
+
+    def __init__(self):
+        self.requests = 0
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.requests == 1:
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        return await article(request)
+
+
+class TestAsyncWikiExtractor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.router.add_get("/w/api.php", api)
+        app.router.add_get("/wiki/{title}", article)
+        self.slow = SlowArticle()
+        app.router.add_get("/slow/{title}", self.slow.handle)
+        self.flaky = FlakyArticle()
+        app.router.add_get("/flaky/{title}", self.flaky.handle)
+        app.router.add_get("/unavailable/api.php", unavailable)
+        app.router.add_get("/bad/api.php", bad_query)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.host = f"http://127.0.0.1:{port}"
+        self.wiki = AsyncWikiExtractor("en", "test")
+        self.wiki._get_session()
+        self.wiki.api.url = self.host + "/w/api.php"
+
+    async def asyncTearDown(self):
+        await self.wiki.close()
+        await self.runner.cleanup()
+
+    async def test_get_nearby_pages(self):
+        """test continued results are combined into page dictionaries"""
+        pages = await self.wiki.get_nearby_pages(51.43, -0.51)
+        assert [page["title"] for page in pages] == ["Staines Bridge", "Staines Moor"]
+        assert pages[0]["coordinates"] == {"lat": 51.4344, "lon": -0.5134}
+        assert pages[0]["label"] == ["Staines Bridge"] and pages[1]["label"] is None
+
+    async def test_get_page_match(self):
+        """test only geolocated matches are returned"""
+        matches = await self.wiki.get_page_match("Staines", 51.43, -0.51)
+        results = matches["page_matches"]
+        assert len(results) == 1
+        assert results[0]["title"] == "Staines-upon-Thames"
+        assert results[0]["distance"] < 1
+
+    async def test_get_page_text(self):
+        """test text scraped from page"""
+        with mock.patch(
+            "wikigeo.asyncsearch.page_url", lambda title, lang: self.host + "/wiki/x"
+        ):
+            page = await self.wiki.get_page_text("Staines", limit=10)
+        assert page == {"title": "Staines", "text": "History St"}
+
+    async def test_page_text_retried(self):
+        """test page requests are retried when the server is unavailable"""
+        with mock.patch(
+            "wikigeo.asyncsearch.page_url", lambda title, lang: self.host + "/flaky/x"
+        ):
+            page = await self.wiki.get_page_text("Staines", limit=10)
+        assert page["text"] == "History St" and self.flaky.requests == 2
+
+    async def test_timeouts_raise_request_errors(self):
+        """test timed out requests raise RequestError once retries run out"""
+        wiki = AsyncWikiExtractor(
+            "en", "test", ratelimiter=RateLimiter(rate=None), retries=1, backoff=0
+        )
+        async with wiki:
+            with mock.patch.object(
+                wiki.session, "get", side_effect=asyncio.TimeoutError
+            ) as get:
+                with self.assertRaises(RequestError):
+                    await wiki.get_page_text("Staines")
+                with self.assertRaises(RequestError):
+                    await wiki.get_nearby_pages(51.43, -0.51)
+        assert get.call_count == 4
+
+    async def test_max_concurrent(self):
+        """test coroutines keep within the concurrency limit for each host"""
+        limiter = RateLimiter(rate=None, maxconcurrent=2)
+        async with AsyncWikiExtractor("en", "test", ratelimiter=limiter) as wiki:
+            with mock.patch(
+                "wikigeo.asyncsearch.page_url",
+                lambda title, lang: self.host + "/slow/" + title,
+            ):
+                pages = await asyncio.gather(
+                    *[wiki.get_page_text(f"Page {i}", limit=10) for i in range(6)]
+                )
+        assert len(pages) == 6 and self.slow.most == 2
+
+    async def test_errors(self):
+        """test failed requests raise typed errors after retrying"""
+        self.wiki.api.retries = 1
+        self.wiki.api.backoff = 0
+        self.wiki.api.url = self.host + "/unavailable/api.php"
+        with self.assertRaises(ThrottledError) as raised:
+            await self.wiki.get_nearby_pages(51.43, -0.51)
+        assert raised.exception.status == 503
+        self.wiki.api.url = self.host + "/bad/api.php"
+        with self.assertRaises(APIError) as raised:
+            await self.wiki.get_nearby_pages(51.43, -0.51)
+        assert raised.exception.code == "badvalue"
@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import unittest
+import requests
+from benchmarks.mockwiki import MockWiki, split_response
+from benchmarks.images import measure as measure_images
+from benchmarks.memory import measure as measure_memory
+from benchmarks.run import main, run
+
+
+class TestMockWiki(unittest.TestCase):
+    def test_split_response(self):
+        """test pages are split across continuations with continue in all but the last"""
+        response = {"query": {"pages": {str(i): {"pageid": i} for i in range(5)}}}
+        parts = [split_response(response, 2, part) for part in range(3)]
+        assert [len(part["query"]["pages"]) for part in parts] == [2, 2, 1]
+        assert parts[0]["continue"]["cocontinue"] == "1"
+        assert "batchcomplete" in parts[2]
+
+    def test_errors(self):
+        """test failed requests get a 503 with Retry-After"""
+        with MockWiki(errorrate=1.0) as server:
+            response = requests.get(server.url + "/w/api.php?action=query")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "0"
+        assert server.errors == 1
+
+
+class TestRun(unittest.TestCase):
+    def test_run(self):
+        """test a case is run against the mock server, retrying injected errors"""
+        with MockWiki(continuations=1, errorrate=0.5) as server:
+            results = run(
+                server, [2], calls=4, names=["WikiExtractor.get_nearby_pages"]
+            )
+        assert len(results) == 1
+        assert results[0]["concurrency"] == 2
+        assert results[0]["items"] == 4
+        assert results[0]["errors"] == 0
+        assert server.errors > 0
+        # every call reaches the server, nothing is cached between calls
+        assert results[0]["requests"] >= 4
+
+    def test_multi_cases_distinct(self):
+        """test batch searches aren't merged unless the case is about merging them"""
+        names = [
+            "ConcurrentSearcher.multi_page_match",
+            "ConcurrentSearcher.multi_nearby_pages_repeated",
+        ]
+        with MockWiki(latency=0, jitter=0, continuations=1) as server:
+            distinct, repeated = run(server, [2], calls=2, names=names)
+        assert distinct["requests"] == 2 * 10
+        assert repeated["requests"] < 2 * 10
+
+    def test_output(self):
+        """test the report is written as json"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "results.json")
+            main(
+                [
+                    "--latency",
+                    "0",
+                    "--jitter",
+                    "0",
+                    "--calls",
+                    "2",
+                    "--concurrency",
+                    "1",
+                    "--case",
+                    "WikipediaAPI.get_data",
+                    "--output",
+                    path,
+                ]
+            )
+            with open(path) as file:
+                report = json.load(file)
+        assert report["results"][0]["name"] == "WikipediaAPI.get_data"
+        assert report["server"]["requests"] > 0
+
+
+class TestParsing(unittest.TestCase):
+    def test_images_linear(self):
+        """test the time per image doesn't grow with the number of images"""
+        small, large = measure_images([100, 2000], runs=3)
+        assert large["before_ms"] > 5 * large["ms"]
+        assert large["us_per_image"] < 5 * small["us_per_image"]
+
+    def test_memory(self):
+        """test records and batches hold less than dictionaries"""
+        results = measure_memory(1000)
+        sizes = {(r["kind"], r["form"]): r["bytes_per_result"] for r in results}
+        for kind in ("pages", "matches", "images"):
+            assert sizes[kind, "batch"] < sizes[kind, "records"] < sizes[kind, "dicts"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""Test caching of API responses"""
+import os
+import tempfile
+import time
+import unittest
+from wikigeo.wikisource.cache import (
+    ResponseCache,
+    MemoryCache,
+    SQLiteCache,
+    cache_key,
+    query_kind,
+)
+from wikigeo.wikisource.wikiapi import WikipediaAPI, query_nearby
+from tests.fakes import FakeResponse
+
+PAGES = [
+    {
+        "continue": {"ggsoffset": "1", "continue": "ggsoffset||"},
+        "query": {"pages": {"1": {"pageid": 1, "title": "Staines Bridge"}}},
+    },
+    {
+        "batchcomplete": "",
+        "query": {"pages": {"2": {"pageid": 2, "title": "Staines Moor"}}},
+    },
+]
+
+
+class PagedSession:
+    """returns the next page for each request and counts requests"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = 0
+
+    def get(self, url, params=None, headers=None):
+        page = self.pages[1 if "ggsoffset" in params else 0]
+        self.requests += 1
+        return FakeResponse(page)
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_query_kind(self):
+        """test queries are classed for ttls"""
+        query = query_nearby(51.43, -0.51, 4, 1000)
+        assert query_kind("https://en.wikipedia.org/w/api.php", query) == "geosearch"
+        assert query_kind("https://commons.wikimedia.org/w/api.php", query) == "commons"
+        assert query_kind("", {"action": "parse"}) == "parse"
+
+    def test_cache_key_normalised(self):
+        """test key does not depend on param order or value types"""
+        key_a = cache_key("url", {"ggslimit": 4, "format": "json"})
+        key_b = cache_key("url", {"format": "json", "ggslimit": "4"})
+        assert key_a == key_b
+
+    def test_lru_eviction(self):
+        """test least recently used response is evicted"""
+        memory = MemoryCache(maxsize=2)
+        memory.set("a", {}, 60)
+        memory.set("b", {}, 60)
+        memory.get("a")
+        memory.set("c", {}, 60)
+        assert memory.get("b") is None
+        assert memory.get("a") == {} and memory.get("c") == {}
+
+    def test_ttl_expiry(self):
+        """test expired responses are not returned"""
+        cache = ResponseCache(ttls={"default": 0.01})
+        cache.set("url", {"action": "query"}, {"query": {}})
+        time.sleep(0.02)
+        assert cache.get("url", {"action": "query"}) is None
+        assert cache.stats()["misses"] == 1
+
+    def test_disk_tier(self):
+        """test responses persist between cache instances"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            ResponseCache(path=path).set("url", {"a": 1}, {"query": {"pages": {}}})
+            cache = ResponseCache(path=path)
+            assert cache.get("url", {"a": 1}) == {"query": {"pages": {}}}
+            assert cache.stats()["hits"] == 1
+
+    def test_disk_eviction(self):
+        """test least recently used rows are evicted in batches from disk"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            disk = SQLiteCache(os.path.join(tmpdir, "cache.sqlite"), maxsize=20)
+            for i in range(20):
+                disk.set(str(i), {"i": i}, 60)
+            assert disk.get("0")[0] == {"i": 0}
+            disk.set("20", {"i": 20}, 60)
+            assert len(disk) == 18
+            assert disk.get("0")[0] == {"i": 0} and disk.get("20")[0] == {"i": 20}
+            assert disk.get("1") is None and disk.get("3") is None
+            assert disk.get("4")[0] == {"i": 4}
+
+    def test_disk_hits_keep_expiry(self):
+        """test responses read from disk expire when they would have on disk"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            ResponseCache(path=path, ttls={"default": 0.2}).set("url", {}, {})
+            time.sleep(0.1)
+            cache = ResponseCache(path=path, ttls={"default": 0.2})
+            assert cache.get("url", {}) == {}
+            time.sleep(0.15)
+            assert cache.get("url", {}) is None
+
+    def test_disk_access_times_batched(self):
+        """test hits don't write to disk until flushed"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cache.sqlite")
+            cache = ResponseCache(path=path)
+            cache.set("url", {"a": 1}, {"query": {}})
+            cache.memory.clear()
+            assert cache.get("url", {"a": 1}) == {"query": {}}
+            assert len(cache.disk._accessed) == 1
+            cache.flush()
+            assert cache.disk._accessed == {}
+
+    def test_cached_value_is_copied(self):
+        """test callers can't alter cached responses"""
+        cache = ResponseCache()
+        cache.set("url", {}, {"query": {"pages": {}}})
+        cache.get("url", {})["query"]["pages"]["1"] = {}
+        assert cache.get("url", {}) == {"query": {"pages": {}}}
+
+
+class TestCachedAPI(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.api = WikipediaAPI("test", cache=self.cache)
+        self.session = PagedSession(PAGES)
+        self.api.session = self.session
+
+    def test_repeat_paginated_query(self):
+        """test repeated paginated query sends no requests"""
+        query = query_nearby(51.43, -0.51, 4, 1000)
+        first = self.api.get_data(dict(query))
+        assert self.session.requests == 2
+        start = time.time()
+        second = self.api.get_data(dict(query))
+        assert time.time() - start < 1
+        assert self.session.requests == 2
+        assert first == second and len(second) == 2
+        assert self.cache.stats()["hits"] == 2
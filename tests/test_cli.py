@@ -0,0 +1,71 @@
+import io
+import json
+import unittest
+import unittest.mock
+from wikigeo.cli import build_parser, run, summary
+
+
+def run_cli(argv, stdin=""):
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    args = build_parser().parse_args(argv)
+    result = run(args, io.StringIO(stdin), stdout, stderr)
+    lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    return lines, stderr.getvalue(), result
+
+
+def fake_nearby(self, lat, lon, limit=4, radiusmeters=10000):
+    if lat > 90:
+        raise ValueError("Check parameters")
+    if lat < -90:
+        raise RuntimeError("unexpected")
+    return [{"title": f"Page at {lat}", "limit": limit}]
+
+
+class TestCLI(unittest.TestCase):
+    def test_dry_run(self):
+        """test queries are written without being sent"""
+        lines, _, result = run_cli(
+            ["--dry-run", "nearby", "--lat", "51.4", "--lon", "-0.5", "--limit", "10"]
+        )
+        assert result == {"items": 1}
+        assert lines[0]["query"]["ggscoord"] == "51.4|-0.5"
+        assert lines[0]["query"]["ggslimit"] == "10"
+        lines, _, _ = run_cli(["--dry-run", "text"], '{"title": "Staines"}\n')
+        assert lines[0]["query"] == {"url": "https://en.wikipedia.org/wiki/Staines"}
+
+    @unittest.mock.patch(
+        "wikigeo.wikisearch.WikiExtractor.get_nearby_pages", fake_nearby
+    )
+    def test_ndjson_stdin(self):
+        """test each line of stdin is searched, with errors reported per item"""
+        stdin = '{"lat": 1, "lon": 2}\n\n{"lat": 91, "lon": 2}\n{"lat": 3, "lon": 4, "limit": 2}\n'
+        lines, stderr, result = run_cli(
+            ["--user", "test", "--ordered", "--cache", ":memory:", "nearby"], stdin
+        )
+        assert lines[0] == {
+            "coords": [1, 2],
+            "result": [{"title": "Page at 1", "limit": 4}],
+        }
+        assert lines[1] == {"input": {"lat": 91, "lon": 2}, "error": "Check parameters"}
+        assert lines[2]["result"][0]["limit"] == 2
+        assert json.loads(stderr) == result
+        assert result["items"] == 3 and result["p99_ms"] >= result["p50_ms"]
+        assert result["hits"] == 0
+
+    @unittest.mock.patch(
+        "wikigeo.wikisearch.WikiExtractor.get_nearby_pages", fake_nearby
+    )
+    def test_item_errors(self):
+        """test items missing fields are reported and other errors raised"""
+        lines, _, _ = run_cli(["--user", "test", "--ordered", "nearby"], '{"lat": 1}\n')
+        assert lines == [{"input": {"lat": 1}, "error": "'lon'"}]
+        with self.assertRaises(RuntimeError):
+            run_cli(["--user", "test", "nearby"], '{"lat": -91, "lon": 2}\n')
+
+    def test_summary(self):
+        """test percentiles are in milliseconds"""
+        result = summary([0.01] * 98 + [1.0, 2.0], 2.0)
+        assert result["items_per_second"] == 50.0
+        assert result["p50_ms"] == 10.0
+        assert result["p99_ms"] > 1000
@@ -0,0 +1,126 @@
+"""Test following continuations and merging continued props"""
+import copy
+import time
+import unittest
+from wikigeo.wikisource.wikiapi import WikipediaAPI, merge_data, merge_pages
+from tests.fakes import FakeResponse
+
+
+class FakeContinueSession:
+    """answers with responses in turn, keyed on the continue parameter sent"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.sent = []
+
+    def get(self, url, params=None, headers=None):
+        self.sent.append(params)
+        return FakeResponse(self.responses[params.get("continue", "")])
+
+
+# two batches of generated pages, the coordinates of the first batch span two responses
+RESPONSES = {
+    "": {
+        "continue": {"cocontinue": "1|2", "continue": "ggscontinue||"},
+        "query": {
+            "pages": {
+                "1": {"pageid": 1, "title": "A", "coordinates": [{"lat": 1}]},
+                "2": {"pageid": 2, "title": "B"},
+            }
+        },
+    },
+    "ggscontinue||": {
+        "batchcomplete": "",
+        "continue": {"ggscontinue": "3", "continue": "gcs||"},
+        "query": {
+            "pages": {
+                "1": {"pageid": 1, "title": "A", "coordinates": [{"lat": 2}]},
+                "2": {"pageid": 2, "title": "B", "terms": {"label": ["B"]}},
+            }
+        },
+    },
+    "gcs||": {
+        "batchcomplete": "",
+        "query": {"pages": {"3": {"pageid": 3, "title": "C"}}},
+    },
+}
+
+
+class TestMerge(unittest.TestCase):
+    def test_lists_extended(self):
+        """test continued list props are added to rather than replaced"""
+        combined = {"coordinates": [{"lat": 1}], "terms": {"label": ["A"]}}
+        merge_data(
+            combined,
+            {"coordinates": [{"lat": 1}, {"lat": 2}], "terms": {"alias": ["B"]}},
+        )
+        assert combined == {
+            "coordinates": [{"lat": 1}, {"lat": 1}, {"lat": 2}],
+            "terms": {"label": ["A"], "alias": ["B"]},
+        }
+
+    def test_pages_in_lists_once(self):
+        """test pages repeated in a continued list prop are only added once"""
+        combined = {"redirects": [{"pageid": 1, "title": "A"}], "aliases": ["B"]}
+        merge_data(
+            combined,
+            {
+                "redirects": [{"pageid": 1, "title": "A"}, {"title": "C"}],
+                "aliases": ["B"],
+            },
+        )
+        assert combined == {
+            "redirects": [{"pageid": 1, "title": "A"}, {"title": "C"}],
+            "aliases": ["B", "B"],
+        }
+
+    def test_merge_pages(self):
+        """test pages in later responses are merged with earlier ones"""
+        combined = {}
+        merge_pages(combined, copy.deepcopy(RESPONSES[""]))
+        merge_pages(combined, copy.deepcopy(RESPONSES["ggscontinue||"]))
+        assert combined["1"]["coordinates"] == [{"lat": 1}, {"lat": 2}]
+        assert combined["2"]["terms"] == {"label": ["B"]}
+
+
+class TestIterPages(unittest.TestCase):
+    def setUp(self):
+        self.api = WikipediaAPI("test")
+        self.api.session = FakeContinueSession(RESPONSES)
+        self.query = {"action": "query", "generator": "geosearch"}
+
+    def test_get_data_first_batch(self):
+        """test get_data stops at the end of the first batch"""
+        pages = self.api.get_data(self.query)
+        assert sorted(pages) == ["1", "2"]
+        assert pages["1"]["coordinates"] == [{"lat": 1}, {"lat": 2}]
+        assert len(self.api.session.sent) == 2
+
+    def test_iter_pages_batches(self):
+        """test pages are yielded once each batch is complete, across batches"""
+        pages = self.api.iter_pages(self.query)
+        first = next(pages)
+        assert len(self.api.session.sent) == 2
+        assert first == (
+            "1",
+            {"pageid": 1, "title": "A", "coordinates": [{"lat": 1}, {"lat": 2}]},
+        )
+        assert [pageid for pageid, _ in pages] == ["2", "3"]
+        assert len(self.api.session.sent) == 3
+        # only the latest continue parameters are sent
+        assert "cocontinue" not in self.api.session.sent[2]
+
+    def test_prefetch(self):
+        """test the next page is requested before the caller asks for it"""
+        self.api.prefetch = True
+        pages = self.api.iter_pages(self.query)
+        next(pages)
+        deadline = time.monotonic() + 2
+        while len(self.api.session.sent) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(self.api.session.sent) == 3
+        assert [pageid for pageid, _ in pages] == ["2", "3"]
+        assert self.api.get_data(self.query)["1"]["coordinates"] == [
+            {"lat": 1},
+            {"lat": 2},
+        ]
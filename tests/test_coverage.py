@@ -0,0 +1,159 @@
+"""Test planning searches to cover large areas"""
+import math
+import random
+import threading
+import time
+import unittest
+from itertools import islice
+from wikigeo import WikiExtractor
+from wikigeo.coverage import (
+    METRES_PER_DEGREE_LAT,
+    METRES_PER_DEGREE_LON,
+    contains_point,
+    hex_cover,
+    subdivide,
+    to_polygon,
+)
+from wikigeo.wikisource.errors import RequestError
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """approximate distance in metres"""
+    x = (lon2 - lon1) * METRES_PER_DEGREE_LON * math.cos(math.radians(lat1))
+    y = (lat2 - lat1) * METRES_PER_DEGREE_LAT
+    return math.hypot(x, y)
+
+
+class TestCoverage(unittest.TestCase):
+    def test_hex_cover_covers_bbox(self):
+        """test every point in the area is within a circle"""
+        bbox = (51.2, -0.6, 51.7, 0.3)
+        centres = hex_cover(bbox, 10000)
+        rng = random.Random(1)
+        for _ in range(500):
+            lat = rng.uniform(bbox[0], bbox[2])
+            lon = rng.uniform(bbox[1], bbox[3])
+            nearest = min(distance(lat, lon, clat, clon) for clat, clon in centres)
+            assert nearest <= 10000
+
+    def test_hex_cover_near_minimal(self):
+        """test number of circles is close to the area divided by the hexagon area"""
+        bbox = (51.2, -0.6, 51.7, 0.3)
+        width = distance(51.45, -0.6, 51.45, 0.3)
+        height = distance(51.2, 0, 51.7, 0)
+        hexagon = 3 * math.sqrt(3) / 2 * 10000**2
+        assert len(hex_cover(bbox, 10000)) < 2 * width * height / hexagon + 20
+
+    def test_polygon_skips_outside_circles(self):
+        """test circles not touching a triangle are left out"""
+        triangle = [(51.2, -0.6), (51.2, 0.3), (51.7, -0.6)]
+        assert len(hex_cover(triangle)) < len(hex_cover((51.2, -0.6, 51.7, 0.3)))
+        assert contains_point(to_polygon(triangle), 51.3, -0.5)
+        assert not contains_point(to_polygon(triangle), 51.65, 0.25)
+
+    def test_subdivide_covers_circle(self):
+        """test seven half size circles cover the circle"""
+        centres = subdivide(51.4, -0.5, 1000)
+        rng = random.Random(2)
+        for _ in range(500):
+            angle = rng.uniform(0, 2 * math.pi)
+            radius = 1000 * math.sqrt(rng.random())
+            lat = 51.4 + radius * math.cos(angle) / METRES_PER_DEGREE_LAT
+            lon = -0.5 + radius * math.sin(angle) / (
+                METRES_PER_DEGREE_LON * math.cos(math.radians(51.4))
+            )
+            nearest = min(distance(lat, lon, clat, clon) for clat, clon in centres)
+            assert nearest <= 500 * 1.01
+
+
+class FakeAPI:
+    """returns pages from a fixed set within the radius of each search"""
+
+    def __init__(self, pages, delay=0, fail=None):
+        self.pages = pages
+        self.delay = delay
+        self.fail = fail
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def get_data(self, query):
+        with self.lock:
+            self.queries.append(query)
+        time.sleep(self.delay)
+        lat, lon = [float(value) for value in query["ggscoord"].split("|")]
+        if self.fail is not None and distance(lat, lon, *self.fail) < 1:
+            raise RequestError(f"search at {lat}, {lon} failed", status=503)
+        radius = int(query["ggsradius"])
+        limit = int(query["ggslimit"])
+        found = {}
+        for pageid, (plat, plon) in self.pages.items():
+            if distance(lat, lon, plat, plon) <= radius and len(found) < limit:
+                found[str(pageid)] = {
+                    "pageid": pageid,
+                    "title": f"Page {pageid}",
+                    "coordinates": [{"lat": plat, "lon": plon}],
+                }
+        return found
+
+
+class TestPagesInArea(unittest.TestCase):
+    def test_unique_pages_in_area(self):
+        """test each page in the area is returned once, including dense spots"""
+        rng = random.Random(3)
+        pages = {
+            i: (rng.uniform(51.2, 51.7), rng.uniform(-0.6, 0.3)) for i in range(300)
+        }
+        # a dense cluster that needs searches to be split
+        pages.update(
+            {
+                i: (51.45 + rng.uniform(-0.01, 0.01), -0.1 + rng.uniform(-0.01, 0.01))
+                for i in range(300, 400)
+            }
+        )
+        wiki = WikiExtractor("en", "test")
+        wiki.api = FakeAPI(pages)
+        results = list(wiki.get_pages_in_area((51.3, -0.5, 51.6, 0.2), limit=50))
+        expected = {
+            i
+            for i, (lat, lon) in pages.items()
+            if 51.3 <= lat <= 51.6 and -0.5 <= lon <= 0.2
+        }
+        pageids = [page["pageid"] for page in results]
+        assert len(pageids) == len(set(pageids))
+        assert set(pageids) == expected
+        assert any(int(query["ggsradius"]) < 10000 for query in wiki.api.queries)
+
+    def test_close_early(self):
+        """test closing the generator early drops searches not yet sent"""
+        pages = {i: (51.3 + i / 1000, -0.5 + i / 1000) for i in range(200)}
+        wiki = WikiExtractor("en", "test")
+        wiki.api = FakeAPI(pages, delay=0.05)
+        area = (51.2, -0.6, 51.7, 0.3)
+        results = wiki.get_pages_in_area(area, limit=500, maxworkers=2)
+        start = time.perf_counter()
+        assert len(list(islice(results, 1))) == 1
+        results.close()
+        assert time.perf_counter() - start < 1
+        sent = len(wiki.api.queries)
+        time.sleep(0.2)
+        assert len(wiki.api.queries) == sent < len(hex_cover(area))
+
+    def test_failed_searches_skipped(self):
+        """test a failed search is recorded and the other searches still return"""
+        rng = random.Random(4)
+        pages = {
+            i: (rng.uniform(51.3, 51.6), rng.uniform(-0.5, 0.2)) for i in range(200)
+        }
+        area = (51.3, -0.5, 51.6, 0.2)
+        centres = hex_cover(area)
+        failed = centres[len(centres) // 2]
+        # a page only the failed search finds
+        pages[200] = failed
+        wiki = WikiExtractor("en", "test")
+        wiki.api = FakeAPI(pages, fail=failed)
+        errors = []
+        results = list(wiki.get_pages_in_area(area, errors=errors))
+        assert len(errors) == 1 and isinstance(errors[0][3], RequestError)
+        assert errors[0][:2] == failed
+        pageids = {page["pageid"] for page in results}
+        assert 200 not in pageids and len(pageids) > 100
@@ -0,0 +1,67 @@
+"""Test distances between coordinates"""
+import math
+import unittest
+import numpy as np
+from wikigeo.distance import (
+    filter_pages_by_distance,
+    km_distance,
+    km_distance_matrix,
+    rank_by_distance,
+)
+
+
+def acos_distance(lat1, lon1, lat2, lon2):
+    """the spherical law of cosines, as previously used"""
+    lat_a, lng_a, lat_b, lng_b = [math.radians(x) for x in (lat1, lon1, lat2, lon2)]
+    return 6378 * math.acos(
+        math.cos(lat_a) * math.cos(lat_b) * math.cos(lng_b - lng_a)
+        + math.sin(lat_a) * math.sin(lat_b)
+    )
+
+
+class TestDistance(unittest.TestCase):
+    def test_matches_previous_formula(self):
+        """test haversine agrees with the law of cosines at larger distances"""
+        expected = acos_distance(51.4326, -0.5107, 55.9533, -3.1883)
+        assert abs(km_distance(51.4326, -0.5107, 55.9533, -3.1883) - expected) < 1e-6
+
+    def test_same_and_nearby_points(self):
+        """test no error for identical points and precision for close points"""
+        assert km_distance(51.4326, -0.5107, 51.4326, -0.5107) == 0
+        # about 1.1 metres apart
+        assert abs(km_distance(51.0, 0.0, 51.00001, 0.0) - 0.00111316) < 1e-6
+
+    def test_matrix(self):
+        """test matrix has a row per query point and matches scalar distances"""
+        lats = [51.43, 51.45, 55.95]
+        lons = [-0.51, -0.50, -3.19]
+        matrix = km_distance_matrix([51.4326, 55.9533], [-0.5107, -3.1883], lats, lons)
+        assert matrix.shape == (2, 3)
+        for row, (qlat, qlon) in enumerate([(51.4326, -0.5107), (55.9533, -3.1883)]):
+            for col, (lat, lon) in enumerate(zip(lats, lons)):
+                assert np.isclose(matrix[row, col], km_distance(qlat, qlon, lat, lon))
+
+    def test_rank_by_distance(self):
+        """test candidates are filtered and sorted for each query point"""
+        lats = [51.45, 55.95, 51.43]
+        lons = [-0.50, -3.19, -0.51]
+        ranked = rank_by_distance(
+            [51.4326, 55.9533], [-0.5107, -3.1883], lats, lons, maxdistance=30, chunksize=1
+        )
+        assert list(ranked[0][0]) == [2, 0] and list(ranked[1][0]) == [1]
+        assert ranked[0][1][0] < ranked[0][1][1]
+        limited = rank_by_distance(51.4326, -0.5107, lats, lons, limit=1)
+        assert list(limited[0][0]) == [2]
+
+    def test_filter_pages_by_distance(self):
+        """test page results in both formats are filtered and ranked"""
+        pages = [
+            {"title": "Edinburgh", "lat": 55.95, "lon": -3.19},
+            {"title": "Staines Moor", "coordinates": {"lat": 51.45, "lon": -0.50}},
+            {"title": "No coords", "lat": None, "lon": None},
+            {"title": "Staines", "lat": 51.43, "lon": -0.51},
+        ]
+        results = filter_pages_by_distance(pages, 51.4326, -0.5107, maxdistance=30)
+        assert [page["title"] for page in results] == ["Staines", "Staines Moor"]
+        assert isinstance(results[0]["distance"], float)
+        assert "distance" not in pages[3]
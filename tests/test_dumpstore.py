@@ -0,0 +1,188 @@
+import bz2
+import gzip
+import os
+import tempfile
+import unittest
+import unittest.mock
+from wikigeo import WikiExtractor
+from wikigeo.dumpstore import DumpStore, build_dump_store
+from wikigeo.wikisource.dumps import parse_insert, read_stream, wikitext_to_text
+from wikigeo.wikisource.errors import APIError
+
+GEO_TAGS = """-- MySQL dump
+CREATE TABLE `geo_tags` (`gt_id` int);
+INSERT INTO `geo_tags` VALUES (1,10,'earth',1,51.43181000,-0.51066000,1000,'city','Staines',NULL,NULL),(2,10,'earth',0,52.00000000,-1.00000000,NULL,NULL,NULL,NULL,NULL),(3,11,'earth',1,51.42750000,-0.51250000,NULL,NULL,NULL,NULL,NULL);
+INSERT INTO `geo_tags` VALUES (4,12,'moon',1,51.43000000,-0.51000000,NULL,NULL,NULL,NULL,NULL),(5,13,'earth',1,55.95527000,-3.18108000,NULL,NULL,NULL,NULL,NULL),(6,99,'earth',1,51.43,-0.51,NULL,NULL,NULL,NULL,NULL);
+"""
+
+PAGE_PROPS = """INSERT INTO `page_props` VALUES (10,'wikibase-shortdesc','Town in Surrey, England',NULL),(10,'page_image_free','Staines_Bridge.jpg',NULL),(11,'wikibase_item','Q1',NULL),(11,'wikibase-shortdesc','Bridge over the River Thames in \\'Staines\\'',NULL);
+"""
+
+PAGES = [
+    (
+        10,
+        "Staines-upon-Thames",
+        "'''Staines''' is a [[town]] in [[Surrey|Surrey, England]].<ref>A source</ref>\\n{{Infobox|name={{lang|x}}}}\\n== History ==\\nThe town grew around a [[bridge]].",
+    ),
+    (11, "Staines Bridge", "'''Staines Bridge''' crosses the [[River Thames]]."),
+    (13, "Calton Hill", "Calton Hill is a hill in [[Edinburgh]]."),
+]
+
+
+def _page_xml(pageid, title, text):
+    text = text.replace("\\n", "\n")
+    return (
+        f"<page><title>{title}</title><ns>0</ns><id>{pageid}</id>"
+        f"<revision><id>1</id><text>{text}</text></revision></page>"
+    ).encode()
+
+
+def write_fixtures(folder):
+    """writes small dumps in the same formats as dumps.wikimedia.org"""
+    paths = {
+        name: os.path.join(folder, name)
+        for name in (
+            "geo_tags.sql.gz",
+            "page_props.sql",
+            "index.txt.bz2",
+            "articles.xml.bz2",
+        )
+    }
+    with gzip.open(paths["geo_tags.sql.gz"], "wt") as file:
+        file.write(GEO_TAGS)
+    with open(paths["page_props.sql"], "w") as file:
+        file.write(PAGE_PROPS)
+    # a header stream then streams of pages, as in multistream dumps
+    streams = [bz2.compress(b"<mediawiki><siteinfo></siteinfo>")]
+    index = []
+    offset = len(streams[0])
+    for batch in (PAGES[:2], PAGES[2:]):
+        for pageid, title, _ in batch:
+            index.append(f"{offset}:{pageid}:{title}\n")
+        stream = bz2.compress(b"".join(_page_xml(*page) for page in batch))
+        streams.append(stream)
+        offset += len(stream)
+    with open(paths["articles.xml.bz2"], "wb") as file:
+        file.write(b"".join(streams))
+    with bz2.open(paths["index.txt.bz2"], "wt") as file:
+        file.writelines(index + ["5:12:Moon crater\n"])
+    return paths
+
+
+class TestDumpParsing(unittest.TestCase):
+    def test_parse_insert(self):
+        """test values are converted and strings unescaped"""
+        rows = parse_insert(
+            "INSERT INTO `t` VALUES (1,'it\\'s, (here)',NULL,-0.5),(2,'a\\\\b',3,1e3);\n"
+        )
+        assert rows == [(1, "it's, (here)", None, -0.5), (2, "a\\b", 3, 1000.0)]
+
+    def test_wikitext_to_text(self):
+        """test markup, templates and references are removed"""
+        text = wikitext_to_text(PAGES[0][2].replace("\\n", "\n"))
+        assert text == (
+            "Staines is a town in Surrey, England. History The town grew around a bridge."
+        )
+        assert wikitext_to_text("[[File:A.jpg|thumb|A [[b]]]] ''c''", 3) == "c"
+
+
+class TestDumpStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.paths = write_fixtures(self.folder.name)
+        self.store = build_dump_store(
+            os.path.join(self.folder.name, "pages.sqlite"),
+            self.paths["geo_tags.sql.gz"],
+            self.paths["index.txt.bz2"],
+            self.paths["page_props.sql"],
+            self.paths["articles.xml.bz2"],
+            processes=1,
+            chunksize=2,
+        )
+        self.wiki = WikiExtractor("en", "test", dumpstore=self.store)
+
+    def test_built(self):
+        """test only primary earth coordinates of indexed pages are kept"""
+        assert len(self.store) == 3
+        stream = read_stream(self.store.articles, int(open_index(self.paths)[0]))
+        assert sorted(stream) == [10, 11]
+
+    def test_parallel_build(self):
+        """test building across processes gives the same store"""
+        store = build_dump_store(
+            os.path.join(self.folder.name, "parallel.sqlite"),
+            self.paths["geo_tags.sql.gz"],
+            self.paths["index.txt.bz2"],
+            self.paths["page_props.sql"],
+            processes=2,
+            chunksize=1,
+        )
+        assert store.nearby(51.43, -0.51, 10, 10000) == self.store.nearby(
+            51.43, -0.51, 10, 10000
+        )
+
+    def test_nearby_pages(self):
+        """test nearby pages are found in the store, closest first"""
+        pages = self.wiki.get_nearby_pages(51.43181, -0.51066, limit=4)
+        assert [page["title"] for page in pages] == [
+            "Staines-upon-Thames",
+            "Staines Bridge",
+        ]
+        assert pages[0]["description"] == ["Town in Surrey, England"]
+        assert pages[0]["image"] == (
+            "https://upload.wikimedia.org/wikipedia/commons/5/5d/Staines_Bridge.jpg"
+        )
+        assert pages[1]["description"] == ["Bridge over the River Thames in 'Staines'"]
+        assert self.wiki.get_nearby_pages(51.43181, -0.51066, radiusmeters=100) == [
+            pages[0]
+        ]
+
+    def test_page_match(self):
+        """test page matches are searched for in the store"""
+        matches = self.wiki.get_page_match(
+            "Staines Bridge", 51.43, -0.51, bestmatch="name"
+        )
+        assert matches["page_matches"]["title"] == "Staines Bridge"
+        assert matches["page_matches"]["name match"] == 100
+        town = self.wiki.get_page_match(
+            "Staines-upon-Thames", 51.43, -0.51, bestmatch="name"
+        )
+        assert town["page_matches"]["image"] == (
+            "https://upload.wikimedia.org/wikipedia/commons/5/5d/Staines_Bridge.jpg"
+        )
+
+    def test_page_text(self):
+        """test page text is read from the articles dump"""
+        assert self.wiki.get_page_text("Calton Hill") == {
+            "title": "Calton Hill",
+            "text": "Calton Hill is a hill in Edinburgh.",
+        }
+        assert self.wiki.get_page_text("Staines-upon-Thames", 7)["text"] == "Staines"
+        self.assertRaises(APIError, self.wiki.get_page_text, "Nowhere")
+
+    def test_page_texts(self):
+        """test many page texts are read from the articles dump without requests"""
+        with unittest.mock.patch("wikigeo.wikisearch.scrape_page_text") as scrape:
+            texts = self.wiki.get_page_texts(["Calton Hill", "Nowhere", "Calton Hill"])
+        scrape.assert_not_called()
+        assert texts == [
+            {"title": "Calton Hill", "text": "Calton Hill is a hill in Edinburgh."},
+            {"title": "Nowhere", "text": None},
+            {"title": "Calton Hill", "text": "Calton Hill is a hill in Edinburgh."},
+        ]
+
+
+def open_index(paths):
+    with bz2.open(paths["index.txt.bz2"], "rt") as file:
+        return [line.split(":")[0] for line in file]
+
+
+class TestDumpStoreReopen(unittest.TestCase):
+    def test_reopened(self):
+        """test a built store can be opened again"""
+        with tempfile.TemporaryDirectory() as folder:
+            paths = write_fixtures(folder)
+            path = os.path.join(folder, "pages.sqlite")
+            build_dump_store(path, paths["geo_tags.sql.gz"], paths["index.txt.bz2"])
+            assert len(DumpStore(path)) == 3
@@ -0,0 +1,168 @@
+"""Test the local store of fetched pages"""
+import os
+import random
+import tempfile
+import unittest
+from wikigeo import WikiExtractor
+from wikigeo.distance import km_distance
+from wikigeo.geostore import GeoStore
+
+
+def make_pages(n, seed=1):
+    rng = random.Random(seed)
+    return [
+        {
+            "title": f"Page {i}",
+            "description": None,
+            "coordinates": {
+                "lat": rng.uniform(51.3, 51.6),
+                "lon": rng.uniform(-0.6, 0.2),
+            },
+            "label": None,
+            "image": None,
+        }
+        for i in range(n)
+    ]
+
+
+class FakeAPI:
+    """answers geosearches from a fixed set of pages, closest first"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = 0
+
+    def get_data(self, query):
+        self.requests += 1
+        lat, lon = [float(value) for value in query["ggscoord"].split("|")]
+        radius = int(query["ggsradius"])
+        found = sorted(
+            (km_distance(lat, lon, p["coordinates"]["lat"], p["coordinates"]["lon"]), p)
+            for p in self.pages
+            if km_distance(lat, lon, p["coordinates"]["lat"], p["coordinates"]["lon"])
+            * 1000
+            <= radius
+        )[: int(query["ggslimit"])]
+        return {
+            page["title"]: {
+                "title": page["title"],
+                "coordinates": [page["coordinates"]],
+            }
+            for _, page in found
+        }
+
+
+class TestGeoStore(unittest.TestCase):
+    def setUp(self):
+        self.pages = make_pages(2000)
+        self.store = GeoStore()
+        self.store.add_pages(self.pages)
+
+    def brute_force(self, lat, lon):
+        return sorted(
+            (
+                km_distance(lat, lon, p["coordinates"]["lat"], p["coordinates"]["lon"])
+                * 1000,
+                p["title"],
+            )
+            for p in self.pages
+        )
+
+    def test_within(self):
+        """test radius query matches a brute force search"""
+        expected = [
+            title for distance, title in self.brute_force(51.45, -0.2) if distance <= 3000
+        ]
+        found = self.store.within(51.45, -0.2, 3000)
+        assert [page["title"] for page, _ in found] == expected
+        assert all(distance <= 3000 for _, distance in found)
+
+    def test_nearest(self):
+        """test k nearest query matches a brute force search"""
+        expected = self.brute_force(51.5, -0.1)[:7]
+        found = self.store.nearest(51.5, -0.1, 7)
+        assert [page["title"] for page, _ in found] == [title for _, title in expected]
+        assert abs(found[0][1] - expected[0][0]) < 0.01
+
+    def test_covered(self):
+        """test circles inside searched circles are covered"""
+        self.store.add_covered(51.5, -0.1, 5000)
+        assert self.store.is_covered(51.5, -0.1, 5000)
+        assert self.store.is_covered(51.51, -0.1, 2000)
+        assert not self.store.is_covered(51.51, -0.1, 5000)
+
+    def test_added_pages_found_without_rebuild(self):
+        """test pages added after the tree is built are found before it is rebuilt"""
+        self.store.nearest(51.5, -0.1, 1)
+        tree = self.store._tree
+        extra = make_pages(2100, seed=2)[2000:]
+        for page in extra:
+            page["title"] = "Extra " + page["title"]
+            self.store.add_pages([page])
+            assert self.store.nearest(
+                page["coordinates"]["lat"], page["coordinates"]["lon"], 1
+            )[0][0] is page
+        assert self.store._tree is tree
+        self.pages += extra
+        lat, lon = 51.45, -0.2
+        expected = [t for d, t in self.brute_force(lat, lon) if d <= 3000]
+        assert [p["title"] for p, _ in self.store.within(lat, lon, 3000)] == expected
+        expected = [t for _, t in self.brute_force(lat, lon)[:9]]
+        assert [p["title"] for p, _ in self.store.nearest(lat, lon, 9)] == expected
+
+    def test_moved_page(self):
+        """test a page added again with new coordinates is found at the new place"""
+        self.store.nearest(51.5, -0.1, 1)
+        moved = dict(self.pages[0], coordinates={"lat": 10.0, "lon": 10.0})
+        self.store.add_pages([moved])
+        assert self.store.nearest(10.0, 10.0, 1)[0][0] is moved
+        assert len(self.store.within(10.0, 10.0, 1000)) == 1
+
+    def test_covered_grid(self):
+        """test covering circles are found across cells, the antimeridian and poles"""
+        rng = random.Random(5)
+        circles = [
+            (rng.uniform(-89, 89), rng.uniform(-180, 180), rng.uniform(100, 10000))
+            for _ in range(300)
+        ]
+        circles += [(51.5, 179.99, 5000), (89.99, 0.0, 5000)]
+        for circle in circles:
+            self.store.add_covered(*circle)
+        for lat, lon, radius in circles:
+            assert self.store.is_covered(lat, lon, radius)
+            assert not self.store.is_covered(lat, lon, radius * 1.5)
+        assert self.store.is_covered(51.5, -179.99, 1000)
+        assert self.store.is_covered(89.99, 120.0, 1000)
+
+    def test_save_and_load(self):
+        """test pages and covered circles persist"""
+        self.store.add_covered(51.5, -0.1, 5000)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "pages.json")
+            self.store.save(path)
+            loaded = GeoStore(path)
+        assert len(loaded) == 2000 and loaded.is_covered(51.5, -0.1, 100)
+        assert loaded.nearest(51.5, -0.1, 3) == self.store.nearest(51.5, -0.1, 3)
+
+
+class TestLocalNearbyPages(unittest.TestCase):
+    def setUp(self):
+        self.wiki = WikiExtractor("en", "test", geostore=GeoStore())
+        self.wiki.api = FakeAPI(make_pages(2000, seed=2))
+
+    def test_repeat_search_is_local(self):
+        """test a repeated or smaller search doesn't send a request"""
+        first = self.wiki.get_nearby_pages(51.45, -0.2, limit=10, radiusmeters=5000)
+        second = self.wiki.get_nearby_pages(51.45, -0.2, limit=10, radiusmeters=5000)
+        third = self.wiki.get_nearby_pages(51.45, -0.2, limit=3, radiusmeters=5000)
+        assert self.wiki.api.requests == 1
+        assert {page["title"] for page in first} == {page["title"] for page in second}
+        assert [page["title"] for page in third] == [
+            page["title"] for page in second[:3]
+        ]
+
+    def test_uncovered_search_sends_request(self):
+        """test a search outside searched areas goes to the API"""
+        self.wiki.get_nearby_pages(51.45, -0.2, limit=10, radiusmeters=5000)
+        self.wiki.get_nearby_pages(51.35, 0.1, limit=10, radiusmeters=5000)
+        assert self.wiki.api.requests == 2
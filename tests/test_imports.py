@@ -0,0 +1,65 @@
+"""Test importing the package is cheap and has no logging side effects"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import wikigeo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(wikigeo.__file__)))
+
+CHECK = """import json, logging, sys
+import wikigeo
+print(json.dumps({
+    "modules": [m for m in ("numpy", "requests", "lxml", "fuzzywuzzy") if m in sys.modules],
+    "handlers": len(logging.getLogger().handlers),
+    "level": logging.getLogger().level,
+}))"""
+
+
+class TestImports(unittest.TestCase):
+    def test_import_is_lazy(self):
+        """test importing the package doesn't import heavy dependencies,
+        configure logging or write a log file"""
+        with tempfile.TemporaryDirectory() as folder:
+            process = subprocess.run(
+                [sys.executable, "-c", CHECK],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=folder,
+                env=dict(os.environ, PYTHONPATH=ROOT),
+            )
+            assert os.listdir(folder) == []
+        result = json.loads(process.stdout)
+        assert result == {"modules": [], "handlers": 0, "level": 30}
+
+    def test_optional_backends_not_imported(self):
+        """test rapidfuzz and opentelemetry are only imported when asked for"""
+        check = (
+            "import sys, wikigeo\n"
+            "wikigeo.WikiExtractor, wikigeo.ConcurrentSearcher\n"
+            "print(sorted({'rapidfuzz', 'opentelemetry'} & set(sys.modules)))"
+        )
+        process = subprocess.run(
+            [sys.executable, "-c", check],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=dict(os.environ, PYTHONPATH=ROOT),
+        )
+        assert process.stdout.strip() == "[]"
+
+    def test_exports(self):
+        """test exported names are imported when first used"""
+        from wikigeo.wikisearch import WikiExtractor
+
+        assert wikigeo.WikiExtractor is WikiExtractor
+        assert "ConcurrentSearcher" in dir(wikigeo)
+        with self.assertRaises(AttributeError):
+            wikigeo.NotAClass
+
+
+if __name__ == "__main__":
+    unittest.main()
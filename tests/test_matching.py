@@ -0,0 +1,79 @@
+"""Test fuzzy matching of names against titles"""
+import unittest
+from fuzzywuzzy import fuzz
+from wikigeo.matching import NameMatcher
+
+try:
+    import rapidfuzz
+except ImportError:
+    rapidfuzz = None
+
+TITLES = [
+    "File:Calton Hill from the Castle.jpg",
+    "File:Edinburgh Castle.jpg",
+    "Calton Hill",
+    "CALTON HILL",
+    "Staines Moor",
+]
+
+
+class TestNameMatcher(unittest.TestCase):
+    def test_fuzzywuzzy_backend_matches_fuzz(self):
+        """test scores match calling fuzzywuzzy on lowercased strings"""
+        matcher = NameMatcher(backend="fuzzywuzzy")
+        assert matcher.ratios("Calton Hill", TITLES) == [
+            fuzz.ratio("calton hill", title.lower()) for title in TITLES
+        ]
+        assert matcher.partial_ratios("Calton Hill", TITLES) == [
+            fuzz.partial_ratio("calton hill", title.lower()) for title in TITLES
+        ]
+
+    @unittest.skipIf(rapidfuzz is None, "rapidfuzz not installed")
+    def test_rapidfuzz_backend_same_scale(self):
+        """test rapidfuzz scores are whole numbers on the same scale"""
+        matcher = NameMatcher(backend="rapidfuzz")
+        scores = matcher.ratios("Calton Hill", TITLES)
+        assert all(isinstance(score, int) for score in scores)
+        assert scores[2] == scores[3] == 100
+        assert scores[0] > scores[1] and scores[0] > scores[4]
+        assert matcher.partial_ratios("Calton Hill", TITLES)[:4] == [100, 38, 100, 100]
+
+    def test_default_backend(self):
+        """test scores don't change when rapidfuzz happens to be installed"""
+        assert NameMatcher().backend == "fuzzywuzzy"
+
+    @unittest.skipIf(rapidfuzz is None, "rapidfuzz not installed")
+    def test_rapidfuzz_backend_close_to_fuzzywuzzy(self):
+        """test rapidfuzz agrees with fuzzywuzzy on exact matches and is otherwise
+        within 15 points, which is why it isn't the default"""
+        rapid = NameMatcher(backend="rapidfuzz")
+        fuzzy = NameMatcher(backend="fuzzywuzzy")
+        titles = TITLES + ["Staines Bridge", "Staines-upon-Thames"]
+        for name in ("Calton Hill", "Staines Moor", "Edinburgh"):
+            for method in ("ratios", "partial_ratios"):
+                for rapid_score, fuzzy_score in zip(
+                    getattr(rapid, method)(name, titles),
+                    getattr(fuzzy, method)(name, titles),
+                ):
+                    assert (rapid_score == 100) == (fuzzy_score == 100)
+                    assert abs(rapid_score - fuzzy_score) <= 15
+        assert rapid.partial_ratios("Staines Bridge", ["Staines Moor"]) == [82]
+        assert fuzzy.partial_ratios("Staines Bridge", ["Staines Moor"]) == [75]
+
+    def test_scores_remembered(self):
+        """test repeated pairs are not scored again"""
+        matcher = NameMatcher(backend="fuzzywuzzy", cachesize=3)
+        calls = []
+        batch = matcher._batch
+        matcher._batch = lambda *args: calls.append(args[2]) or batch(*args)
+        matcher.ratios("Calton Hill", ["Calton Hill", "calton hill", "Staines"])
+        matcher.ratios("calton hill", ["Calton Hill", "Staines"])
+        assert calls == [["calton hill", "staines"]]
+        assert len(matcher._scores) == 2
+        matcher.ratios("Staines", ["a", "b", "c"])
+        assert len(matcher._scores) == 3
+
+    def test_invalid_backend(self):
+        """test unknown backend raises"""
+        with self.assertRaises(ValueError):
+            NameMatcher(backend="difflib")
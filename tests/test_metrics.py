@@ -0,0 +1,156 @@
+"""Test reporting measurements from the request and matching hot paths"""
+import unittest
+from wikigeo.wikisearch import WikiExtractor
+from wikigeo.wikisource.cache import ResponseCache
+from wikigeo.wikisource.metrics import (
+    DEFAULT_METRICS,
+    Metrics,
+    OpenTelemetryMetrics,
+    PrometheusMetrics,
+)
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.sessions import SessionPool
+from wikigeo.wikisource.wikiapi import WikipediaAPI
+from tests.fakes import FakeResponse, FakeSession
+
+PAGE = {"pageid": 1, "title": "Staines Bridge", "coordinates": [{"lat": 1, "lon": 1}]}
+CONTINUED = {
+    "continue": {"cocontinue": "1", "continue": "||"},
+    "query": {"pages": {"1": PAGE}},
+}
+COMPLETE = {"batchcomplete": "", "query": {"pages": {"1": PAGE}}}
+
+
+def fake_api(responses, metrics, cache=None):
+    api = WikipediaAPI(
+        "test",
+        cache=cache,
+        ratelimiter=RateLimiter(rate=None, maxconcurrent=None),
+        sessionpool=SessionPool(),
+        metrics=metrics,
+    )
+    api.session = FakeSession(responses)
+    return api
+
+
+class FakeInstrument:
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.values = []
+
+    def record(self, value, attributes=None):
+        self.values.append((value, attributes))
+
+    add = record
+
+
+class FakeMeter:
+    def __init__(self):
+        self.instruments = {}
+
+    def create_histogram(self, name, unit=""):
+        return self.instruments.setdefault(name, FakeInstrument(name, unit))
+
+    create_counter = create_histogram
+
+
+class TestMetrics(unittest.TestCase):
+    def test_default_does_nothing(self):
+        """test the default metrics record nothing and time without overhead"""
+        assert not DEFAULT_METRICS.enabled
+        with DEFAULT_METRICS.timer("call_seconds", method="test"):
+            pass
+        api = fake_api([FakeResponse(COMPLETE)], Metrics())
+        assert api.get_data({"action": "query"}) == {"1": PAGE}
+
+    def test_request_metrics(self):
+        """test request time, size, decoding, continuations and retries are reported"""
+        metrics = PrometheusMetrics()
+        api = fake_api(
+            [
+                FakeResponse(CONTINUED),
+                FakeResponse(status_code=503, headers={"Retry-After": "0"}),
+                FakeResponse(COMPLETE),
+            ],
+            metrics,
+        )
+        api.get_data({"action": "query"})
+        totals = metrics.totals()
+        assert totals["continuations"] == 1
+        assert totals["retries"] == 1
+        expected = len(FakeResponse(CONTINUED).content + FakeResponse(COMPLETE).content)
+        assert totals["response_bytes"] == expected
+        text = metrics.render()
+        # one observation for each attempt, including the retried one
+        assert 'wikigeo_request_seconds_count{host="en.wikipedia.org"} 3' in text
+        assert 'wikigeo_decode_seconds_count{host="en.wikipedia.org"} 2' in text
+        assert 'wikigeo_retries_total{host="en.wikipedia.org"} 1' in text
+
+    def test_request_seconds_exclude_backoff(self):
+        """test request time doesn't include waiting between attempts"""
+        metrics = PrometheusMetrics()
+        throttled = FakeResponse(status_code=503, headers={"Retry-After": "0"})
+        throttled.headers = {"Retry-After": "0.1"}
+        api = fake_api([throttled, FakeResponse(COMPLETE)], metrics)
+        api.get_data({"action": "query"})
+        totals = metrics.totals()
+        assert totals["request_seconds"] < 0.1
+        assert totals["ratelimit_wait_seconds"] >= 0.1
+
+    def test_cache_metrics(self):
+        """test cache hits and misses are counted"""
+        metrics = PrometheusMetrics()
+        api = fake_api([FakeResponse(COMPLETE)], metrics, cache=ResponseCache())
+        api.get_data({"action": "query"})
+        api.get_data({"action": "query"})
+        totals = metrics.totals()
+        assert totals["cache_hits"] == 1
+        assert totals["cache_misses"] == 1
+
+    def test_match_and_call_metrics(self):
+        """test name matching and WikiExtractor calls are timed"""
+        metrics = PrometheusMetrics()
+        wiki = WikiExtractor(
+            "en",
+            "test",
+            ratelimiter=RateLimiter(rate=None, maxconcurrent=None),
+            metrics=metrics,
+        )
+        wiki.api.session = FakeSession([FakeResponse(COMPLETE)])
+        wiki.get_page_match("Staines", 1, 1)
+        text = metrics.render()
+        assert 'wikigeo_match_seconds_count{scorer="ratio"} 1' in text
+        assert (
+            'wikigeo_call_seconds_count{method="WikiExtractor.get_page_match"} 1'
+            in text
+        )
+
+    def test_histogram_buckets(self):
+        """test histogram buckets are cumulative"""
+        metrics = PrometheusMetrics()
+        metrics.observe("request_seconds", 0.003, host="a")
+        metrics.observe("request_seconds", 0.2, host="a")
+        text = metrics.render()
+        assert 'wikigeo_request_seconds_bucket{host="a",le="0.001"} 0' in text
+        assert 'wikigeo_request_seconds_bucket{host="a",le="0.005"} 1' in text
+        assert 'wikigeo_request_seconds_bucket{host="a",le="0.25"} 2' in text
+        assert 'wikigeo_request_seconds_bucket{host="a",le="+Inf"} 2' in text
+        metrics.clear()
+        assert metrics.render() == "\n"
+
+    def test_opentelemetry(self):
+        """test measurements are recorded with instruments from the meter"""
+        meter = FakeMeter()
+        metrics = OpenTelemetryMetrics(meter)
+        metrics.observe("response_bytes", 100, host="a")
+        metrics.observe("response_bytes", 50, host="a")
+        metrics.increment("retries", host="a")
+        histogram = meter.instruments["wikigeo.response_bytes"]
+        assert histogram.unit == "By"
+        assert histogram.values == [(100, {"host": "a"}), (50, {"host": "a"})]
+        assert meter.instruments["wikigeo.retries"].values == [(1, {"host": "a"})]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+from tests.test_dumpstore import write_fixtures
+from wikigeo.dumpstore import build_dump_store
+from wikigeo.pipeline import enrich, main, read_rows
+from wikigeo.wikisource.errors import RequestError
+
+ROWS = [
+    ("Staines Bridge", 51.43, -0.51),
+    ("Calton Hill", 55.955, -3.181),
+    ("Nowhere", 0.0, 0.0),
+    ("Staines-upon-Thames", 51.43, -0.51),
+    ("Calton", 55.95, -3.18),
+]
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        paths = write_fixtures(self.folder)
+        self.dumpstore = os.path.join(self.folder, "pages.sqlite")
+        build_dump_store(
+            self.dumpstore,
+            paths["geo_tags.sql.gz"],
+            paths["index.txt.bz2"],
+            processes=1,
+        )
+        self.input = os.path.join(self.folder, "places.csv")
+        with open(self.input, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["id", "name", "lat", "lon"])
+            for i, row in enumerate(ROWS):
+                writer.writerow([i, *row])
+        self.output = os.path.join(self.folder, "out.jsonl")
+
+    def run_job(self, **options):
+        options = dict(
+            dict(tasks=("match",), processes=1, chunksize=2, dumpstore=self.dumpstore),
+            **options
+        )
+        return enrich(self.input, self.output, "en", "test", **options)
+
+    def read_output(self):
+        with open(self.output) as file:
+            return [json.loads(line) for line in file]
+
+    def test_read_rows(self):
+        """test rows are read in chunks, skipping rows already done"""
+        chunks = list(read_rows(self.input, 2, skip=1))
+        assert [len(chunk) for chunk in chunks] == [1, 2, 1]
+        assert chunks[0][0] == (1, "Calton Hill", 55.955, -3.181)
+
+    def test_enrich_in_order(self):
+        """test every row is written in input order with its best match"""
+        assert self.run_job() == 5
+        records = self.read_output()
+        assert [record["row"] for record in records] == [0, 1, 2, 3, 4]
+        assert records[0]["match"]["title"] == "Staines Bridge"
+        assert records[2]["match"] == []
+        assert records[4]["match"]["title"] == "Calton Hill"
+
+    def test_processes(self):
+        """test rows shared across processes give the same output"""
+        self.run_job()
+        expected = self.read_output()
+        os.remove(self.output)
+        os.remove(self.output + ".checkpoint")
+        self.run_job(processes=2, chunksize=1)
+        assert self.read_output() == expected
+
+    def test_resume(self):
+        """test a job resumes after the last checkpoint, dropping partly written output"""
+        self.run_job()
+        expected = self.read_output()
+        with open(self.output, "rb") as file:
+            first_chunk = b"".join(file.readlines()[:2])
+        with open(self.output, "wb") as file:
+            file.write(first_chunk + b'{"row": 2, "na')
+        with open(self.output + ".checkpoint", "w") as file:
+            json.dump({"rows": 2, "parts": 1, "size": len(first_chunk)}, file)
+        assert self.run_job() == 3
+        assert self.read_output() == expected
+
+    def test_row_errors(self):
+        """test a failing row is recorded without stopping the job"""
+
+        def images(self, lat, lon, *args):
+            if lat == 0.0:
+                raise RequestError("error response", 503)
+            return {0: {"image": "a.jpg"}}
+
+        with unittest.mock.patch(
+            "wikigeo.wikisearch.WikiExtractor.get_nearby_images", images
+        ):
+            self.run_job(tasks=("images",))
+        records = self.read_output()
+        assert records[2]["error"] == "error response"
+        assert records[3]["images"] == [{"image": "a.jpg"}]
+
+    def test_locked_cache_recorded(self):
+        """test a cache locked by another worker fails the row, not the job"""
+
+        def images(self, lat, lon, *args):
+            raise sqlite3.OperationalError("database is locked")
+
+        with unittest.mock.patch(
+            "wikigeo.wikisearch.WikiExtractor.get_nearby_images", images
+        ):
+            self.run_job(tasks=("images",))
+        assert all(
+            record["error"] == "database is locked" for record in self.read_output()
+        )
+
+    def test_unexpected_errors_raised(self):
+        """test errors that aren't failed requests stop the job"""
+
+        def images(self, lat, lon, *args):
+            raise KeyError("coordinates")
+
+        with unittest.mock.patch(
+            "wikigeo.wikisearch.WikiExtractor.get_nearby_images", images
+        ):
+            self.assertRaises(KeyError, self.run_job, tasks=("images",))
+
+    def test_main(self):
+        """test the command line runs a job"""
+        main(
+            [
+                self.input,
+                self.output,
+                "--user",
+                "test",
+                "--tasks",
+                "match",
+                "--processes",
+                "1",
+                "--dumpstore",
+                self.dumpstore,
+            ]
+        )
+        assert len(self.read_output()) == 5
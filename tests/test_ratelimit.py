@@ -0,0 +1,228 @@
+"""Test limiting the rate of requests"""
+import threading
+import time
+import unittest
+import requests
+from wikigeo.wikisource.errors import (
+    APIError,
+    CircuitOpenError,
+    RequestError,
+    ThrottledError,
+)
+from wikigeo.wikisource.ratelimit import (
+    HostLimiter,
+    RateLimiter,
+    backoff_delay,
+    retry_after,
+)
+from wikigeo.wikisource.wikiapi import WikipediaAPI
+from tests.fakes import FakeResponse, FakeSession
+
+DONE = {"batchcomplete": "", "query": {"pages": {}}}
+
+
+class TestHostLimiter(unittest.TestCase):
+    def test_burst_then_rate(self):
+        """test requests past the burst are spaced at the rate"""
+        limiter = HostLimiter(rate=100, burst=2)
+        waits = [limiter.reserve() for _ in range(4)]
+        assert waits[0] == 0 and waits[1] == 0
+        assert 0.005 < waits[2] < waits[3] <= 0.02
+
+    def test_no_rate(self):
+        """test no waiting when rate is None"""
+        limiter = HostLimiter(rate=None)
+        assert all(limiter.reserve() == 0 for _ in range(100))
+
+    def test_pause(self):
+        """test pause holds back requests"""
+        limiter = HostLimiter(rate=None)
+        limiter.pause(0.5)
+        assert 0.4 < limiter.reserve() <= 0.5
+
+    def test_max_concurrent(self):
+        """test no more than maxconcurrent requests in flight"""
+        limiter = HostLimiter(rate=None, maxconcurrent=2)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def request():
+            with limiter.slot():
+                with lock:
+                    in_flight.append(1)
+                    peak.append(len(in_flight))
+                time.sleep(0.01)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_failures(self):
+        """test requests fail fast once enough have failed in a row"""
+        limiter = HostLimiter(rate=None, failures=2, cooldown=10, name="a")
+        limiter.failed()
+        limiter.check()
+        limiter.failed()
+        with self.assertRaises(CircuitOpenError) as raised:
+            with limiter.slot():
+                pass
+        assert raised.exception.host == "a" and 9 < raised.exception.retry_in <= 10
+
+    def test_success_resets(self):
+        """test only failures in a row open the breaker"""
+        limiter = HostLimiter(rate=None, failures=2)
+        limiter.failed()
+        limiter.succeeded()
+        limiter.failed()
+        limiter.check()
+
+    def test_half_open(self):
+        """test one request is let through after the cooldown,
+        closing the breaker if it succeeds"""
+        limiter = HostLimiter(rate=None, failures=1, cooldown=0.05)
+        limiter.failed()
+        self.assertRaises(CircuitOpenError, limiter.check)
+        time.sleep(0.06)
+        limiter.check()
+        # others are held back while the trial request is in flight
+        self.assertRaises(CircuitOpenError, limiter.check)
+        limiter.succeeded()
+        limiter.check()
+        limiter.check()
+
+    def test_reset(self):
+        """test reset closes the breakers of every host"""
+        limiter = RateLimiter(rate=None, failures=1, cooldown=60)
+        limiter.host("https://en.wikipedia.org").failed()
+        self.assertRaises(CircuitOpenError, limiter.host("en.wikipedia.org").check)
+        limiter.reset()
+        limiter.host("en.wikipedia.org").check()
+
+    def test_never_opens(self):
+        """test failures None always sends requests"""
+        limiter = HostLimiter(rate=None, failures=None)
+        for _ in range(100):
+            limiter.failed()
+        limiter.check()
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_hosts_limited_separately(self):
+        """test each wiki gets its own limiter"""
+        limiter = RateLimiter(hosts={"commons.wikimedia.org": {"rate": 1}})
+        english = limiter.host("https://en.wikipedia.org/w/api.php")
+        assert english is limiter.host("https://en.wikipedia.org/wiki/Staines")
+        assert english is not limiter.host("https://de.wikipedia.org/w/api.php")
+        assert limiter.host("https://commons.wikimedia.org/w/api.php").rate == 1
+
+    def test_retry_after(self):
+        """test Retry-After header parsed"""
+        assert retry_after({"Retry-After": "3"}) == 3
+        assert retry_after({}, default=5) == 5
+        assert retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 5
+        assert retry_after({}, default=None) is None
+
+    def test_backoff_delay(self):
+        """test backoff doubles up to the cap with jitter in the upper half"""
+        for attempt, (low, high) in enumerate([(0.25, 0.5), (0.5, 1), (1, 2)]):
+            delays = [backoff_delay(attempt) for _ in range(50)]
+            assert all(low <= delay <= high for delay in delays)
+            assert len(set(delays)) > 1
+        assert 15 <= backoff_delay(20) <= 30
+
+
+class TestThrottledAPI(unittest.TestCase):
+    def test_retries_after_maxlag(self):
+        """test throttled requests are retried after Retry-After"""
+        throttled = FakeResponse(
+            {"error": {"code": "maxlag"}},
+            headers={"MediaWiki-API-Error": "maxlag", "Retry-After": "0.1"},
+        )
+        too_many = FakeResponse(status_code=429, headers={"Retry-After": "0.1"})
+        done = FakeResponse({"batchcomplete": "", "query": {"pages": {}}})
+        api = WikipediaAPI("test", ratelimiter=RateLimiter(rate=None))
+        api.session = FakeSession([throttled, too_many, done])
+        start = time.time()
+        assert api.get_data({"action": "query"}) == {}
+        assert time.time() - start >= 0.2
+        assert api.session.params[0]["maxlag"] == 5
+
+    def test_gives_up_after_retries(self):
+        """test error raised once retries run out"""
+        too_many = [
+            FakeResponse(status_code=429, headers={"Retry-After": "0"})
+            for _ in range(2)
+        ]
+        api = WikipediaAPI("test", ratelimiter=RateLimiter(rate=None), retries=1)
+        api.session = FakeSession(too_many)
+        with self.assertRaises(ThrottledError) as raised:
+            api.get_data({"action": "query"})
+        assert raised.exception.status == 429
+
+    def test_retries_server_errors(self):
+        """test 5xx responses and connection errors are retried with backoff"""
+        api = WikipediaAPI(
+            "test", ratelimiter=RateLimiter(rate=None), retries=2, backoff=0.01
+        )
+        api.session = FakeSession(
+            [
+                FakeResponse(status_code=502),
+                requests.ConnectionError("refused"),
+                FakeResponse(DONE),
+            ]
+        )
+        assert api.get_data({"action": "query"}) == {}
+
+    def test_connection_error(self):
+        """test RequestError raised once connection retries run out"""
+        api = WikipediaAPI(
+            "test", ratelimiter=RateLimiter(rate=None), retries=1, backoff=0
+        )
+        api.session = FakeSession([requests.ConnectionError("refused")] * 2)
+        with self.assertRaises(RequestError) as raised:
+            api.get_data({"action": "query"})
+        assert raised.exception.status is None
+
+    def test_client_errors_not_retried(self):
+        """test 4xx responses and API errors raise without retrying"""
+        api = WikipediaAPI("test", ratelimiter=RateLimiter(rate=None))
+        api.session = FakeSession([FakeResponse(status_code=404)])
+        with self.assertRaises(RequestError) as raised:
+            api.get_data({"action": "query"})
+        assert raised.exception.status == 404
+        assert not isinstance(raised.exception, ThrottledError)
+        error = {"error": {"code": "badvalue", "info": "bad value"}}
+        api.session = FakeSession([FakeResponse(error)])
+        with self.assertRaises(APIError) as raised:
+            api.get_data({"action": "query"})
+        assert raised.exception.code == "badvalue"
+
+    def test_circuit_breaker(self):
+        """test requests to a failing wiki fail fast without being sent"""
+        limiter = RateLimiter(rate=None, failures=2, cooldown=60)
+        api = WikipediaAPI("test", ratelimiter=limiter, retries=0)
+        api.session = FakeSession(
+            [FakeResponse(status_code=503), FakeResponse(status_code=503)]
+        )
+        for _ in range(2):
+            self.assertRaises(ThrottledError, api.get_data, {"action": "query"})
+        self.assertRaises(CircuitOpenError, api.get_data, {"action": "query"})
+        assert len(api.session.params) == 2
+
+    def test_half_open_request_retried(self):
+        """test the request let through to test a wiki backs off and retries"""
+        limiter = RateLimiter(rate=None, failures=1, cooldown=0.05)
+        api = WikipediaAPI("test", ratelimiter=limiter, retries=2, backoff=0.01)
+        limiter.host(api.url).failed()
+        time.sleep(0.06)
+        api.session = FakeSession([FakeResponse(status_code=503), FakeResponse(DONE)])
+        assert api.get_data({"action": "query"}) == {}
+        limiter.host(api.url).check()
@@ -0,0 +1,134 @@
+"""Test compact records and columnar batches of search results"""
+import math
+import unittest
+from array import array
+from wikigeo.records import ImageResult, PageMatch, PageResult, ResultBatch
+from wikigeo.wikisearch import WikiExtractor
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.sessions import SessionPool
+from tests.fakes import RepeatSession
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+NEARBY = {
+    "batchcomplete": "",
+    "query": {
+        "pages": {
+            "1": {
+                "pageid": 1,
+                "title": "Staines Bridge",
+                "coordinates": [{"lat": 51.4344, "lon": -0.5134}],
+                "terms": {"label": ["Staines Bridge"], "description": ["bridge"]},
+            },
+            "2": {
+                "pageid": 2,
+                "title": "Staines Moor",
+                "coordinates": [{"lat": 51.4460, "lon": -0.5020}],
+            },
+        }
+    },
+}
+
+
+def matches():
+    return [
+        PageMatch("Staines", 51.43, -0.51, distance=0.2, name_match=100),
+        PageMatch("Staines Moor", 51.44, -0.50, label=["Staines Moor"]),
+    ]
+
+
+class TestRecords(unittest.TestCase):
+    def test_to_dict(self):
+        """test records give the dictionaries returned by default"""
+        page = PageResult("Staines Bridge", 51.4, -0.5, ["bridge"], pageid=1)
+        assert page.to_dict() == {
+            "title": "Staines Bridge",
+            "description": ["bridge"],
+            "coordinates": {"lat": 51.4, "lon": -0.5},
+            "label": None,
+            "image": None,
+            "pageid": 1,
+        }
+        assert PageResult.from_dict(page.to_dict()) == page
+        assert matches()[0].to_dict()["name match"] == 100
+        image = ImageResult(0, "File:Staines.jpg", 51.4, -0.5)
+        assert "name match" not in image.to_dict()
+        assert image.to_dict()["author"] == ""
+
+    def test_slots(self):
+        """test records have no per instance dictionary"""
+        page = PageResult("Staines Bridge", 51.4, -0.5)
+        assert not hasattr(page, "__dict__")
+        with self.assertRaises(AttributeError):
+            page.other = 1
+
+
+class TestResultBatch(unittest.TestCase):
+    def test_columns(self):
+        """test numeric fields are kept in arrays with nan for missing values"""
+        batch = ResultBatch.from_records(matches())
+        assert batch.kind is PageMatch and len(batch) == 2
+        assert isinstance(batch.column("lat"), array)
+        assert batch.column("title") == ["Staines", "Staines Moor"]
+        assert math.isnan(batch.column("distance")[1])
+
+    def test_rows(self):
+        """test rows are read back as the records given"""
+        batch = ResultBatch.from_records(matches())
+        assert list(batch) == matches()
+        assert batch[1].distance is None
+        assert batch.to_dicts() == [match.to_dict() for match in matches()]
+        empty = ResultBatch.from_records([], PageResult)
+        assert len(empty) == 0
+        self.assertRaises(ValueError, ResultBatch.from_records, [])
+
+    @unittest.skipIf(pandas is None, "pandas not installed")
+    def test_to_pandas(self):
+        """test numeric columns share memory with the batch"""
+        batch = ResultBatch.from_records(matches())
+        frame = batch.to_pandas()
+        assert list(frame["title"]) == ["Staines", "Staines Moor"]
+        batch.column("lat")[0] = 1.0
+        assert frame["lat"][0] == 1.0
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_to_arrow(self):
+        """test batch converted to an arrow table"""
+        table = ResultBatch.from_records(matches()).to_arrow()
+        assert table.num_rows == 2
+        assert table.column("lat").to_pylist() == [51.43, 51.44]
+
+
+class TestRecordResults(unittest.TestCase):
+    def test_nearby_pages(self):
+        """test WikiExtractor returns records when asked, and dictionaries otherwise"""
+        wikis = [
+            WikiExtractor(
+                "en",
+                "test",
+                ratelimiter=RateLimiter(rate=None, maxconcurrent=None),
+                sessionpool=SessionPool(),
+                singleflight=None,
+                records=records,
+            )
+            for records in (False, True)
+        ]
+        for wiki in wikis:
+            wiki.api.session = RepeatSession(NEARBY)
+        dicts = wikis[0].get_nearby_pages(51.43, -0.51)
+        records = wikis[1].get_nearby_pages(51.43, -0.51)
+        assert all(isinstance(record, PageResult) for record in records)
+        assert [record.to_dict() for record in records] == dicts
+        assert records[0].label == ["Staines Bridge"] and records[1].label is None
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+"""Test sharing sessions between requests"""
+import unittest
+from wikigeo import WikiExtractor
+from wikigeo.wikisource.sessions import SessionPool
+
+
+class TestSessionPool(unittest.TestCase):
+    def test_session_per_host(self):
+        """test urls on the same host share a session"""
+        pool = SessionPool(maxsize=4)
+        api = pool.get("https://en.wikipedia.org/w/api.php")
+        assert api is pool.get("https://en.wikipedia.org/wiki/Staines")
+        assert api is not pool.get("https://de.wikipedia.org/w/api.php")
+        assert len(pool) == 2
+        adapter = api.get_adapter("https://en.wikipedia.org/w/api.php")
+        assert adapter._pool_maxsize == 4 and adapter._pool_block
+        pool.close()
+        assert len(pool) == 0
+
+    def test_extractors_share_sessions(self):
+        """test extractors reuse one session per wiki"""
+        pool = SessionPool()
+        first = WikiExtractor("en", "test", sessionpool=pool)
+        second = WikiExtractor("en", "test", sessionpool=pool)
+        german = WikiExtractor("de", "test", sessionpool=pool)
+        assert first.api.session is second.api.session
+        assert first.commonsapi.session is german.commonsapi.session
+        assert german.api.url == "https://de.wikipedia.org/w/api.php"
+        assert german.api.session is not first.api.session
+        assert len(pool) == 3
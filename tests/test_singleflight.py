@@ -0,0 +1,155 @@
+"""Test sharing one request between concurrent identical queries"""
+import threading
+import time
+import unittest
+from wikigeo.wikisource.metrics import PrometheusMetrics
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.sessions import SessionPool
+from wikigeo.wikisource.singleflight import SingleFlight, round_coords
+from wikigeo.wikisource.wikiapi import WikipediaAPI, query_nearby
+from tests.fakes import FakeResponse
+
+PAGE = {"pageid": 1, "title": "Staines Bridge", "coordinates": [{"lat": 1, "lon": 1}]}
+COMPLETE = {"batchcomplete": "", "query": {"pages": {"1": PAGE}}}
+
+
+class SlowSession:
+    """answers every query after a delay, recording the queries sent"""
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.sent = []
+
+    def get(self, url, params=None, headers=None):
+        self.sent.append(params)
+        time.sleep(self.delay)
+        return FakeResponse(COMPLETE)
+
+
+def run_at_once(function, args_list):
+    """calls function with each args in its own thread, returning the results"""
+    results = [None] * len(args_list)
+
+    def call(i, args):
+        results[i] = function(*args)
+
+    threads = [
+        threading.Thread(target=call, args=(i, args))
+        for i, args in enumerate(args_list)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestRoundCoords(unittest.TestCase):
+    def test_rounded(self):
+        """test coordinates rounded and other params kept"""
+        query = query_nearby(51.4329512, -0.5114918947, 4, 1000)
+        rounded = round_coords(query, 3)
+        assert rounded["ggscoord"] == "51.433|-0.511"
+        assert rounded["ggslimit"] == query["ggslimit"]
+        assert query["ggscoord"] == "51.4329512|-0.5114918947"
+
+    def test_not_rounded(self):
+        """test queries without coordinates or precision are unchanged"""
+        query = query_nearby(51.4329512, -0.5114918947, 4, 1000)
+        assert round_coords(query, None) is query
+        assert round_coords({"ggscoord": "x|y"}, 3) == {"ggscoord": "x|y"}
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_shared(self):
+        """test concurrent calls with the same key run once and get copies"""
+        flight = SingleFlight()
+        calls = []
+
+        def function():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"pages": [1]}
+
+        results = run_at_once(flight.do, [("a", function)] * 5)
+        assert len(calls) == 1 and flight.coalesced == 4
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+        assert all(result == {"pages": [1]} for result, _ in results)
+        pages = [id(result["pages"]) for result, _ in results]
+        assert len(set(pages)) == 5
+        assert len(flight) == 0
+
+    def test_different_keys(self):
+        """test calls with different keys or after completion run separately"""
+        flight = SingleFlight()
+        calls = []
+
+        def function():
+            calls.append(1)
+            time.sleep(0.05)
+            return {}
+
+        run_at_once(flight.do, [("a", function), ("b", function)])
+        flight.do("a", function)
+        assert len(calls) == 3 and flight.coalesced == 0
+
+    def test_error_shared(self):
+        """test waiting callers get the error of the call"""
+        flight = SingleFlight()
+        errors = []
+
+        def function():
+            time.sleep(0.1)
+            raise ValueError("failed")
+
+        def call():
+            try:
+                flight.do("a", function)
+            except ValueError as error:
+                errors.append(error)
+
+        run_at_once(call, [()] * 3)
+        assert len(errors) == 3 and len(flight) == 0
+
+
+class TestCoalescedAPI(unittest.TestCase):
+    def fake_api(self, **kwargs):
+        api = WikipediaAPI(
+            "test",
+            ratelimiter=RateLimiter(rate=None, maxconcurrent=None),
+            sessionpool=SessionPool(),
+            **kwargs,
+        )
+        api.session = SlowSession()
+        return api
+
+    def test_concurrent_searches_coalesced(self):
+        """test concurrent searches at nearly the same point send one request"""
+        metrics = PrometheusMetrics()
+        api = self.fake_api(singleflight=SingleFlight(), metrics=metrics)
+        queries = [
+            query_nearby(51.4329512 + i * 1e-7, -0.51, 4, 1000) for i in range(4)
+        ]
+        results = run_at_once(api.get_data, [(query,) for query in queries])
+        assert len(api.session.sent) == 1
+        assert api.session.sent[0]["ggscoord"] == "51.43295|-0.51"
+        assert all(result == {"1": PAGE} for result in results)
+        assert metrics.totals()["coalesced"] == 3
+
+    def test_not_coalesced(self):
+        """test every search is sent without a SingleFlight or precision"""
+        api = self.fake_api(singleflight=None)
+        query = query_nearby(51.43, -0.51, 4, 1000)
+        run_at_once(api.get_data, [(query,)] * 3)
+        assert len(api.session.sent) == 3
+        api = self.fake_api(singleflight=SingleFlight(), coordprecision=None)
+        queries = [
+            query_nearby(51.4329512 + i * 1e-7, -0.51, 4, 1000) for i in range(2)
+        ]
+        run_at_once(api.get_data, [(query,) for query in queries])
+        assert len(api.session.sent) == 2
+        assert api.session.sent[0]["ggscoord"] != api.session.sent[1]["ggscoord"]
+
+
+if __name__ == "__main__":
+    unittest.main()
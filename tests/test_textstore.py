@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from wikigeo.wikisource.textstore import PageTextStore
+
+
+class TestPageTextStore(unittest.TestCase):
+    def setUp(self):
+        self.store = PageTextStore()
+
+    def test_keyed_on_language(self):
+        """test pages are stored per title and language"""
+        self.store.set("Berlin", "de", "Berlin ist", True, 5, '"abc"', None)
+        assert self.store.get("Berlin", "en") is None
+        page = self.store.get("Berlin", "de")
+        assert page == {
+            "text": "Berlin ist",
+            "complete": True,
+            "revid": 5,
+            "etag": '"abc"',
+            "last_modified": None,
+        }
+
+    def test_usable(self):
+        """test text cut short is only reused for smaller limits,
+        and text of another revision isn't reused"""
+        self.store.set("Staines", "en", "Staines is", False, 5)
+        page = self.store.get("Staines", "en")
+        assert self.store.usable(page, 5)
+        assert self.store.usable(page, 10, 5)
+        assert not self.store.usable(page, 10, 6)
+        assert not self.store.usable(page, 20)
+        assert not self.store.usable(page, False)
+        assert self.store.reuse(page, 4) == "Stai"
+
+    def test_set_revid_and_stats(self):
+        """test revision ids are updated and reuse is counted"""
+        self.store.set("Staines", "en", "Staines is a town", True)
+        self.store.set_revid("Staines", "en", 7)
+        page = self.store.get("Staines", "en")
+        assert page["revid"] == 7
+        self.store.reuse(page)
+        assert self.store.stats() == {"reused": 1, "fetched": 1, "size": 1}
+        self.store.clear()
+        assert self.store.stats() == {"reused": 0, "fetched": 0, "size": 0}
+
+    def test_persisted(self):
+        """test text is kept between runs in a sqlite file"""
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "text.sqlite")
+            PageTextStore(path).set("Staines", "en", "Staines is a town", True, 3)
+            assert PageTextStore(path).get("Staines", "en")["revid"] == 3
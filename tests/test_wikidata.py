@@ -0,0 +1,184 @@
+"""Test batched Wikidata lookups against a local stand-in for the Wikidata API"""
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from wikigeo.wikisource.cache import ResponseCache, query_kind
+from wikigeo.wikisource.errors import APIError
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.wikidata import (
+    WikidataAPI,
+    commons_file_url,
+    parse_entity,
+    query_entities,
+)
+
+
+def claim(value, rank="normal"):
+    return {
+        "mainsnak": {"snaktype": "value", "datavalue": {"value": value}},
+        "rank": rank,
+    }
+
+
+def entity(number, title, lat=None, image=None):
+    """entity Q<number> with an english and german label"""
+    claims = {}
+    if lat is not None:
+        claims["P625"] = [
+            claim({"latitude": 0, "longitude": 0}, "deprecated"),
+            claim({"latitude": lat, "longitude": -0.5}),
+        ]
+    if image is not None:
+        claims["P18"] = [claim("Other.jpg"), claim(image, "preferred")]
+    return {
+        "id": f"Q{number}",
+        "labels": {
+            "en": {"language": "en", "value": title},
+            "de": {"language": "de", "value": f"{title} (de)"},
+        },
+        "descriptions": {"en": {"language": "en", "value": "place"}},
+        "claims": claims,
+        "sitelinks": {"enwiki": {"site": "enwiki", "title": title}},
+    }
+
+
+ENTITIES = {f"Q{i}": entity(i, f"Place {i}", lat=51 + i / 100) for i in range(1, 80)}
+ENTITIES["Q1"] = entity(1, "Staines Bridge", lat=51.43, image="Staines Bridge.jpg")
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)
+        if params.get("action") != "wbgetentities":
+            result = {"error": {"code": "badvalue", "info": "unknown action"}}
+        elif "ids" in params:
+            result = {
+                "entities": {
+                    i: ENTITIES.get(i, {"id": i, "missing": ""})
+                    for i in params["ids"].split("|")
+                }
+            }
+        else:
+            by_title = {e["sitelinks"]["enwiki"]["title"]: e for e in ENTITIES.values()}
+            entities = {}
+            for n, title in enumerate(params["titles"].split("|")):
+                found = by_title.get(title)
+                if found is None:
+                    entities[str(-n - 1)] = {
+                        "site": "enwiki",
+                        "title": title,
+                        "missing": "",
+                    }
+                else:
+                    entities[found["id"]] = found
+            result = {"entities": entities}
+        body = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestParsing(unittest.TestCase):
+    def test_parse_entity(self):
+        """test preferred claims used and deprecated ones skipped"""
+        parsed = parse_entity(ENTITIES["Q1"], ["en", "fr"])
+        assert parsed["labels"] == {"en": "Staines Bridge"}
+        assert parsed["descriptions"] == {"en": "place"}
+        assert parsed["coordinates"] == {"lat": 51.43, "lon": -0.5}
+        assert parsed["image"] == commons_file_url("Staines Bridge.jpg")
+        assert parsed["image"].endswith("/Special:FilePath/Staines_Bridge.jpg")
+        assert parsed["sitelinks"] == {"enwiki": "Staines Bridge"}
+        assert parse_entity({"id": "Q0", "missing": ""}) is None
+        bare = parse_entity({"id": "Q2"})
+        assert bare["coordinates"] is None and bare["image"] is None
+
+    def test_query_limits(self):
+        """test between 1 and 50 ids per query"""
+        query = query_entities(ids=["Q1", "Q2"], languages=["en", "de"])
+        assert query["ids"] == "Q1|Q2" and query["languages"] == "en|de"
+        self.assertRaises(Exception, query_entities, ids=[])
+        self.assertRaises(Exception, query_entities, ids=["Q1"] * 51)
+
+
+class TestWikidataAPI(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address
+        self.url = f"http://{host}:{port}/w/api.php"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def api(self, **kwargs):
+        return WikidataAPI(
+            "test",
+            url=self.url,
+            ratelimiter=RateLimiter(rate=None, maxconcurrent=None),
+            singleflight=None,
+            **kwargs,
+        )
+
+    def test_get_entities_batched(self):
+        """test ids are sent 50 per request and returned in the order given"""
+        api = self.api(languages=["en", "de"])
+        ids = [f"Q{i}" for i in range(1, 61)] + ["Q999", "Q1"]
+        entities = api.get_entities(ids)
+        assert len(self.server.requests) == 2
+        assert [len(r["ids"].split("|")) for r in self.server.requests] == [50, 11]
+        assert list(entities) == ids[:-1]
+        assert entities["Q999"] is None
+        assert entities["Q1"]["labels"] == {
+            "en": "Staines Bridge",
+            "de": "Staines Bridge (de)",
+        }
+        assert entities["Q60"]["coordinates"] == {"lat": 51.6, "lon": -0.5}
+
+    def test_get_entities_by_titles(self):
+        """test pages matched to their entities by sitelink"""
+        api = self.api()
+        entities = api.get_entities_by_titles(["Staines Bridge", "Nowhere", "Place 5"])
+        assert len(self.server.requests) == 1
+        assert self.server.requests[0]["sites"] == "enwiki"
+        assert entities["Staines Bridge"]["id"] == "Q1"
+        assert entities["Place 5"]["id"] == "Q5"
+        assert entities["Nowhere"] is None
+
+    def test_cached(self):
+        """test responses reused from the cache"""
+        cache = ResponseCache()
+        api = self.api(cache=cache)
+        first = api.get_entities(["Q1", "Q2"])
+        assert api.get_entities(["Q1", "Q2"]) == first
+        assert len(self.server.requests) == 1
+        assert query_kind("https://www.wikidata.org/w/api.php", {}) == "wikidata"
+
+    def test_rate_limited(self):
+        """test wikidata requests go through the rate limiter for its host"""
+        limiter = RateLimiter(rate=None, maxconcurrent=None)
+        api = WikidataAPI("test", url=self.url, ratelimiter=limiter)
+        api.get_entities(["Q1"])
+        assert list(limiter.waited()) == [urlparse(self.url).netloc]
+
+    def test_api_error(self):
+        """test errors reported by the API raised"""
+        api = self.api()
+        api.query = {"action": "other"}
+        with self.assertRaises(APIError) as raised:
+            api._send_query()
+        assert raised.exception.code == "badvalue"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,7 @@
+import threading
+import time
 from wikigeo import ConcurrentSearcher
+from wikigeo.wikisource.errors import ThrottledError
 
 def test_nearby_pages():
     searcher = ConcurrentSearcher('en', "testing (marymcguire1718@gmail.com)")
@@ -47,3 +50,80 @@ def test_page_match():
     for page in matches:
         print(page)
         assert isinstance(page['result'][0]['title'], str) and isinstance(page['result'][0]['lat'], float)
+
+class SlowWiki:
+    """stands in for WikiExtractor, taking longer for earlier inputs"""
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def get_nearby_pages(self, lat, lon, limit, radiusmetres):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(0.05 if lat == 0 else 0.001)
+        with self.lock:
+            self.in_flight -= 1
+        return [{'title': f'{lat},{lon}'}]
+
+def coords_from_file(n):
+    """generator standing in for reading coords from a large file"""
+    for i in range(n):
+        yield (i, -i)
+
+def test_iter_nearby_pages_bounded():
+    searcher = ConcurrentSearcher('en', "testing")
+    searcher.wiki = SlowWiki()
+    results = searcher.iter_nearby_pages(coords_from_file(100), window=4)
+    first = next(results)
+    # first result arrives without waiting for the slow first request
+    assert first['coords'] != (0, 0)
+    rest = list(results)
+    assert len(rest) == 99 and searcher.wiki.peak <= 4
+
+def test_iter_nearby_pages_ordered():
+    searcher = ConcurrentSearcher('en', "testing")
+    searcher.wiki = SlowWiki()
+    results = list(searcher.iter_nearby_pages(coords_from_file(20), window=4, ordered=True))
+    assert [result['coords'] for result in results] == list(coords_from_file(20))
+    assert results[3]['result'][0]['title'] == '3,-3'
+
+def test_iter_is_lazy():
+    searcher = ConcurrentSearcher('en', "testing")
+    searcher.wiki = SlowWiki()
+    results = searcher.iter_nearby_pages(coords_from_file(10**9), window=3, ordered=True)
+    for _ in range(5):
+        next(results)
+    results.close()
+    assert searcher.wiki.calls <= 8
+
+class FailingWiki(SlowWiki):
+    """fails for searches at latitude 1"""
+
+    def get_nearby_pages(self, lat, lon, limit, radiusmetres):
+        if lat == 1:
+            raise ThrottledError('503 response', 503)
+        return super().get_nearby_pages(lat, lon, limit, radiusmetres)
+
+def test_partial_results():
+    searcher = ConcurrentSearcher('en', "testing")
+    searcher.wiki = FailingWiki()
+    results = searcher.multi_nearby_pages(list(coords_from_file(3)))
+    assert [result['coords'] for result in results] == list(coords_from_file(3))
+    assert results[1] == {'coords': (1, -1), 'result': None, 'error': '503 response'}
+    assert 'error' not in results[2] and results[2]['result'][0]['title'] == '2,-2'
+    results = list(searcher.iter_nearby_pages(coords_from_file(3), ordered=True))
+    assert results[1]['error'] == '503 response' and 'error' not in results[0]
+
+def test_repeated_searches_sent_once():
+    searcher = ConcurrentSearcher('en', "testing")
+    searcher.wiki = SlowWiki()
+    coords = [(1, -1), (2, -2), (1, -1), (1, -1)]
+    results = searcher.multi_nearby_pages(coords)
+    assert searcher.wiki.calls == 2
+    assert [result['coords'] for result in results] == coords
+    assert results[3] == results[0] and results[3]['result'] is not results[0]['result']
@@ -1,5 +1,10 @@
 import unittest
+import unittest.mock
 from wikigeo import WikiExtractor
+from wikigeo.wikisource.errors import RequestError
+from wikigeo.wikisource.textstore import PageTextStore
+from wikigeo.wikisource.wikiapi import query_by_titles
+from tests.fakes import FakeResponse
 
 
 class TestWikiExtractor(unittest.TestCase):
@@ -72,3 +77,227 @@ class TestWikiExtractor(unittest.TestCase):
         assert len(results) == 1
         for page in results:
             assert isinstance(page["title"], str)
+
+
+class FakeTitlesSession:
+    """answers batched title queries, counting requests. Like TextExtracts,
+    extracts are given for at most 20 pages per response and continued"""
+
+    def __init__(self):
+        self.requests = 0
+        self.sizes = []
+
+    def get(self, url, params=None, headers=None):
+        self.requests += 1
+        titles = params["titles"].split("|")
+        assert len(titles) <= 50
+        self.sizes.append(len(titles))
+        start = int(params.get("excontinue", 0))
+        end = start + min(int(params["exlimit"]), 20)
+        pages = {}
+        normalized = []
+        for i, title in enumerate(titles):
+            if title == "staines_bridge":
+                normalized.append({"from": title, "to": "Staines bridge"})
+                continue
+            pages[str(i)] = {
+                "pageid": i,
+                "title": title,
+                "coordinates": [{"lat": 51.0, "lon": float(i)}],
+                "terms": {"label": [title], "description": ["place"]},
+            }
+            if start <= i < end:
+                pages[str(i)]["extract"] = f"{title} is a place."
+        if normalized:
+            pages["-1"] = {"title": "Staines bridge", "missing": ""}
+        result = {"query": {"normalized": normalized, "pages": pages}}
+        if end < len(titles):
+            result["continue"] = {"excontinue": str(end), "continue": "||"}
+        else:
+            result["batchcomplete"] = ""
+        return FakeResponse(result)
+
+
+class TestPagesByTitle(unittest.TestCase):
+    def setUp(self):
+        self.wiki = WikiExtractor("en", "test")
+        self.session = FakeTitlesSession()
+        self.wiki.api.session = self.session
+
+    def test_batches_of_twenty(self):
+        """test titles are sent 20 per request, as many as extracts are given for,
+        and returned in order"""
+        titles = [f"Place {i}" for i in range(45)]
+        pages = self.wiki.get_pages_by_title(titles + ["Place 0"])
+        assert self.session.sizes == [20, 20, 5]
+        assert [page["title"] for page in pages] == titles + ["Place 0"]
+        assert all(page["extract"] is not None for page in pages)
+        assert pages[1]["pagetitle"] == "Place 1"
+        assert pages[1]["extract"] == "Place 1 is a place."
+        assert pages[1]["coordinates"] == {"lat": 51.0, "lon": 1.0}
+
+    def test_continued_extracts_merged(self):
+        """test extracts of more than 20 titles in one query arrive over continuations"""
+        titles = [f"Place {i}" for i in range(50)]
+        pages = self.wiki.api.get_data(query_by_titles(titles))
+        assert self.session.requests == 3
+        assert all(page["extract"] for page in pages.values())
+
+    def test_normalised_missing_title(self):
+        """test normalised titles are matched and missing pages have no pagetitle"""
+        pages = self.wiki.get_pages_by_title(["staines_bridge", "Staines"])
+        assert pages[0]["title"] == "staines_bridge"
+        assert pages[0]["pagetitle"] is None and pages[0]["coordinates"] is None
+        assert pages[1]["label"] == ["Staines"]
+
+
+class FakeImagesSession:
+    """answers commons geosearches with ggslimit images, sending the coordinates
+    of the second half in a continuation"""
+
+    def __init__(self):
+        self.params = []
+
+    def get(self, url, params=None, headers=None):
+        self.params.append(params)
+        count = int(params["ggslimit"])
+        half = count // 2
+        pages = {}
+        for i in range(count):
+            page = {"title": f"File:Staines {'Bridge ' * (i % 3)}{i}.jpg"}
+            continued = i >= half
+            if "cocontinue" in params:
+                if continued:
+                    page["coordinates"] = [{"lat": 51.4, "lon": -0.5 + i / 1000}]
+                pages[str(i)] = page
+                continue
+            page["imageinfo"] = [{"url": f"https://upload.example/{i}.jpg"}]
+            if not continued:
+                page["coordinates"] = [{"lat": 51.4, "lon": -0.5 + i / 1000}]
+            pages[str(i)] = page
+        if "cocontinue" in params:
+            return FakeResponse({"batchcomplete": "", "query": {"pages": pages}})
+        return FakeResponse(
+            {
+                "continue": {"cocontinue": f"{half}|0", "continue": "||"},
+                "query": {"pages": pages},
+            }
+        )
+
+
+class TestNearbyImages(unittest.TestCase):
+    def setUp(self):
+        self.wiki = WikiExtractor("en", "test")
+        self.session = FakeImagesSession()
+        self.wiki.commonsapi.session = self.session
+
+    def test_many_images(self):
+        """test more than five images are found, following the continuation"""
+        images = self.wiki.get_nearby_images(51.4, -0.5, limit=20)
+        assert self.session.params[0]["ggslimit"] == "20"
+        assert len(self.session.params) == 2
+        assert list(images) == list(range(20))
+        assert [image["title"] for image in images.values()] == [
+            f"File:Staines {'Bridge ' * (i % 3)}{i}.jpg" for i in range(20)
+        ]
+        assert images[19]["lon"] == -0.5 + 19 / 1000
+        assert images[0]["image"] == "https://upload.example/0.jpg"
+
+    def test_sorted_by_name_match(self):
+        """test each position has its own image, best name match first"""
+        images = self.wiki.get_nearby_images(
+            51.4, -0.5, nametomatch="Staines Bridge Bridge", limit=30
+        )
+        matches = [image["name match"] for image in images.values()]
+        assert matches == sorted(matches, reverse=True)
+        assert len({image["index"] for image in images.values()}) == 30
+        filtered = self.wiki.get_nearby_images(
+            51.4, -0.5, nametomatch="Staines Bridge Bridge", matchfilter=90, limit=30
+        )
+        assert 0 < len(filtered) < 30
+        assert list(filtered.values()) == list(images.values())[: len(filtered)]
+
+    def test_limit_checked(self):
+        """test limit must be between 1 and 500"""
+        self.assertRaises(Exception, self.wiki.get_nearby_images, 51.4, -0.5, limit=501)
+
+
+class FakeNearbySession:
+    """answers geosearches with no pages, keeping the parameters sent"""
+
+    def __init__(self):
+        self.params = []
+
+    def get(self, url, params=None, headers=None):
+        self.params.append(params)
+        return FakeResponse({"batchcomplete": "", "query": {"pages": {}}})
+
+
+class TestNearbyPages(unittest.TestCase):
+    def test_prop_limits(self):
+        """test coordinates and images of large searches come in one response"""
+        wiki = WikiExtractor("en", "test", singleflight=None)
+        wiki.api.session = session = FakeNearbySession()
+        wiki.get_nearby_pages(51.4, -0.5, limit=500)
+        assert session.params[0]["ggslimit"] == "500"
+        assert session.params[0]["colimit"] == "500"
+        assert session.params[0]["pilimit"] == "max"
+
+
+class FakeRevisionsSession:
+    """answers latest revision queries, Staines has revision 2, Nowhere is missing"""
+
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, params=None, headers=None):
+        self.requests += 1
+        pages = {"1": {"pageid": 1, "title": "Staines", "lastrevid": 2}}
+        pages["-1"] = {"title": "Nowhere", "missing": ""}
+        return FakeResponse({"batchcomplete": "", "query": {"pages": pages}})
+
+
+class TestPageTexts(unittest.TestCase):
+    def setUp(self):
+        self.store = PageTextStore()
+        self.wiki = WikiExtractor("en", "test", textstore=self.store)
+        self.wiki.api.session = FakeRevisionsSession()
+        self.scraped = []
+
+        def scrape(title, limit, *args, **kwargs):
+            self.scraped.append(args[-1])
+            return {"title": title, "text": "Staines is a town"}
+
+        patcher = unittest.mock.patch("wikigeo.wikisearch.scrape_page_text", scrape)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_revisions_checked_in_batch(self):
+        """test revisions are looked up in one request and each page scraped once"""
+        texts = self.wiki.get_page_texts(["Staines", "Nowhere", "Staines"])
+        assert self.wiki.api.session.requests == 1
+        assert self.scraped == [2]
+        assert texts == [
+            {"title": "Staines", "text": "Staines is a town"},
+            {"title": "Nowhere", "text": None},
+            {"title": "Staines", "text": "Staines is a town"},
+        ]
+
+    def test_revisions_skipped_without_store(self):
+        """test pages are scraped without a revision lookup when there's no store"""
+        self.wiki.textstore = None
+        texts = self.wiki.get_page_texts(["Staines", "Staines", "Egham"])
+        assert self.wiki.api.session.requests == 0
+        assert self.scraped == [None, None]
+        assert [text["title"] for text in texts] == ["Staines", "Staines", "Egham"]
+
+    def test_missing_page_without_store(self):
+        """test a page that doesn't exist has no text when there's no store"""
+
+        def scrape(title, *args, **kwargs):
+            raise RequestError(f"404 response from {title}", 404)
+
+        self.wiki.textstore = None
+        with unittest.mock.patch("wikigeo.wikisearch.scrape_page_text", scrape):
+            texts = self.wiki.get_page_texts(["Nowhere"])
+        assert texts == [{"title": "Nowhere", "text": None}]
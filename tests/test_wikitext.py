@@ -1,4 +1,8 @@
-from wikigeo.wikisource.wikitext import scrape_page_text
+import requests
+from wikigeo.wikisearch import WikiExtractor
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.textstore import PageTextStore
+from wikigeo.wikisource.wikitext import extract_text, parse_page_text, scrape_page_text
 import time
 
 def test_scrape():
@@ -6,3 +10,169 @@ def test_scrape():
     result = scrape_page_text('Berlin', limit, 'de')
     print(result)
     assert isinstance(result['text'], str) and len(result['text']) <= limit
+
+
+PAGE = """<html><head><title>Staines</title></head><body>
+<p>Site notice</p>
+<div id="mw-content-text"><div class="mw-parser-output">
+<p>Staines is a town<sup class="reference"><a href="#cite-1">[1]</a></sup> in Surrey.</p>
+<table><tr><td><p>Infobox text</p></td></tr></table>
+<div class="mw-heading"><h2>History<span class="mw-editsection">[<a>edit</a>]</span></h2></div>
+<p>The town   grew
+around a bridge.<style>.x{}</style></p>
+<h3>Bridge</h3>
+</div></div>
+<div id="footer"><p>Footer text</p></div>
+</body></html>"""
+
+
+def test_extract_text_content_only():
+    """only paragraphs and headings in the content div, without references or [edit]"""
+    text = extract_text([PAGE])
+    assert text == (
+        "Staines is a town in Surrey. Infobox text History "
+        "The town grew around a bridge. Bridge"
+    )
+
+
+def test_extract_text_chunks():
+    """text is the same however the html is split"""
+    data = PAGE.encode()
+    chunks = [data[i : i + 7] for i in range(0, len(data), 7)]
+    assert extract_text(chunks) == extract_text([PAGE])
+
+
+def test_extract_text_stops_early():
+    """stops reading chunks once enough text is found"""
+    data = PAGE.encode()
+    read = []
+
+    def chunks():
+        for i in range(0, len(data), 20):
+            read.append(i)
+            yield data[i : i + 20]
+
+    assert extract_text(chunks(), 10) == "Staines is"
+    assert len(read) < len(data) / 20 - 5
+
+
+def test_extract_text_no_content_div():
+    """pages without a content div use all paragraphs and headings"""
+    html = "<html><body><h2>History[edit]</h2><p>Staines is a town.</p></body></html>"
+    assert parse_page_text(html, "Staines", 10) == {"title": "Staines", "text": "History St"}
+
+
+class FakePageResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.body = body
+
+    def iter_content(self, size):
+        return (self.body[i : i + size] for i in range(0, len(self.body), size))
+
+    def close(self):
+        pass
+
+
+class FakePageSession:
+    """serves PAGE with an ETag, and not modified if asked with the same ETag"""
+
+    def __init__(self):
+        self.downloads = 0
+        self.requests = 0
+        self.headers = []
+
+    def get(self, url, headers=None, stream=False):
+        self.requests += 1
+        self.headers.append(headers)
+        if headers.get("If-None-Match") == '"rev1"':
+            return FakePageResponse(304)
+        self.downloads += 1
+        return FakePageResponse(200, PAGE.encode(), {"ETag": '"rev1"'})
+
+
+class FakePool:
+    """session pool with a single session"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url):
+        return self.session
+
+
+def test_scrape_conditional():
+    """unchanged pages are revalidated without downloading them again"""
+    sessions = FakePageSession()
+    pool = FakePool(sessions)
+    store = PageTextStore()
+    first = scrape_page_text("Staines", 20, sessionpool=pool, store=store)
+    again = scrape_page_text("Staines", 10, sessionpool=pool, store=store)
+    assert first == {"title": "Staines", "text": "Staines is a town in"}
+    assert again == {"title": "Staines", "text": "Staines is"}
+    assert sessions.requests == 2 and sessions.downloads == 1
+    # more text than was stored is downloaded
+    scrape_page_text("Staines", False, sessionpool=pool, store=store)
+    assert sessions.downloads == 2
+    assert store.get("Staines", "en")["complete"]
+
+
+def test_scrape_known_revision():
+    """stored text of the current revision is reused without a request"""
+    sessions = FakePageSession()
+    pool = FakePool(sessions)
+    store = PageTextStore()
+    scrape_page_text("Staines", False, sessionpool=pool, store=store, revid=4)
+    result = scrape_page_text("Staines", 7, sessionpool=pool, store=store, revid=4)
+    assert result["text"] == "Staines"
+    assert sessions.requests == 1
+    scrape_page_text("Staines", 7, sessionpool=pool, store=store, revid=5)
+    assert sessions.requests == 2 and sessions.downloads == 1
+    assert store.get("Staines", "en")["revid"] == 5
+
+
+def test_scrape_user_agent():
+    """page scrapes identify themselves with the user info, as API requests do"""
+    sessions = FakePageSession()
+    wiki = WikiExtractor(
+        "en", "wikigeo tests", sessionpool=FakePool(sessions), textstore=PageTextStore()
+    )
+    wiki.get_page_text("Staines", 7)
+    wiki.get_page_text("Staines", 7)
+    assert sessions.headers[0] == {"User-agent": "wikigeo tests"}
+    assert sessions.headers[1] == {
+        "User-agent": "wikigeo tests",
+        "If-None-Match": '"rev1"',
+    }
+
+
+class FakeFailingSession:
+    """fails with the given responses or errors, then serves PAGE"""
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.requests = 0
+
+    def get(self, url, headers=None, stream=False):
+        self.requests += 1
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return failure
+        return FakePageResponse(200, PAGE.encode())
+
+
+def test_scrape_retries_server_errors():
+    """5xx responses and connection errors are retried like API requests"""
+    sessions = FakeFailingSession(
+        [FakePageResponse(503), requests.ConnectionError("refused")]
+    )
+    limiter = RateLimiter(rate=None, failures=2)
+    result = scrape_page_text(
+        "Staines", 7, ratelimiter=limiter, sessionpool=FakePool(sessions), backoff=0.01
+    )
+    assert result["text"] == "Staines" and sessions.requests == 3
+    limiter.host("en.wikipedia.org").check()
@@ -1,5 +1,49 @@
+"""Getting point of interest data by geographic coordinates from Wikipedia.
+
+Classes are imported from their modules when first used, so importing the package
+is cheap. The package logs to the 'wikigeo' logger and writes nothing unless
+logging is configured, e.g. logging.getLogger('wikigeo').setLevel(logging.DEBUG)
+with a handler"""
+import importlib
 import logging
-from .wikimultisearch import WikiExtractor, ConcurrentSearcher
 
-logger = logging.getLogger()
-logging.basicConfig(filename='logging.log', level=logging.DEBUG)
\ No newline at end of file
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
+# name: module it is imported from
+_EXPORTS = {
+    "WikiExtractor": ".wikisearch",
+    "ConcurrentSearcher": ".wikimultisearch",
+    "ResponseCache": ".wikisource.cache",
+    "Metrics": ".wikisource.metrics",
+    "PrometheusMetrics": ".wikisource.metrics",
+    "OpenTelemetryMetrics": ".wikisource.metrics",
+    "WikiError": ".wikisource.errors",
+    "RequestError": ".wikisource.errors",
+    "ThrottledError": ".wikisource.errors",
+    "APIError": ".wikisource.errors",
+    "CircuitOpenError": ".wikisource.errors",
+    "WikidataAPI": ".wikisource.wikidata",
+    "PageResult": ".records",
+    "PageMatch": ".records",
+    "ImageResult": ".records",
+    "ResultBatch": ".records",
+    "GeoStore": ".geostore",
+    "DumpStore": ".dumpstore",
+    "build_dump_store": ".dumpstore",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    # later lookups find the attribute without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,250 @@
+"""Processing data from Wikipedia APIs with asyncio"""
+import asyncio
+import logging
+from typing import Iterable, Optional
+import aiohttp
+from wikigeo.wikisearch import (
+    _chunk_titles,
+    _parse_nearby_pages,
+    _parse_nearby_images,
+    _parse_page_matches,
+    _parse_title_pages,
+)
+from wikigeo.matching import DEFAULT_MATCHER, NameMatcher
+from wikigeo.wikisource.asyncapi import AsyncWikipediaAPI
+from wikigeo.wikisource.cache import ResponseCache
+from wikigeo.wikisource.errors import RequestError
+from wikigeo.wikisource.ratelimit import (
+    DEFAULT_LIMITER,
+    RETRY_STATUSES,
+    RateLimiter,
+    backoff_delay,
+    retry_after,
+)
+from wikigeo.wikisource.wikiapi import (
+    EXTRACTS_LIMIT,
+    _request_error,
+    query_nearby,
+    query_by_string,
+    query_commons_nearby,
+    query_by_titles,
+)
+from wikigeo.wikisource.wikitext import page_url, parse_page_text
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWikiExtractor:
+    """
+
+    Search wikipedia and return specified information without blocking the event loop.
+    Results have the same format as WikiExtractor.
+
+    All requests share one connection pool, so many searches can be run at once
+    with asyncio.gather. Use as an async context manager or call close() when done.
+
+    maxconnections: max number of open connections in the pool (default 100)
+
+    cache: optional ResponseCache used for all queries
+
+    ratelimiter: RateLimiter for all requests, by default shared by all instances
+
+    matcher: optional NameMatcher for rating name matches
+
+    retries, backoff: see WikipediaAPI, used for page text requests too
+
+    """
+
+    def __init__(
+        self,
+        language: str,
+        userinfo: str,
+        maxconnections: int = 100,
+        cache: Optional[ResponseCache] = None,
+        ratelimiter: RateLimiter = DEFAULT_LIMITER,
+        matcher: NameMatcher = DEFAULT_MATCHER,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.user = userinfo
+        self.language = language
+        self.maxconnections = maxconnections
+        self.cache = cache
+        self.ratelimiter = ratelimiter
+        self.matcher = matcher
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+        self.api = None
+        self.commonsapi = None
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """closes the shared connection pool"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # created lazily as aiohttp sessions must be made inside the event loop
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.maxconnections)
+            self.session = aiohttp.ClientSession(
+                connector=connector, headers={"User-agent": self.user}
+            )
+            self.api = AsyncWikipediaAPI(
+                self.user,
+                self.language,
+                session=self.session,
+                cache=self.cache,
+                ratelimiter=self.ratelimiter,
+                retries=self.retries,
+                backoff=self.backoff,
+            )
+            self.commonsapi = AsyncWikipediaAPI(
+                self.user,
+                commons=True,
+                session=self.session,
+                cache=self.cache,
+                ratelimiter=self.ratelimiter,
+                retries=self.retries,
+                backoff=self.backoff,
+            )
+        return self.session
+
+    async def get_nearby_pages(
+        self, lat: float, lon: float, limit: int = 4, radiusmeters: int = 10000
+    ) -> list:
+        """
+
+        Get details for all pages within a given radius of given coordinates.
+        See WikiExtractor.get_nearby_pages
+
+        """
+        self._get_session()
+        query = query_nearby(lat, lon, limit, radiusmeters)
+        response = await self.api.get_data(query)
+        return _parse_nearby_pages(response)
+
+    async def get_page_text(self, pagetitle: str, limit: bool = False) -> dict:
+        """
+
+        Retrieve the full text of a given page by page title.
+        See WikiExtractor.get_page_text
+
+        """
+        session = self._get_session()
+        url = page_url(pagetitle, self.language)
+        limiter = self.ratelimiter.host(url)
+        limiter.check()
+        for attempt in range(self.retries + 1):
+            try:
+                async with limiter.async_slot(check=False):
+                    async with session.get(url) as response:
+                        logger.debug(response)
+                        throttled = response.status in RETRY_STATUSES
+                        if not throttled or attempt == self.retries:
+                            if throttled:
+                                limiter.failed()
+                            else:
+                                limiter.succeeded()
+                            if response.status >= 400:
+                                raise _request_error(response.status, url)
+                            html = await response.text()
+                            break
+                        wait = retry_after(response.headers, default=None)
+                        if wait is None:
+                            wait = backoff_delay(attempt, self.backoff)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt == self.retries:
+                    limiter.failed()
+                    raise RequestError(
+                        f"request to {url} failed: {error!r}", url=url
+                    ) from error
+                wait = backoff_delay(attempt, self.backoff)
+            logger.warning("request to %s retrying in %.2fs", url, wait)
+            limiter.pause(wait)
+        # parsing in a thread so other requests carry on meanwhile
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, parse_page_text, html, pagetitle, limit)
+
+    async def get_pages_by_title(
+        self, titles: Iterable[str], extract_chars: Optional[int] = None
+    ) -> list:
+        """
+
+        Get details for many pages by title, sending up to 20 titles per request.
+        See WikiExtractor.get_pages_by_title
+
+        """
+        self._get_session()
+        titles = list(titles)
+
+        async def get_batch(batch):
+            aliases = {}
+            query = query_by_titles(batch, extract_chars)
+            response = await self.api.get_data(query, aliases)
+            return _parse_title_pages(response, aliases, batch)
+
+        batches = await asyncio.gather(
+            *[get_batch(batch) for batch in _chunk_titles(titles, EXTRACTS_LIMIT)]
+        )
+        pages = {page["title"]: page for batch in batches for page in batch}
+        return [dict(pages[title]) for title in titles]
+
+    async def get_nearby_images(
+        self,
+        lat: float,
+        lon: float,
+        radiusmeters=10000,
+        nametomatch=False,
+        matchfilter=False,
+        limit: int = 5,
+    ) -> dict:
+        """
+
+        Gets images nearby given coordinates from Wikimedia Commons.
+        See WikiExtractor.get_nearby_images
+
+        """
+        if matchfilter and (not nametomatch):
+            raise ValueError("nametomatch must be set to a name if using a matchfilter")
+        self._get_session()
+        query = query_commons_nearby(lat, lon, radiusmeters, limit)
+        response = await self.commonsapi.get_data(query)
+        return _parse_nearby_images(response, nametomatch, matchfilter, self.matcher)
+
+    async def get_page_match(
+        self,
+        keyword: str,
+        searchlat: float,
+        searchlon: float,
+        bestmatch: bool = False,
+        maxdistance=30,
+        name_match_greater=0,
+    ) -> dict:
+        """
+
+        Searches for all geolocated wiki pages containing given keyword.
+        See WikiExtractor.get_page_match
+
+        """
+        self._get_session()
+        query = query_by_string(keyword.lower(), limit=3)
+        search_results = await self.api.get_data(query)
+        return _parse_page_matches(
+            search_results,
+            keyword,
+            searchlat,
+            searchlon,
+            bestmatch,
+            maxdistance,
+            name_match_greater,
+            self.matcher,
+        )
@@ -0,0 +1,274 @@
+"""Command line interface, run wikigeo --help"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Iterable, Iterator, List, Optional, TextIO
+from wikigeo.wikimultisearch import ConcurrentSearcher, _iter_bounded
+from wikigeo.wikisource.cache import ResponseCache
+from wikigeo.wikisource.errors import WikiError
+from wikigeo.wikisource.metrics import PrometheusMetrics
+from wikigeo.wikisource.ratelimit import RateLimiter
+from wikigeo.wikisource.wikiapi import (
+    query_by_string,
+    query_commons_nearby,
+    query_nearby,
+)
+from wikigeo.wikisource.wikitext import page_url
+
+
+def _nearby(wiki, item: dict) -> dict:
+    pages = wiki.get_nearby_pages(
+        item["lat"], item["lon"], item.get("limit", 4), item.get("radius", 10000)
+    )
+    return {"coords": [item["lat"], item["lon"]], "result": pages}
+
+
+def _match(wiki, item: dict) -> dict:
+    matches = wiki.get_page_match(
+        item["name"],
+        item["lat"],
+        item["lon"],
+        item.get("bestmatch", False),
+        item.get("maxdistance", 30),
+        item.get("name_match_greater", 0),
+    )
+    return {"keyword": item["name"], "result": matches["page_matches"]}
+
+
+def _images(wiki, item: dict) -> dict:
+    images = wiki.get_nearby_images(
+        item["lat"],
+        item["lon"],
+        item.get("radius", 10000),
+        item.get("name", False),
+        item.get("matchfilter", False),
+        item.get("limit", 5),
+    )
+    return {"coords": [item["lat"], item["lon"]], "images": list(images.values())}
+
+
+def _text(wiki, item: dict) -> dict:
+    return wiki.get_page_text(item["title"], item.get("limit", False))
+
+
+def _dry_nearby(item: dict) -> dict:
+    return query_nearby(
+        item["lat"], item["lon"], item.get("limit", 4), item.get("radius", 10000)
+    )
+
+
+def _dry_match(item: dict) -> dict:
+    return query_by_string(item["name"].lower(), limit=3)
+
+
+def _dry_images(item: dict) -> dict:
+    return query_commons_nearby(
+        item["lat"], item["lon"], item.get("radius", 10000), item.get("limit", 5)
+    )
+
+
+def _dry_text(item: dict, language: str) -> dict:
+    return {"url": page_url(item["title"], language)}
+
+
+COMMANDS = {
+    "nearby": (_nearby, _dry_nearby),
+    "match": (_match, _dry_match),
+    "images": (_images, _dry_images),
+    "text": (_text, _dry_text),
+}
+
+
+def _single_item(args) -> Optional[dict]:
+    """query given by arguments rather than stdin, or None"""
+    fields = {
+        "nearby": ("lat", "lon", "limit", "radius"),
+        "match": ("name", "lat", "lon", "bestmatch", "maxdistance"),
+        "images": ("lat", "lon", "name", "radius", "matchfilter", "limit"),
+        "text": ("title", "limit"),
+    }[args.command]
+    item = {
+        field: getattr(args, field)
+        for field in fields
+        if getattr(args, field, None) is not None
+    }
+    if "title" in item or "lat" in item:
+        return item
+    return None
+
+
+def read_items(lines: Iterable[str]) -> Iterator[dict]:
+    """queries from newline delimited json, skipping blank lines"""
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _timed(function, wiki, item: dict):
+    """runs a command on one item, returning its output and seconds taken.
+    Failed requests and items with missing or invalid fields give an error output"""
+    start = time.perf_counter()
+    try:
+        output = function(wiki, item)
+    except (WikiError, json.JSONDecodeError, KeyError, ValueError) as error:
+        output = {"input": item, "error": str(error)}
+    return output, time.perf_counter() - start
+
+
+def summary(latencies: List[float], seconds: float, cache=None) -> dict:
+    """throughput, latency percentiles in milliseconds and cache hits of a run"""
+    result = {
+        "items": len(latencies),
+        "seconds": round(seconds, 3),
+        "items_per_second": round(len(latencies) / seconds, 2) if seconds else 0.0,
+    }
+    if latencies:
+        import numpy as np
+
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        result.update(
+            {
+                "p50_ms": round(float(p50), 1),
+                "p95_ms": round(float(p95), 1),
+                "p99_ms": round(float(p99), 1),
+            }
+        )
+    if cache is not None:
+        result.update(cache.stats())
+    return result
+
+
+def run(args, stdin: TextIO, stdout: TextIO, stderr: TextIO) -> dict:
+    """runs a parsed command, writing ndjson results to stdout and the summary to stderr"""
+    item = _single_item(args)
+    items = [item] if item is not None else read_items(stdin)
+    function, dry_function = COMMANDS[args.command]
+    if args.dry_run:
+        count = 0
+        for item in items:
+            if args.command == "text":
+                query = dry_function(item, args.language)
+            else:
+                query = dry_function(item)
+            stdout.write(json.dumps({"input": item, "query": query}) + "\n")
+            count += 1
+        return {"items": count}
+
+    cache = ResponseCache(path=args.cache) if args.cache else None
+    ratelimiter = RateLimiter(rate=args.rate or None, maxconcurrent=args.concurrency)
+    metrics = PrometheusMetrics() if args.metrics else None
+    searcher = ConcurrentSearcher(
+        args.language,
+        args.user,
+        cache=cache,
+        ratelimiter=ratelimiter,
+        metrics=metrics,
+    )
+    tasks = (
+        (_timed, (function, searcher.wiki, item), lambda out: out) for item in items
+    )
+    latencies = []
+    start = time.perf_counter()
+    for output, seconds in _iter_bounded(tasks, args.concurrency, args.ordered):
+        latencies.append(seconds)
+        stdout.write(json.dumps(output) + "\n")
+        stdout.flush()
+    result = summary(latencies, time.perf_counter() - start, cache)
+    if cache is not None:
+        cache.flush()
+    if metrics is not None:
+        with open(args.metrics, "w") as file:
+            file.write(metrics.render())
+    if not args.quiet:
+        stderr.write(json.dumps(result) + "\n")
+    return result
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """arguments of the wikigeo command"""
+    parser = argparse.ArgumentParser(
+        prog="wikigeo",
+        description="Search Wikipedia and Wikimedia Commons by location. "
+        "Give a single query with the options below, or newline delimited json "
+        'queries on stdin (e.g. {"lat": 51.43, "lon": -0.51}). '
+        "Results are written to stdout as newline delimited json, "
+        "with a summary of the run on stderr.",
+    )
+    parser.add_argument(
+        "--user",
+        default=os.environ.get("WIKIGEO_USER"),
+        help="user agent details, or set WIKIGEO_USER",
+    )
+    parser.add_argument("--language", default="en")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="max requests in flight"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=10, help="max requests per second, 0 for no limit"
+    )
+    parser.add_argument("--cache", default=None, help="sqlite file to cache responses")
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="file to write request timings, sizes and retries to, "
+        "in the prometheus text format",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="write the queries that would be sent without sending them",
+    )
+    parser.add_argument(
+        "--ordered", action="store_true", help="write results in input order"
+    )
+    parser.add_argument("--quiet", action="store_true", help="don't write the summary")
+    parser.add_argument(
+        "--verbose", action="store_true", help="log each request to stderr"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    nearby = commands.add_parser("nearby", help="pages near a point")
+    nearby.add_argument("--lat", type=float)
+    nearby.add_argument("--lon", type=float)
+    nearby.add_argument("--limit", type=int)
+    nearby.add_argument("--radius", type=int, help="metres, max 10000")
+
+    match = commands.add_parser(
+        "match", help="pages matching a place name near a point"
+    )
+    match.add_argument("name", nargs="?")
+    match.add_argument("--lat", type=float)
+    match.add_argument("--lon", type=float)
+    match.add_argument("--bestmatch", choices=["name", "distance"])
+    match.add_argument("--maxdistance", type=float, help="km")
+
+    images = commands.add_parser("images", help="commons images near a point")
+    images.add_argument("--lat", type=float)
+    images.add_argument("--lon", type=float)
+    images.add_argument("--name", help="name to rate images against")
+    images.add_argument("--radius", type=int, help="metres, max 10000")
+    images.add_argument("--matchfilter", type=int)
+    images.add_argument("--limit", type=int, help="max images, up to 500")
+
+    text = commands.add_parser("text", help="text of a page")
+    text.add_argument("title", nargs="?")
+    text.add_argument("--limit", type=int, help="max characters")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """console entry point"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+    if not args.user and not args.dry_run:
+        parser.error("--user or the WIKIGEO_USER environment variable is required")
+    run(args, sys.stdin, sys.stdout, sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Planning geosearches to cover large areas"""
+import math
+from typing import List, Tuple
+
+# metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEGREE_LAT = 110574
+METRES_PER_DEGREE_LON = 111320
+MIN_RADIUS = 10
+MAX_RADIUS = 10000
+
+
+def to_polygon(area) -> List[Tuple[float, float]]:
+    """converts a bounding box (south, west, north, east) or a list of (lat, lon)
+    points into a list of (lat, lon) polygon vertices"""
+    if len(area) == 4 and all(isinstance(value, (int, float)) for value in area):
+        south, west, north, east = area
+        if south > north or west > east:
+            raise ValueError("bounding box must be (south, west, north, east)")
+        return [(south, west), (south, east), (north, east), (north, west)]
+    if len(area) < 3:
+        raise ValueError("area must be a bounding box or a polygon of 3 or more points")
+    return [(float(lat), float(lon)) for lat, lon in area]
+
+
+def _local_xy(lat0: float, lon0: float, lat: float, lon: float) -> Tuple[float, float]:
+    """metres east and north of (lat0, lon0)"""
+    x = (lon - lon0) * METRES_PER_DEGREE_LON * math.cos(math.radians(lat0))
+    y = (lat - lat0) * METRES_PER_DEGREE_LAT
+    return x, y
+
+
+def contains_point(polygon: list, lat: float, lon: float) -> bool:
+    """ray casting point in polygon test"""
+    inside = False
+    j = len(polygon) - 1
+    for i, (lat_i, lon_i) in enumerate(polygon):
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+def _segment_distance(point: tuple, start: tuple, end: tuple) -> float:
+    """distance in metres from a point to a line segment, all in local x/y"""
+    px, py = point
+    ax, ay = start
+    bx, by = end
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    t = (
+        0.0
+        if length == 0
+        else max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length))
+    )
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def circle_intersects(
+    polygon: list, lat: float, lon: float, radiusmetres: float
+) -> bool:
+    """checks if a circle overlaps a polygon"""
+    if contains_point(polygon, lat, lon):
+        return True
+    local = [_local_xy(lat, lon, vlat, vlon) for vlat, vlon in polygon]
+    return any(
+        _segment_distance((0.0, 0.0), local[i - 1], local[i]) <= radiusmetres
+        for i in range(len(local))
+    )
+
+
+def hex_cover(area, radiusmetres: float = MAX_RADIUS) -> List[Tuple[float, float]]:
+    """centres of circles of the given radius that together cover the area.
+    Centres are laid out on a hexagonal grid, which needs the fewest circles
+    to cover a plane, and circles that don't touch the area are left out.
+
+    area: bounding box (south, west, north, east) or list of (lat, lon) points
+
+    returns list of (lat, lon) centres"""
+    polygon = to_polygon(area)
+    south = min(lat for lat, _ in polygon)
+    north = max(lat for lat, _ in polygon)
+    west = min(lon for _, lon in polygon)
+    east = max(lon for _, lon in polygon)
+
+    row_step = 1.5 * radiusmetres / METRES_PER_DEGREE_LAT
+    centres = []
+    row = 0
+    lat = south - row_step / 2
+    while lat <= north + row_step:
+        column_metres = math.sqrt(3) * radiusmetres
+        scale = METRES_PER_DEGREE_LON * max(math.cos(math.radians(lat)), 1e-6)
+        column_step = column_metres / scale
+        lon = west - (column_step / 2 if row % 2 else 0)
+        while lon <= east + column_step:
+            if circle_intersects(polygon, lat, lon, radiusmetres):
+                centres.append((lat, lon))
+            lon += column_step
+        lat += row_step
+        row += 1
+    return centres
+
+
+def subdivide(lat: float, lon: float, radiusmetres: float) -> List[Tuple[float, float]]:
+    """centres of seven circles of half the radius that cover the given circle"""
+    offset = radiusmetres * math.sqrt(3) / 2
+    centres = [(lat, lon)]
+    for angle in range(0, 360, 60):
+        north = offset * math.cos(math.radians(angle))
+        east = offset * math.sin(math.radians(angle))
+        centres.append(
+            (
+                lat + north / METRES_PER_DEGREE_LAT,
+                lon + east / (METRES_PER_DEGREE_LON * math.cos(math.radians(lat))),
+            )
+        )
+    return centres
@@ -0,0 +1,130 @@
+"""Distances between coordinates, for single pairs or whole arrays at once.
+numpy is imported by the array functions when first called, so single distances
+don't pay for importing it"""
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+EARTH_RADIUS_KM = 6378
+
+
+def km_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """haversine distance in km between two points"""
+    lat_a = math.radians(float(lat1))
+    lat_b = math.radians(float(lat2))
+    half_dlat = (lat_b - lat_a) / 2
+    half_dlon = math.radians(float(lon2) - float(lon1)) / 2
+    a = (
+        math.sin(half_dlat) ** 2
+        + math.cos(lat_a) * math.cos(lat_b) * math.sin(half_dlon) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def km_distance_matrix(query_lats, query_lons, lats, lons) -> np.ndarray:
+    """haversine distances in km between each query point and each candidate point.
+
+    query_lats, query_lons: sequences or arrays of the query points (or single floats)
+
+    lats, lons: sequences or arrays of the candidate points
+
+    returns array of shape (number of query points, number of candidates)"""
+    import numpy as np
+
+    query_lats = np.radians(np.atleast_1d(np.asarray(query_lats, dtype=float)))[:, None]
+    query_lons = np.radians(np.atleast_1d(np.asarray(query_lons, dtype=float)))[:, None]
+    lats = np.radians(np.atleast_1d(np.asarray(lats, dtype=float)))[None, :]
+    lons = np.radians(np.atleast_1d(np.asarray(lons, dtype=float)))[None, :]
+    a = (
+        np.sin((lats - query_lats) / 2) ** 2
+        + np.cos(query_lats) * np.cos(lats) * np.sin((lons - query_lons) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def rank_by_distance(
+    query_lats,
+    query_lons,
+    lats,
+    lons,
+    maxdistance: float = 30,
+    limit: Optional[int] = None,
+    chunksize: int = 256,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """finds the candidates within maxdistance km of each query point, closest first.
+
+    limit: optional max number of candidates kept for each query point
+
+    chunksize: number of query points whose distances are held in memory at once
+
+    returns a list of (candidate indexes, distances) for each query point"""
+    import numpy as np
+
+    query_lats = np.atleast_1d(np.asarray(query_lats, dtype=float))
+    query_lons = np.atleast_1d(np.asarray(query_lons, dtype=float))
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    ranked = []
+    for start in range(0, len(query_lats), chunksize):
+        distances = km_distance_matrix(
+            query_lats[start : start + chunksize],
+            query_lons[start : start + chunksize],
+            lats,
+            lons,
+        )
+        for row in distances:
+            indexes = np.flatnonzero(row < maxdistance)
+            order = np.argsort(row[indexes], kind="stable")
+            if limit is not None:
+                order = order[:limit]
+            ranked.append((indexes[order], row[indexes[order]]))
+    return ranked
+
+
+def _page_coordinates(page: dict) -> Tuple[float, float]:
+    """coordinates of a page result from any of the WikiExtractor methods"""
+    coordinates = page.get("coordinates")
+    if isinstance(coordinates, dict):
+        return coordinates["lat"], coordinates["lon"]
+    return page["lat"], page["lon"]
+
+
+def filter_pages_by_distance(
+    pages: list,
+    searchlat: float,
+    searchlon: float,
+    maxdistance: float = 30,
+    limit: Optional[int] = None,
+) -> list:
+    """filters page results to those within maxdistance km of the search point,
+    closest first, with the distance added to each page.
+    pages without coordinates are left out.
+
+    pages: list of page dictionaries with either 'lat' and 'lon' keys
+    or a 'coordinates' dictionary, e.g. results of get_nearby_pages or get_page_match"""
+    located = []
+    lats = []
+    lons = []
+    for page in pages:
+        try:
+            lat, lon = _page_coordinates(page)
+        except (KeyError, TypeError):
+            continue
+        if lat is None or lon is None:
+            continue
+        located.append(page)
+        lats.append(lat)
+        lons.append(lon)
+    if not located:
+        return []
+    ((indexes, distances),) = rank_by_distance(
+        searchlat, searchlon, lats, lons, maxdistance, limit
+    )
+    return [
+        dict(located[index], distance=float(distance))
+        for index, distance in zip(indexes, distances)
+    ]
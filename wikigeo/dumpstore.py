@@ -0,0 +1,223 @@
+"""Local database of geotagged pages built from Wikipedia dumps, for searching without the API"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from typing import Optional
+from wikigeo.coverage import METRES_PER_DEGREE_LAT, METRES_PER_DEGREE_LON
+from wikigeo.distance import km_distance_matrix
+from wikigeo.wikisource.dumps import (
+    geo_tag_rows,
+    index_rows,
+    iter_inserts,
+    iter_line_chunks,
+    map_chunks,
+    page_prop_rows,
+    read_stream,
+    wikitext_to_text,
+)
+from wikigeo.wikisource.errors import APIError
+
+COMMONS_URL = "https://upload.wikimedia.org/wikipedia/commons/"
+COMMONS_THUMB_URL = COMMONS_URL + "thumb/"
+
+
+def _thumbnail(filename: str) -> str:
+    """url of a thumbnail of a commons image, as given by the pageimages API"""
+    name = filename.replace(" ", "_")
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f"{COMMONS_THUMB_URL}{digest[0]}/{digest[:2]}/{name}/50px-{name}"
+
+
+def _original(filename: str) -> str:
+    """url of a commons image, as given by the pageimages API"""
+    name = filename.replace(" ", "_")
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f"{COMMONS_URL}{digest[0]}/{digest[:2]}/{name}"
+
+
+class DumpStore:
+    """sqlite database of geotagged pages with their coordinates, short description,
+    image and position in a multistream articles dump, see build_dump_store.
+
+    Page text isn't copied into the database, it is read from the articles dump
+    when asked for by seeking to the page's stream.
+
+    path: sqlite file of the database"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (pageid INTEGER PRIMARY KEY, title TEXT, "
+            "lat REAL, lon REAL, description TEXT, image TEXT, offset INTEGER)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def _meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    @property
+    def articles(self) -> Optional[str]:
+        """path of the multistream articles dump text is read from"""
+        return self._meta("articles")
+
+    def _records(self, rows) -> dict:
+        """shapes rows into results like those of the API, keyed on page id"""
+        records = {}
+        for pageid, title, lat, lon, description, image in rows:
+            record = {
+                "pageid": pageid,
+                "title": title,
+                "coordinates": [{"lat": lat, "lon": lon}],
+            }
+            if description is not None:
+                record["terms"] = {"description": [description]}
+            if image is not None:
+                record["thumbnail"] = {"source": _thumbnail(image)}
+                record["original"] = {"source": _original(image)}
+            records[str(pageid)] = record
+        return records
+
+    def _around(
+        self, lat: float, lon: float, radiusmeters: float, where: str = "", params=()
+    ):
+        """rows within a bounding box around a point, with their distance in km"""
+        dlat = radiusmeters / METRES_PER_DEGREE_LAT
+        dlon = radiusmeters / (
+            METRES_PER_DEGREE_LON * max(math.cos(math.radians(lat)), 1e-6)
+        )
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT pageid, title, lat, lon, description, image FROM pages "
+                "WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? "
+                "AND title IS NOT NULL" + where,
+                (lat - dlat, lat + dlat, lon - dlon, lon + dlon, *params),
+            ).fetchall()
+        if not rows:
+            return []
+        distances = km_distance_matrix(
+            lat, lon, [row[2] for row in rows], [row[3] for row in rows]
+        )[0]
+        found = [
+            (float(distance), row)
+            for distance, row in zip(distances, rows)
+            if distance * 1000 <= radiusmeters
+        ]
+        found.sort(key=lambda item: item[0])
+        return found
+
+    def nearby(self, lat: float, lon: float, limit: int, radiusmeters: float) -> dict:
+        """pages within radiusmeters of a point, closest first, shaped like
+        the results of query_nearby"""
+        found = self._around(lat, lon, radiusmeters)[:limit]
+        return self._records(row for _, row in found)
+
+    def search(self, keyword: str, lat: float, lon: float, maxdistance: float) -> dict:
+        """pages with titles containing keyword within maxdistance km of a point,
+        shaped like the results of query_by_string"""
+        pattern = "%" + keyword.replace("%", "").replace("_", " ") + "%"
+        found = self._around(
+            lat, lon, maxdistance * 1000, " AND title LIKE ?", (pattern,)
+        )
+        return self._records(row for _, row in found)
+
+    def page_text(self, pagetitle: str, char_limit: Optional[int] = None) -> dict:
+        """text of a page read from the articles dump, shaped like scrape_page_text.
+        raises APIError for pages that aren't in the store"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pageid, offset FROM pages WHERE title = ?",
+                (pagetitle.replace("_", " "),),
+            ).fetchone()
+        if row is None or row[1] is None or self.articles is None:
+            raise APIError(
+                f"page {pagetitle} is not in the dump store", "missingtitle"
+            )
+        pageid, offset = row
+        wikitext = read_stream(self.articles, offset).get(pageid, "")
+        return {"title": pagetitle, "text": wikitext_to_text(wikitext, char_limit)}
+
+
+def build_dump_store(
+    path: str,
+    geo_tags: str,
+    index: str,
+    page_props: Optional[str] = None,
+    articles: Optional[str] = None,
+    processes: Optional[int] = None,
+    chunksize: int = 10000,
+) -> DumpStore:
+    """builds a DumpStore from Wikipedia dumps, streaming each dump so memory use
+    doesn't grow with the size of the dumps. Statements and index lines are parsed
+    in chunks across processes and written to the database in batches.
+
+    path: sqlite file to create the store in
+
+    geo_tags: geo_tags sql dump (e.g. enwiki-latest-geo_tags.sql.gz)
+
+    index: multistream index (e.g. enwiki-latest-pages-articles-multistream-index.txt.bz2)
+
+    page_props: optional page_props sql dump for short descriptions and images
+
+    articles: optional multistream articles dump
+    (e.g. enwiki-latest-pages-articles-multistream.xml.bz2) to read page text from
+
+    processes: number of worker processes, None for one per core
+
+    chunksize: number of index lines parsed at once"""
+    store = DumpStore(path)
+    conn = store._conn
+    with store._lock:
+        for rows in map_chunks(geo_tag_rows, iter_inserts(geo_tags), processes):
+            conn.executemany(
+                "INSERT OR REPLACE INTO pages (pageid, lat, lon) VALUES (?, ?, ?)", rows
+            )
+            conn.commit()
+
+        if page_props is not None:
+            for rows in map_chunks(page_prop_rows, iter_inserts(page_props), processes):
+                for column in ("description", "image"):
+                    conn.executemany(
+                        f"UPDATE pages SET {column} = ? WHERE pageid = ?",
+                        [
+                            (value, pageid)
+                            for pageid, prop, value in rows
+                            if prop == column
+                        ],
+                    )
+                conn.commit()
+
+        chunks = iter_line_chunks(index, chunksize)
+        for rows in map_chunks(index_rows, chunks, processes):
+            conn.executemany(
+                "UPDATE pages SET offset = ?, title = ? WHERE pageid = ?",
+                [(offset, title, pageid) for pageid, offset, title in rows],
+            )
+            conn.commit()
+
+        # geo tags of pages missing from the articles dump, such as talk and user
+        # pages or pages deleted since, have no title
+        conn.execute("DELETE FROM pages WHERE title IS NULL")
+        conn.execute("CREATE INDEX IF NOT EXISTS pages_lat ON pages (lat, lon)")
+        conn.execute("CREATE INDEX IF NOT EXISTS pages_title ON pages (title)")
+        if articles is not None:
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('articles', ?)",
+                (os.path.abspath(articles),),
+            )
+        conn.commit()
+    return store
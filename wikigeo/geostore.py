@@ -0,0 +1,279 @@
+"""Local store of fetched pages for answering nearby searches without the API"""
+import heapq
+import json
+import math
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+from wikigeo.distance import EARTH_RADIUS_KM, km_distance
+
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+LEAF_SIZE = 16
+# pages added since the tree was built are searched directly until there are
+# more than this, or a quarter of the pages in the tree
+MERGE_MIN = 1024
+# degrees of latitude and longitude of each grid cell searched circles are kept in
+COVER_CELL = 0.1
+
+
+def _unit_vectors(lats, lons) -> np.ndarray:
+    """points on the unit sphere, where straight line distance
+    increases with distance over the surface"""
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    return np.stack(
+        [np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)],
+        axis=-1,
+    )
+
+
+def _chord(metres: float) -> float:
+    """straight line distance on the unit sphere for a distance in metres"""
+    return 2 * math.sin(min(math.pi, metres / EARTH_RADIUS_M) / 2)
+
+
+def _metres(chord: float) -> float:
+    """distance in metres for a straight line distance on the unit sphere"""
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2))
+
+
+def _cell(lat: float, lon: float) -> Tuple[int, int]:
+    """grid cell a point is in"""
+    return (
+        math.floor(lat / COVER_CELL),
+        math.floor(lon / COVER_CELL) % round(360 / COVER_CELL),
+    )
+
+
+def _cells(lat: float, lon: float, radiusmeters: float) -> List[Tuple[int, int]]:
+    """grid cells touched by a circle, using its bounding box with a margin"""
+    latspan = radiusmeters / METRES_PER_DEGREE * 1.1
+    south, north = max(-90.0, lat - latspan), min(90.0, lat + latspan)
+    coslat = max(math.cos(math.radians(max(abs(south), abs(north)))), 1e-9)
+    lonspan = min(180.0, latspan / coslat)
+    rows = range(math.floor(south / COVER_CELL), math.floor(north / COVER_CELL) + 1)
+    columns = round(360 / COVER_CELL)
+    first = math.floor((lon - lonspan) / COVER_CELL)
+    last = min(math.floor((lon + lonspan) / COVER_CELL), first + columns - 1)
+    return [
+        (row, column % columns) for row in rows for column in range(first, last + 1)
+    ]
+
+
+def _closest(
+    points: np.ndarray,
+    point: np.ndarray,
+    offset: int,
+    k: Optional[int] = None,
+    chord: Optional[float] = None,
+) -> List[Tuple[float, int]]:
+    """(distance, offset + index) of points within chord, or the k closest,
+    found by checking every point"""
+    distances = np.linalg.norm(points - point, axis=1)
+    if chord is not None:
+        indexes = np.flatnonzero(distances <= chord)
+    else:
+        indexes = np.argsort(distances, kind="stable")[:k]
+    return [(float(distances[i]), offset + int(i)) for i in indexes]
+
+
+class KDTree:
+    """KD-tree of points on the unit sphere for radius and nearest neighbour queries"""
+
+    def __init__(self, points: np.ndarray):
+        self.points = points
+        self.root = self._build(np.arange(len(points))) if len(points) else None
+
+    def _build(self, indexes: np.ndarray):
+        if len(indexes) <= LEAF_SIZE:
+            return indexes
+        points = self.points[indexes]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        order = np.argsort(points[:, axis], kind="stable")
+        middle = len(order) // 2
+        split = float(points[order[middle], axis])
+        return (
+            axis,
+            split,
+            self._build(indexes[order[:middle]]),
+            self._build(indexes[order[middle:]]),
+        )
+
+    def within(self, point: np.ndarray, chord: float) -> List[Tuple[float, int]]:
+        """(distance, index) of all points within the chord distance of point"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            if isinstance(node, np.ndarray):
+                distances = np.linalg.norm(self.points[node] - point, axis=1)
+                close = distances <= chord
+                found.extend(zip(distances[close].tolist(), node[close].tolist()))
+                continue
+            axis, split, left, right = node
+            if point[axis] - chord <= split:
+                stack.append(left)
+            if point[axis] + chord >= split:
+                stack.append(right)
+        found.sort()
+        return found
+
+    def nearest(self, point: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        """(distance, index) of the k closest points to point"""
+        best = []  # max heap of (-distance, index)
+        queue = [(0.0, 0, self.root)] if self.root is not None else []
+        counter = 1
+        while queue:
+            bound, _, node = heapq.heappop(queue)
+            if len(best) == k and bound > -best[0][0]:
+                break
+            if isinstance(node, np.ndarray):
+                distances = np.linalg.norm(self.points[node] - point, axis=1)
+                for distance, index in zip(distances.tolist(), node.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, index))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, index))
+                continue
+            axis, split, left, right = node
+            gap = point[axis] - split
+            near, far = (left, right) if gap < 0 else (right, left)
+            heapq.heappush(queue, (bound, counter, near))
+            heapq.heappush(queue, (max(bound, abs(gap)), counter + 1, far))
+            counter += 2
+        return sorted((-distance, index) for distance, index in best)
+
+
+class GeoStore:
+    """local store of page results from get_nearby_pages, indexed by location.
+
+    Also keeps the circles that have been fully searched, so a nearby search inside
+    them can be answered locally without missing any pages.
+
+    Pages added after the KD-tree is built are kept in a small buffer that is
+    searched directly, and merged into a new tree once it grows past a quarter of
+    the tree, so adding pages between lookups doesn't rebuild the tree each time.
+    Searched circles are kept in a grid of 0.1 degree cells.
+
+    path: optional json file the store is loaded from and saved to"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.pages = {}
+        self.covered = []
+        self._grid = {}
+        self._tree = None
+        self._titles = []
+        self._buffer = np.empty((0, 3))
+        self._positions = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+            except FileNotFoundError:
+                data = {}
+            for page in data.get("pages", []):
+                self.pages[page["title"]] = page
+            for circle in data.get("covered", []):
+                self._add_covered(*circle)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def save(self, path: Optional[str] = None):
+        """writes the pages and searched circles to a json file"""
+        path = path or self.path
+        with self._lock:
+            data = {"pages": list(self.pages.values()), "covered": self.covered}
+        with open(path, "w") as file:
+            json.dump(data, file)
+
+    def add_pages(self, pages: list):
+        """adds page results with 'title' and 'coordinates' keys"""
+        with self._lock:
+            added = []
+            for page in pages:
+                title = page["title"]
+                position = (page["coordinates"]["lat"], page["coordinates"]["lon"])
+                self.pages[title] = page
+                if self._tree is None:
+                    # the whole tree is built on the next lookup
+                    continue
+                known = self._positions.get(title)
+                if known is None:
+                    self._positions[title] = position
+                    added.append(position)
+                    self._titles.append(title)
+                elif known != position:
+                    # moved pages can't be taken out of the tree
+                    self._tree = None
+            if self._tree is not None and added:
+                lats, lons = zip(*added)
+                points = _unit_vectors(lats, lons).reshape(-1, 3)
+                self._buffer = np.concatenate([self._buffer, points])
+
+    def add_covered(self, lat: float, lon: float, radiusmeters: float):
+        """records that all pages within radiusmeters of lat, lon have been added"""
+        with self._lock:
+            self._add_covered(lat, lon, radiusmeters)
+
+    def _add_covered(self, lat: float, lon: float, radiusmeters: float):
+        circle = (lat, lon, radiusmeters)
+        self.covered.append(circle)
+        for cell in _cells(lat, lon, radiusmeters):
+            self._grid.setdefault(cell, []).append(circle)
+
+    def is_covered(self, lat: float, lon: float, radiusmeters: float) -> bool:
+        """checks if a circle lies inside a circle that has been fully searched"""
+        with self._lock:
+            # a circle holding this one holds its centre, so is in the centre's cell
+            covered = list(self._grid.get(_cell(lat, lon), ()))
+        return any(
+            # allowing a centimetre for rounding
+            km_distance(lat, lon, clat, clon) * 1000 + radiusmeters <= cradius + 0.01
+            for clat, clon, cradius in covered
+        )
+
+    def _index(self) -> Tuple[KDTree, list, np.ndarray]:
+        """tree of pages, titles of the pages in the tree then the buffer, and
+        points of pages added since the tree was built.
+        The tree is rebuilt with every page once the buffer is too large"""
+        with self._lock:
+            if self._tree is None or len(self._buffer) > max(
+                MERGE_MIN, len(self._tree.points) // 4
+            ):
+                titles = list(self.pages)
+                coordinates = [self.pages[title]["coordinates"] for title in titles]
+                lats = [coordinate["lat"] for coordinate in coordinates]
+                lons = [coordinate["lon"] for coordinate in coordinates]
+                self._tree = KDTree(_unit_vectors(lats, lons).reshape(-1, 3))
+                self._titles = titles
+                self._buffer = np.empty((0, 3))
+                self._positions = dict(zip(titles, zip(lats, lons)))
+            return self._tree, self._titles, self._buffer
+
+    def within(
+        self, lat: float, lon: float, radiusmeters: float, limit: Optional[int] = None
+    ) -> List[Tuple[dict, float]]:
+        """(page, distance in metres) of pages within radiusmeters, closest first"""
+        tree, titles, buffer = self._index()
+        point, chord = _unit_vectors(lat, lon), _chord(radiusmeters)
+        found = tree.within(point, chord)
+        if len(buffer):
+            found = sorted(
+                found + _closest(buffer, point, len(tree.points), chord=chord)
+            )
+        if limit is not None:
+            found = found[:limit]
+        return [(self.pages[titles[index]], _metres(chord)) for chord, index in found]
+
+    def nearest(self, lat: float, lon: float, k: int) -> List[Tuple[dict, float]]:
+        """(page, distance in metres) of the k closest pages, closest first"""
+        tree, titles, buffer = self._index()
+        point = _unit_vectors(lat, lon)
+        found = tree.nearest(point, k)
+        if len(buffer):
+            found = sorted(found + _closest(buffer, point, len(tree.points), k=k))[:k]
+        return [(self.pages[titles[index]], _metres(chord)) for chord, index in found]
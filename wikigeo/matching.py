@@ -0,0 +1,90 @@
+"""Fuzzy matching of names against page and image titles"""
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import List, Sequence
+
+
+class NameMatcher:
+    """scores a name against many titles on the 0-100 scale used by fuzzywuzzy.
+
+    Names and titles are lowercased once per call, all titles are scored in one batch
+    and scores for repeated (name, title) pairs are remembered.
+
+    backend: 'fuzzywuzzy' (default), 'rapidfuzz' to score with rapidfuzz
+    (much faster, pip install rapidfuzz), or 'auto' to use rapidfuzz if installed.
+    rapidfuzz's partial_ratio finds the best matching part of a title differently,
+    so its scores can differ by several points from fuzzywuzzy's
+    (e.g. 'staines bridge' against 'staines moor' is 82 rather than 75), changing
+    which results pass a matchfilter
+
+    cachesize: max number of (name, title) scores remembered"""
+
+    def __init__(self, backend: str = "fuzzywuzzy", cachesize: int = 100000):
+        # looked for without importing it, so only the backend used is imported
+        installed = importlib.util.find_spec("rapidfuzz") is not None
+        if backend == "auto":
+            backend = "rapidfuzz" if installed else "fuzzywuzzy"
+        if backend == "rapidfuzz" and not installed:
+            raise ImportError(
+                "rapidfuzz must be installed to use the rapidfuzz backend"
+            )
+        if backend not in ("rapidfuzz", "fuzzywuzzy"):
+            raise ValueError(
+                "backend must be one of 'auto', 'rapidfuzz' or 'fuzzywuzzy'"
+            )
+        self.backend = backend
+        self.cachesize = cachesize
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ratios(self, name: str, titles: Sequence[str]) -> List[int]:
+        """fuzz.ratio of the name against each title, ignoring case"""
+        return self._score("ratio", name, titles)
+
+    def partial_ratios(self, name: str, titles: Sequence[str]) -> List[int]:
+        """fuzz.partial_ratio of the name against each title, ignoring case"""
+        return self._score("partial_ratio", name, titles)
+
+    def _score(self, scorer: str, name: str, titles: Sequence[str]) -> List[int]:
+        name = name.lower()
+        titles = [title.lower() for title in titles]
+        scores = [None] * len(titles)
+        missing = {}
+        with self._lock:
+            for i, title in enumerate(titles):
+                score = self._scores.get((scorer, name, title))
+                if score is None:
+                    missing.setdefault(title, []).append(i)
+                else:
+                    self._scores.move_to_end((scorer, name, title))
+                    scores[i] = score
+        if missing:
+            new_scores = self._batch(scorer, name, list(missing))
+            with self._lock:
+                for title, score in zip(missing, new_scores):
+                    for i in missing[title]:
+                        scores[i] = score
+                    self._scores[(scorer, name, title)] = score
+                while len(self._scores) > self.cachesize:
+                    self._scores.popitem(last=False)
+        return scores
+
+    def _batch(self, scorer: str, name: str, titles: List[str]) -> List[int]:
+        if self.backend == "rapidfuzz":
+            from rapidfuzz import fuzz, process
+
+            matrix = process.cdist([name], titles, scorer=getattr(fuzz, scorer))
+            return [int(round(score)) for score in matrix[0]]
+        from fuzzywuzzy import fuzz
+
+        score = getattr(fuzz, scorer)
+        return [score(name, title) for title in titles]
+
+    def clear(self):
+        """forgets remembered scores"""
+        with self._lock:
+            self._scores.clear()
+
+
+DEFAULT_MATCHER = NameMatcher()
@@ -0,0 +1,381 @@
+"""Enriching large files of (name, lat, lon) rows with page matches and nearby images,
+from python or the command line (python -m wikigeo.pipeline --help)"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import os
+import sqlite3
+from collections import deque
+from typing import Iterator, List, Optional, Sequence
+from wikigeo.dumpstore import DumpStore
+from wikigeo.wikimultisearch import ConcurrentSearcher, _iter_bounded
+from wikigeo.wikisource.cache import ResponseCache
+from wikigeo.wikisource.errors import WikiError
+from wikigeo.wikisource.ratelimit import RateLimiter
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+    parquet = None
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("match", "images")
+
+# state of each worker process, set by _init_worker
+_worker = {}
+
+
+def _require_pyarrow():
+    if parquet is None:
+        raise ImportError("pyarrow must be installed to read or write parquet files")
+
+
+def read_rows(
+    path: str,
+    chunksize: int = 1000,
+    columns: Sequence[str] = ("name", "lat", "lon"),
+    skip: int = 0,
+) -> Iterator[List[tuple]]:
+    """reads (row number, name, lat, lon) from a csv or parquet file in chunks.
+
+    columns: names of the name, lat and lon columns
+
+    skip: number of rows at the start to leave out, e.g. rows already done"""
+    namecol, latcol, loncol = columns
+    if path.endswith(".parquet"):
+        _require_pyarrow()
+        batches = (
+            batch.to_pylist()
+            for batch in parquet.ParquetFile(path).iter_batches(
+                batch_size=chunksize, columns=list(columns)
+            )
+        )
+    else:
+        batches = _csv_batches(path, chunksize)
+    number = 0
+    for batch in batches:
+        chunk = []
+        for row in batch:
+            if number >= skip:
+                chunk.append(
+                    (number, row[namecol], float(row[latcol]), float(row[loncol]))
+                )
+            number += 1
+        if chunk:
+            yield chunk
+
+
+def _csv_batches(path: str, chunksize: int) -> Iterator[List[dict]]:
+    with open(path, newline="", encoding="utf-8") as file:
+        batch = []
+        for row in csv.DictReader(file):
+            batch.append(row)
+            if len(batch) >= chunksize:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _init_worker(language: str, userinfo: str, options: dict):
+    """builds the searcher used by a worker process"""
+    cache = None
+    if options.get("cache"):
+        cache = ResponseCache(path=options["cache"])
+    ratelimiter = RateLimiter(
+        rate=options.get("rate"), maxconcurrent=options.get("window")
+    )
+    searcher = ConcurrentSearcher(
+        language, userinfo, cache=cache, ratelimiter=ratelimiter
+    )
+    if options.get("dumpstore"):
+        searcher.wiki.dumpstore = DumpStore(options["dumpstore"])
+    _worker["searcher"] = searcher
+    _worker["options"] = options
+
+
+def _enrich_row(row: tuple) -> dict:
+    """runs the tasks for one row, recording failed requests, unreadable responses
+    and a response cache still locked by another worker rather than raising them"""
+    number, name, lat, lon = row
+    options = _worker["options"]
+    wiki = _worker["searcher"].wiki
+    record = {"row": number, "name": name, "lat": lat, "lon": lon}
+    try:
+        if "match" in options["tasks"]:
+            record["match"] = wiki.get_page_match(
+                name,
+                lat,
+                lon,
+                options.get("bestmatch", False),
+                options.get("maxdistance", 30),
+                options.get("name_match_greater", 0),
+            )["page_matches"]
+        if "images" in options["tasks"]:
+            record["images"] = list(
+                wiki.get_nearby_images(
+                    lat,
+                    lon,
+                    options.get("radiusmetres", 10000),
+                    name,
+                    options.get("matchfilter", False),
+                ).values()
+            )
+    except (WikiError, json.JSONDecodeError, sqlite3.OperationalError) as error:
+        logger.warning("row %s failed: %s", number, error)
+        record["error"] = str(error)
+    return record
+
+
+def _enrich_chunk(chunk: List[tuple]) -> List[dict]:
+    """runs the rows of a chunk concurrently in threads, keeping their order"""
+    tasks = ((_enrich_row, (row,), lambda record: record) for row in chunk)
+    return list(_iter_bounded(tasks, _worker["options"].get("window", 10), True))
+
+
+class _Checkpoint:
+    """number of input rows written and the size of the output after them,
+    saved after each chunk so a job can resume after a crash"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.parts = 0
+        self.size = 0
+        if os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+            self.rows = state["rows"]
+            self.parts = state["parts"]
+            self.size = state["size"]
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({"rows": self.rows, "parts": self.parts, "size": self.size}, file)
+        os.replace(temporary, self.path)
+
+
+class _JSONLWriter:
+    """appends records to a jsonl file, cutting off anything written after the checkpoint"""
+
+    def __init__(self, path: str, checkpoint: _Checkpoint):
+        mode = "r+b" if checkpoint.size and os.path.exists(path) else "wb"
+        self.file = open(path, mode)
+        self.file.truncate(checkpoint.size)
+        self.file.seek(checkpoint.size)
+
+    def write(self, records: List[dict]) -> int:
+        for record in records:
+            self.file.write(json.dumps(record).encode() + b"\n")
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """writes each chunk of records as a part file in a parquet dataset folder.
+    results are stored as json strings so each part has the same schema"""
+
+    def __init__(self, path: str, checkpoint: _Checkpoint):
+        _require_pyarrow()
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.part = checkpoint.parts
+
+    def write(self, records: List[dict]) -> int:
+        columns = {
+            "row": [record["row"] for record in records],
+            "name": [record["name"] for record in records],
+            "lat": [record["lat"] for record in records],
+            "lon": [record["lon"] for record in records],
+        }
+        for key in ("match", "images", "error"):
+            columns[key] = [
+                None if record.get(key) is None else json.dumps(record[key])
+                for record in records
+            ]
+        parquet.write_table(
+            pyarrow.table(columns),
+            os.path.join(self.path, f"part-{self.part:05d}.parquet"),
+        )
+        self.part += 1
+        return 0
+
+    def close(self):
+        pass
+
+
+def enrich(
+    inputpath: str,
+    outputpath: str,
+    language: str,
+    userinfo: str,
+    tasks: Sequence[str] = TASKS,
+    processes: Optional[int] = None,
+    chunksize: int = 1000,
+    window: int = 10,
+    rate: Optional[float] = 10,
+    columns: Sequence[str] = ("name", "lat", "lon"),
+    checkpoint: Optional[str] = None,
+    cache: Optional[str] = None,
+    dumpstore: Optional[str] = None,
+    bestmatch="name",
+    maxdistance: float = 30,
+    name_match_greater: int = 0,
+    radiusmetres: int = 10000,
+    matchfilter=False,
+) -> int:
+    """runs get_page_match and/or get_nearby_images for every row of a file.
+
+    Rows are read in chunks which are shared out to a pool of processes, so name
+    matching and parsing run on all cores, and each process sends the requests for
+    its chunk from a pool of threads. Results are written in input order as each
+    chunk completes, and progress is saved to a checkpoint file, so a job that
+    stops part way resumes from the last written chunk when run again.
+
+    inputpath: csv or .parquet file with name, lat and lon columns
+
+    outputpath: .jsonl file, or a folder of parquet part files if it ends in .parquet
+    (pip install pyarrow for parquet)
+
+    tasks: any of 'match' and 'images'
+
+    processes: number of worker processes, None for one per core, 1 to run
+    in this process
+
+    chunksize: number of rows sent to a process at once
+
+    window: max number of requests in flight in each process
+
+    rate: max requests per second to each wiki, shared between the processes
+
+    columns: names of the name, lat and lon columns
+
+    checkpoint: file progress is saved to, by default outputpath + '.checkpoint'
+
+    cache: optional sqlite file responses are cached in (see ResponseCache), shared
+    by the worker processes
+
+    dumpstore: optional DumpStore file matches are searched for in, without requests
+
+    bestmatch, maxdistance, name_match_greater: see WikiExtractor.get_page_match
+
+    radiusmetres, matchfilter: see WikiExtractor.get_nearby_images
+
+    returns number of rows written by this run"""
+    unknown = set(tasks) - set(TASKS)
+    if unknown:
+        raise ValueError(f"unknown tasks {unknown}, tasks must be in {TASKS}")
+    workers = 1 if processes == 1 else processes or os.cpu_count() or 1
+    options = {
+        "tasks": tuple(tasks),
+        "window": window,
+        "rate": rate / workers if rate else None,
+        "cache": cache,
+        "dumpstore": dumpstore,
+        "bestmatch": bestmatch,
+        "maxdistance": maxdistance,
+        "name_match_greater": name_match_greater,
+        "radiusmetres": radiusmetres,
+        "matchfilter": matchfilter,
+    }
+    progress = _Checkpoint(checkpoint or outputpath + ".checkpoint")
+    if progress.rows:
+        logger.info("resuming after %s rows", progress.rows)
+    chunks = read_rows(inputpath, chunksize, columns, skip=progress.rows)
+    if outputpath.endswith(".parquet"):
+        writer = _ParquetWriter(outputpath, progress)
+    else:
+        writer = _JSONLWriter(outputpath, progress)
+    written = 0
+    try:
+        for records in _map_chunks(chunks, workers, language, userinfo, options):
+            progress.size = writer.write(records)
+            progress.rows = records[-1]["row"] + 1
+            progress.parts += 1
+            progress.save()
+            written += len(records)
+            logger.info("written %s rows", progress.rows)
+    finally:
+        writer.close()
+    return written
+
+
+def _map_chunks(chunks, workers, language, userinfo, options) -> Iterator[List[dict]]:
+    """enriches chunks in worker processes, in order, reading at most
+    two chunks per process ahead"""
+    if workers == 1:
+        _init_worker(language, userinfo, options)
+        yield from map(_enrich_chunk, chunks)
+        return
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(language, userinfo, options),
+    ) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_enrich_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main(argv: Optional[List[str]] = None):
+    """command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Enrich a csv or parquet file of (name, lat, lon) rows "
+        "with Wikipedia page matches and nearby Commons images"
+    )
+    parser.add_argument("input", help="csv or .parquet file")
+    parser.add_argument("output", help=".jsonl file or .parquet folder")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--user", required=True, help="user agent details")
+    parser.add_argument(
+        "--tasks", default="match,images", help="comma separated tasks to run"
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--chunksize", type=int, default=1000)
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=10)
+    parser.add_argument(
+        "--columns", default="name,lat,lon", help="names of the name, lat, lon columns"
+    )
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--cache", default=None, help="sqlite file to cache responses")
+    parser.add_argument("--dumpstore", default=None, help="DumpStore file to search")
+    parser.add_argument("--bestmatch", default="name", choices=["name", "distance"])
+    parser.add_argument("--maxdistance", type=float, default=30)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    written = enrich(
+        args.input,
+        args.output,
+        args.language,
+        args.user,
+        tasks=args.tasks.split(","),
+        processes=args.processes,
+        chunksize=args.chunksize,
+        window=args.window,
+        rate=args.rate,
+        columns=args.columns.split(","),
+        checkpoint=args.checkpoint,
+        cache=args.cache,
+        dumpstore=args.dumpstore,
+        bestmatch=args.bestmatch,
+        maxdistance=args.maxdistance,
+    )
+    print(f"{written} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""Compact records of search results.
+
+PageResult, PageMatch and ImageResult keep each result in slots rather than
+a dictionary, with to_dict() giving the dictionaries WikiExtractor returns by
+default. ResultBatch keeps many results of one kind as columns, with coordinates,
+distances and name matches packed into arrays of doubles that numpy, pandas and
+pyarrow can use without copying"""
+import math
+from array import array
+from typing import Iterable, Iterator, Optional
+
+
+class _Record:
+    """base of the result records, compared and shown by their fields"""
+
+    __slots__ = ()
+    # typecodes of fields kept in arrays by ResultBatch, other fields are kept in lists
+    _ARRAYS = {}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__
+        )
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{field}={getattr(self, field)!r}" for field in self.__slots__
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class PageResult(_Record):
+    """a page found near a point, see WikiExtractor.get_nearby_pages"""
+
+    __slots__ = ("title", "lat", "lon", "description", "label", "image", "pageid")
+    _ARRAYS = {"lat": "d", "lon": "d"}
+
+    def __init__(
+        self,
+        title: str,
+        lat: float,
+        lon: float,
+        description: Optional[list] = None,
+        label: Optional[list] = None,
+        image: Optional[str] = None,
+        pageid: Optional[int] = None,
+    ):
+        self.title = title
+        self.lat = lat
+        self.lon = lon
+        self.description = description
+        self.label = label
+        self.image = image
+        self.pageid = pageid
+
+    @classmethod
+    def from_dict(cls, page: dict) -> "PageResult":
+        """record of a page dictionary, e.g. from to_dict or a GeoStore"""
+        return cls(
+            page["title"],
+            page["coordinates"]["lat"],
+            page["coordinates"]["lon"],
+            page.get("description"),
+            page.get("label"),
+            page.get("image"),
+            page.get("pageid"),
+        )
+
+    def to_dict(self) -> dict:
+        """the page as a dictionary, with pageid if known"""
+        page = {
+            "title": self.title,
+            "description": self.description,
+            "coordinates": {"lat": self.lat, "lon": self.lon},
+            "label": self.label,
+            "image": self.image,
+        }
+        if self.pageid is not None:
+            page["pageid"] = self.pageid
+        return page
+
+
+class PageMatch(_Record):
+    """a page matching a name near a point, see WikiExtractor.get_page_match"""
+
+    __slots__ = (
+        "title",
+        "lat",
+        "lon",
+        "description",
+        "label",
+        "image",
+        "distance",
+        "name_match",
+    )
+    _ARRAYS = {"lat": "d", "lon": "d", "distance": "d", "name_match": "d"}
+
+    def __init__(
+        self,
+        title: str,
+        lat: float,
+        lon: float,
+        description: Optional[list] = None,
+        label: Optional[list] = None,
+        image: Optional[str] = None,
+        distance: Optional[float] = None,
+        name_match: Optional[float] = None,
+    ):
+        self.title = title
+        self.lat = lat
+        self.lon = lon
+        self.description = description
+        self.label = label
+        self.image = image
+        self.distance = distance
+        self.name_match = name_match
+
+    def to_dict(self) -> dict:
+        """the match as a dictionary"""
+        return {
+            "title": self.title,
+            "description": self.description,
+            "label": self.label,
+            "image": self.image,
+            "lat": self.lat,
+            "lon": self.lon,
+            "distance": self.distance,
+            "name match": self.name_match,
+        }
+
+
+class ImageResult(_Record):
+    """an image found near a point, see WikiExtractor.get_nearby_images.
+    index is the position of the image in the search results before any sorting"""
+
+    __slots__ = (
+        "index",
+        "title",
+        "lat",
+        "lon",
+        "image",
+        "url",
+        "author",
+        "license",
+        "description",
+        "name_match",
+    )
+    _ARRAYS = {"index": "q", "lat": "d", "lon": "d", "name_match": "d"}
+
+    def __init__(
+        self,
+        index: int,
+        title: str,
+        lat: float,
+        lon: float,
+        image: str = "",
+        url: str = "",
+        author: str = "",
+        license: str = "",
+        description: str = "",
+        name_match: Optional[float] = None,
+    ):
+        self.index = index
+        self.title = title
+        self.lat = lat
+        self.lon = lon
+        self.image = image
+        self.url = url
+        self.author = author
+        self.license = license
+        self.description = description
+        self.name_match = name_match
+
+    def to_dict(self) -> dict:
+        """the image as a dictionary, with a name match if it was rated"""
+        image = {
+            "index": self.index,
+            "image": self.image,
+            "title": self.title,
+            "url": self.url,
+            "lat": self.lat,
+            "lon": self.lon,
+            "author": self.author,
+            "license": self.license,
+            "description": self.description,
+        }
+        if self.name_match is not None:
+            image["name match"] = self.name_match
+        return image
+
+
+class ResultBatch:
+    """many results of one kind kept as columns rather than one object each.
+
+    Fields given in the record's _ARRAYS are packed into arrays, with missing
+    values as nan, and the others kept in lists. Rows are turned back into records
+    when read, e.g. batch[0] or iterating. The batch can't be added to while
+    a DataFrame or Table made from it is in use, as they share its arrays.
+
+    kind: record class of the results, e.g. PageResult
+
+    columns: dictionary of each field of kind to its values"""
+
+    def __init__(self, kind: type, columns: Optional[dict] = None):
+        self.kind = kind
+        self.columns = {}
+        for field in kind.__slots__:
+            typecode = kind._ARRAYS.get(field)
+            values = (columns or {}).get(field, ())
+            if typecode is None:
+                self.columns[field] = list(values)
+            else:
+                self.columns[field] = array(typecode, (_missing(v) for v in values))
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[_Record], kind: Optional[type] = None
+    ) -> "ResultBatch":
+        """batch holding the given records, all of kind (by default the first one's)"""
+        records = iter(records)
+        first = next(records, None)
+        if kind is None:
+            if first is None:
+                raise ValueError("kind must be given for a batch of no records")
+            kind = type(first)
+        batch = cls(kind)
+        if first is not None:
+            batch.append(first)
+        batch.extend(records)
+        return batch
+
+    def append(self, record: _Record):
+        """adds a record to the end of the batch"""
+        for field, values in self.columns.items():
+            value = getattr(record, field)
+            values.append(value if isinstance(values, list) else _missing(value))
+
+    def extend(self, records: Iterable[_Record]):
+        """adds records to the end of the batch"""
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return len(self.columns[self.kind.__slots__[0]])
+
+    def __getitem__(self, i: int) -> _Record:
+        return self.kind(
+            **{
+                field: _present(values[i]) if isinstance(values, array) else values[i]
+                for field, values in self.columns.items()
+            }
+        )
+
+    def __iter__(self) -> Iterator[_Record]:
+        return (self[i] for i in range(len(self)))
+
+    def column(self, field: str):
+        """values of a field, an array for numeric fields and a list otherwise"""
+        return self.columns[field]
+
+    def to_dicts(self) -> list:
+        """the results as a list of dictionaries, see the record's to_dict"""
+        return [record.to_dict() for record in self]
+
+    def to_pandas(self):
+        """the results as a pandas DataFrame with a column for each field.
+        Numeric columns are numpy arrays over the batch's arrays, without copying"""
+        try:
+            import numpy as np
+            import pandas
+        except ImportError:
+            raise ImportError("pandas must be installed to convert to a DataFrame")
+        return pandas.DataFrame(
+            {
+                field: (
+                    np.frombuffer(values, dtype=values.typecode)
+                    if isinstance(values, array)
+                    else values
+                )
+                for field, values in self.columns.items()
+            },
+            copy=False,
+        )
+
+    def to_arrow(self):
+        """the results as a pyarrow Table with a column for each field.
+        Numeric columns use the batch's arrays as their buffers, without copying"""
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow must be installed to convert to an arrow table")
+        types = {"d": pyarrow.float64(), "q": pyarrow.int64()}
+        arrays = {}
+        for field, values in self.columns.items():
+            if isinstance(values, array):
+                arrays[field] = pyarrow.Array.from_buffers(
+                    types[values.typecode],
+                    len(values),
+                    [None, pyarrow.py_buffer(values)],
+                )
+            else:
+                arrays[field] = pyarrow.array(values)
+        return pyarrow.table(arrays)
+
+
+def _missing(value) -> float:
+    """value to keep in an array, nan for None"""
+    return math.nan if value is None else value
+
+
+def _present(value):
+    """value read from an array, None for nan"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
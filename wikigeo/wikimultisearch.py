@@ -1,29 +1,131 @@
 from wikigeo.wikisearch import WikiExtractor
-from wikigeo.wikisource.wikitext import scrape_page_text
+from wikigeo.wikisource.errors import WikiError
+from wikigeo.wikisource.metrics import DEFAULT_METRICS, timed
+from wikigeo.wikisource.ratelimit import DEFAULT_LIMITER, RateLimiter
+import collections
 import concurrent.futures
-import time
+import copy
+import itertools
 import logging
 
+logger = logging.getLogger(__name__)
+
+
+def _iter_bounded(tasks, window, ordered):
+    """
+    
+    Runs tasks in a thread pool keeping at most window tasks in flight, yielding each output as it completes.
+
+    tasks: iterable of (function, args, shape) where shape(output) gives the result to yield
+
+    ordered: if True results are yielded in the order of tasks, holding at most window results back
+    
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=window) as executor:
+        pending = collections.deque() if ordered else set()
+        for function, args, shape in tasks:
+            future = executor.submit(lambda f=function, a=args, s=shape: s(f(*a)))
+            if(ordered):
+                pending.append(future)
+                if(len(pending) >= window):
+                    yield pending.popleft().result()
+            else:
+                pending.add(future)
+                if(len(pending) >= window):
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+        if(ordered):
+            while(pending):
+                yield pending.popleft().result()
+        else:
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
+
+
+def _capture(function):
+    """
+
+    Wraps function to return (result, None), or (None, error) if a request failed,
+    so one failed search doesn't abort the others in a batch.
+
+    """
+    def captured(*args):
+        try:
+            return function(*args), None
+        except WikiError as error:
+            logger.warning('search failed: %s', error)
+            return None, error
+    return captured
+
+
+def _with_error(output, error):
+    """adds the error of a failed search to its output"""
+    if(error is not None):
+        output['error'] = str(error)
+    return output
+
+
+def _map_unique(executor, function, *iterables):
+    """
+
+    Maps function over the arguments in iterables like executor.map, giving (result, error) for each
+    as _capture does, but calling function once for each distinct set of arguments.
+    Repeated searches get copies of the first one's result.
+
+    """
+    calls = list(zip(*iterables))
+    unique = list(dict.fromkeys(calls))
+    if(len(unique) < len(calls)):
+        logger.debug('searching %s distinct of %s searches', len(unique), len(calls))
+    results = dict(zip(unique, executor.map(_capture(function), *zip(*unique)))) if unique else {}
+    seen = set()
+    output = []
+    for call in calls:
+        result, error = results[call]
+        output.append((copy.deepcopy(result) if call in seen else result, error))
+        seen.add(call)
+    return output
+
+
 class ConcurrentSearcher(object):
 
     """
     
     Runs search methods with multiple sets of parameters concurrently.  
-    Keep max searches low so as not to request more than 50 pages in a minute (conservative estimate)
+    Requests are queued to keep within the rate limit for each wiki, so any number of searches can be given.
+    If a search fails with a WikiError (see wikigeo.wikisource.errors) the others still return;
+    its output has an 'error' key with the error message and None in place of the result.
+    Repeated searches within a call are only sent once, and identical searches running at the same time
+    in any searcher share one request (see WikipediaAPI singleflight).
+    See https://www.mediawiki.org/wiki/API:Etiquette#Request_limit for details
     
     """
 
-    def __init__(self, language, userinfo, maxlimit=True):
+    def __init__(self, language, userinfo, maxlimit=True, cache=None, ratelimiter=None, metrics=None):
         """
 
         for language code options: https://en.wikipedia.org/wiki/List_of_ISO_639-1_codes
         for info on user details see: https://www.mediawiki.org/wiki/API:Etiquette#The_User-Agent_header
 
+        maxlimit: if False requests are not rate limited
+
+        cache: optional ResponseCache shared by all searches
+
+        ratelimiter: optional RateLimiter, by default the limits are shared by all searchers in the process
+
+        metrics: optional Metrics that request, matching and call timings are reported to, see wikigeo.wikisource.metrics
+
         """
-        self.wiki = WikiExtractor(language, userinfo)
+        if(ratelimiter is None):
+            ratelimiter = DEFAULT_LIMITER if maxlimit else RateLimiter(rate=None, maxconcurrent=None)
+        self.ratelimiter = ratelimiter
+        self.metrics = metrics or DEFAULT_METRICS
+        self.wiki = WikiExtractor(language, userinfo, cache=cache, ratelimiter=ratelimiter, metrics=self.metrics)
         self.maxlimit = maxlimit
         self.language = language
     
+    @timed
     def multi_nearby_pages(self, coordpairs, limit=4, radiusmetres=10000):
         """
         
@@ -37,26 +139,23 @@ class ConcurrentSearcher(object):
         Results are outputted in the same order of the given coords.
 
         [{'coords': (lat, lon), 'result': [{result1}, {result2} ...]}, ...]
+
+        failed searches give {'coords': (lat, lon), 'result': None, 'error': message}
         
         """
-
-        if(self.maxlimit):
-            if(len(coordpairs) > 50):
-                raise Exception("""Making more than 50 parallel requests is not advised. 
-            See https://www.mediawiki.org/wiki/API:Etiquette#Request_limit for details
-            and https://phabricator.wikimedia.org/ for advice on api limits. 
-            To bypass add maxlimit=False as a parameter for ConcurrentSearcher""")
+        self.metrics.observe('call_items', len(coordpairs), method='ConcurrentSearcher.multi_nearby_pages')
 
         lats = [coordpair[0] for coordpair in coordpairs]
         lons = [coordpair[1] for coordpair in coordpairs]
         limit = [limit for coordpair in coordpairs]
         radiusmetres = [radiusmetres for coordpair in coordpairs]
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(self.wiki.get_nearby_pages, lats, lons, limit, radiusmetres)
-        output = [{'coords': coordpair, 'result': result} for coordpair, result in zip(coordpairs, results)]
+            results = _map_unique(executor, self.wiki.get_nearby_pages, lats, lons, limit, radiusmetres)
+        output = [_with_error({'coords': coordpair, 'result': result}, error) for coordpair, (result, error) in zip(coordpairs, results)]
         return output
         
 
+    @timed
     def multi_page_text(self, titles, textlen):
         """
         
@@ -69,25 +168,23 @@ class ConcurrentSearcher(object):
         returns a list of dictionaries of headers and text for each page
 
         [{'title': inputtedtitle, 'text': textresult}, ...]
+
+        failed searches give {'title': inputtedtitle, 'text': None, 'error': message}
         
         """
+        self.metrics.observe('call_items', len(titles), method='ConcurrentSearcher.multi_page_text')
 
-        if(self.maxlimit):
-            if(len(titles) > 50):
-                raise Exception("""Making more than 50 parallel requests is not advised. 
-            See https://www.mediawiki.org/wiki/API:Etiquette#Request_limit for details
-            and https://phabricator.wikimedia.org/ for advice on api limits. 
-            To bypass add maxlimit=False as a parameter for ConcurrentSearcher""")
-        
         if(not isinstance(textlen, int)):
             raise Exception('invalid textlen argument; must be one of False or an integer')
         textlens = [textlen for title in titles]
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(scrape_page_text, titles, textlens)
-        output = [result for result in results]
+            results = _map_unique(executor, self.wiki.get_page_text, titles, textlens)
+        output = [result if error is None else _with_error({'title': title, 'text': None}, error)
+                  for title, (result, error) in zip(titles, results)]
         return output
 
-    def multi_nearby_images(self, coordpairs, namestomatch=False, radiusmetres=10000, matchfilter=False):
+    @timed
+    def multi_nearby_images(self, coordpairs, namestomatch=False, radiusmetres=10000, matchfilter=False, limit=5):
         """
         
         Gets images nearby for each coord pair.
@@ -99,27 +196,26 @@ class ConcurrentSearcher(object):
         radiusmetres: an int max 10000, distance from coords to search (default 10000)
 
         matchfilter: either False or an int representing min name match value for results with a name to match (between 0 and 100)
+
+        limit: max number of images for each coord pair, up to 500 (default 5)
         
         returns list of dictionary of results
-        [{'coords: latlon, 'result': [result1, result 2, ...]}, ...]
+        [{'coords: latlon, 'images': {0: result1, 1: result2, ...}}, ...]
+
+        failed searches give {'coords': latlon, 'images': None, 'error': message}
 
         Notes: inputs of coords and names must in the same order to match and must be same length
         (if names are missing use False as placeholder)
         
         """
+        self.metrics.observe('call_items', len(coordpairs), method='ConcurrentSearcher.multi_nearby_images')
         
-        if(self.maxlimit):
-            if(len(coordpairs) > 50):
-                raise Exception("""Making more than 50 parallel requests is not advised. 
-            See https://www.mediawiki.org/wiki/API:Etiquette#Request_limit for details
-            and https://phabricator.wikimedia.org/ for advice on api limits. 
-            To bypass add maxlimit=False as a parameter for ConcurrentSearcher""")
-
         lats = [coordpair[0] for coordpair in coordpairs]
         lons = [coordpair[1] for coordpair in coordpairs]
         if(not namestomatch):
             namestomatch = [False for coordpair in coordpairs]
         radiusmetres = [radiusmetres for coordpair in coordpairs]
+        limits = [limit for coordpair in coordpairs]
         matchfilters = []
         for name in namestomatch:
             if(name):
@@ -128,10 +224,11 @@ class ConcurrentSearcher(object):
                 matchfilters.append(False)
 
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(self.wiki.get_nearby_images, lats, lons, radiusmetres, namestomatch, matchfilters)
-        output = [{'coords': coordpair, 'images': result} for coordpair, result in zip(coordpairs, results)]
+            results = _map_unique(executor, self.wiki.get_nearby_images, lats, lons, radiusmetres, namestomatch, matchfilters, limits)
+        output = [_with_error({'coords': coordpair, 'images': result}, error) for coordpair, (result, error) in zip(coordpairs, results)]
         return output
 
+    @timed
     def multi_page_match(self, searches, bestmatch=False, maxdistance=30, name_match_greater=0):
         """
         
@@ -157,24 +254,102 @@ class ConcurrentSearcher(object):
         
         [{'keyword': input, 'result': [{result1}, {result2}, ...]}, ...]
 
+        failed searches give {'keyword': input, 'result': None, 'error': message}
+
         """
+        self.metrics.observe('call_items', len(searches), method='ConcurrentSearcher.multi_page_match')
 
-        if(self.maxlimit):
-            if(len(searches) > 50):
-                raise Exception("""Making more than 50 parallel requests is not advised. 
-            See https://www.mediawiki.org/wiki/API:Etiquette#Request_limit for details
-            and https://phabricator.wikimedia.org/ for advice on api limits. 
-            To bypass add maxlimit=False as a parameter for ConcurrentSearcher""")
-        
         keywords = [search[0] for search in searches]
         lats = [search[1] for search in searches]
         lons = [search[2] for search in searches]
         bestmatch = [bestmatch for search in searches]
         maxdistance = [maxdistance for search in searches]
         name_match_greater = [name_match_greater for search in searches]
-        logging.debug(keywords)
+        logger.debug(keywords)
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            results = executor.map(self.wiki.get_page_match, keywords, lats, lons, bestmatch, maxdistance, name_match_greater)
-            print(list(results))
-        output = [{'keyword': keyword, 'result': result} for keyword, result in zip(keywords, results)]
+            results = _map_unique(executor, self.wiki.get_page_match, keywords, lats, lons, bestmatch, maxdistance, name_match_greater)
+        output = [_with_error({'keyword': keyword, 'result': result}, error) for keyword, (result, error) in zip(keywords, results)]
         return output
+
+    def iter_nearby_pages(self, coordpairs, limit=4, radiusmetres=10000, window=10, ordered=False):
+        """
+
+        Lazily gets nearby pages from any iterable of coordinates, e.g. a generator reading a file.
+        See multi_nearby_pages for the result format.
+
+        window: max number of requests in flight at once
+
+        ordered: if True results are yielded in the order of the given coords,
+        otherwise each result is yielded as soon as it completes
+
+        yields {'coords': (lat, lon), 'result': [{result1}, {result2} ...]}
+
+        """
+        tasks = (
+            (_capture(self.wiki.get_nearby_pages), (coordpair[0], coordpair[1], limit, radiusmetres),
+             lambda output, coordpair=coordpair: _with_error({'coords': coordpair, 'result': output[0]}, output[1]))
+            for coordpair in coordpairs
+        )
+        return _iter_bounded(tasks, window, ordered)
+
+    def iter_page_text(self, titles, textlen=False, window=10, ordered=False):
+        """
+
+        Lazily gets text from any iterable of page titles.
+        See multi_page_text for the result format.
+
+        window, ordered: see iter_nearby_pages
+
+        yields {'title': inputtedtitle, 'text': textresult}
+
+        """
+        if(textlen is not False and not isinstance(textlen, int)):
+            raise Exception('invalid textlen argument; must be one of False or an integer')
+        tasks = (
+            (_capture(self.wiki.get_page_text), (title, textlen),
+             lambda output, title=title: output[0] if output[1] is None else _with_error({'title': title, 'text': None}, output[1]))
+            for title in titles
+        )
+        return _iter_bounded(tasks, window, ordered)
+
+    def iter_nearby_images(self, coordpairs, namestomatch=False, radiusmetres=10000, matchfilter=False, window=10, ordered=False, limit=5):
+        """
+
+        Lazily gets images nearby each coord pair from any iterable of coordinates.
+        See multi_nearby_images for the result format.
+
+        namestomatch: optional iterable of names (or False) read alongside coordpairs
+
+        window, ordered: see iter_nearby_pages
+
+        limit: max number of images for each coord pair, see multi_nearby_images
+
+        yields {'coords: latlon, 'images': {0: result1, 1: result2, ...}}
+
+        """
+        if(not namestomatch):
+            namestomatch = itertools.repeat(False)
+        tasks = (
+            (_capture(self.wiki.get_nearby_images), (coordpair[0], coordpair[1], radiusmetres, name, matchfilter if name else False, limit),
+             lambda output, coordpair=coordpair: _with_error({'coords': coordpair, 'images': output[0]}, output[1]))
+            for coordpair, name in zip(coordpairs, namestomatch)
+        )
+        return _iter_bounded(tasks, window, ordered)
+
+    def iter_page_match(self, searches, bestmatch=False, maxdistance=30, name_match_greater=0, window=10, ordered=False):
+        """
+
+        Lazily gets suggested page matches from any iterable of (keyword, lat, lon) tuples.
+        See multi_page_match for the result format.
+
+        window, ordered: see iter_nearby_pages
+
+        yields {'keyword': input, 'result': [{result1}, {result2}, ...]}
+
+        """
+        tasks = (
+            (_capture(self.wiki.get_page_match), (search[0], search[1], search[2], bestmatch, maxdistance, name_match_greater),
+             lambda output, keyword=search[0]: _with_error({'keyword': keyword, 'result': output[0]}, output[1]))
+            for search in searches
+        )
+        return _iter_bounded(tasks, window, ordered)
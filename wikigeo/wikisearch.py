@@ -1,28 +1,303 @@
 """Processing data from Wikipedia APIs"""
+import collections
+import concurrent.futures
 import logging
-import math
-from fuzzywuzzy import fuzz
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional
+from wikigeo.coverage import (
+    MAX_RADIUS,
+    MIN_RADIUS,
+    circle_intersects,
+    hex_cover,
+    subdivide,
+    to_polygon,
+    contains_point,
+)
+from wikigeo.distance import km_distance, km_distance_matrix
+from wikigeo.matching import DEFAULT_MATCHER, NameMatcher
+from wikigeo.records import ImageResult, PageMatch, PageResult
 from wikigeo.wikisource.wikiapi import (
+    EXTRACTS_LIMIT,
     WikipediaAPI,
     query_nearby,
     query_by_string,
     query_commons_nearby,
+    query_by_titles,
+    query_last_revisions,
 )
+from wikigeo.wikisource.cache import ResponseCache
+from wikigeo.wikisource.errors import APIError, RequestError, WikiError
+from wikigeo.wikisource.metrics import DEFAULT_METRICS, Metrics, timed
+from wikigeo.wikisource.ratelimit import DEFAULT_LIMITER, RateLimiter
+from wikigeo.wikisource.sessions import DEFAULT_POOL, SessionPool
+from wikigeo.wikisource.singleflight import DEFAULT_FLIGHTS, SingleFlight
+from wikigeo.wikisource.textstore import PageTextStore
 from wikigeo.wikisource.wikitext import scrape_page_text
 
+if TYPE_CHECKING:
+    # only needed for annotations, so using the API doesn't import numpy
+    from wikigeo.dumpstore import DumpStore
+    from wikigeo.geostore import GeoStore
+
+logger = logging.getLogger(__name__)
+
 
 def _get_km_distance(lat1, lon1, lat2, lon2) -> float:
     """converts decimal distance into kms"""
+    return km_distance(lat1, lon1, lat2, lon2)
+
+
+def _nearby_page_records(response: dict) -> List[PageResult]:
+    """shapes geosearch results into page records"""
+    pages = []
+    for _, result in response.items():
+        page = PageResult(
+            result["title"],
+            result["coordinates"][0]["lat"],
+            result["coordinates"][0]["lon"],
+        )
+
+        terms = result.get("terms")
+        if terms is not None:
+            page.label = terms.get("label")
+            page.description = terms.get("description")
+
+        thumbnail = result.get("thumbnail")
+        if thumbnail is not None:
+            thumbnail = thumbnail["source"]
+            image = thumbnail.split("/")
+            image.pop(-1)
+            image.remove("thumb")
+            page.image = "/".join(image)
+
+        pages.append(page)
+
+    return pages
+
+
+def _parse_nearby_pages(response: dict) -> list:
+    """shapes geosearch results into page dictionaries"""
+    return [page.to_dict() for page in _nearby_page_records(response)]
+
+
+def _nearby_image_records(
+    response: dict,
+    nametomatch,
+    matchfilter,
+    matcher: NameMatcher = DEFAULT_MATCHER,
+    metrics: Metrics = DEFAULT_METRICS,
+) -> List[ImageResult]:
+    """shapes commons geosearch results into image records,
+    rated, sorted and filtered on name match if nametomatch is given"""
+    imagedata = []
+    for i, (_, image) in enumerate(response.items()):
+        image_result = ImageResult(
+            i,
+            image.get("title", ""),
+            image["coordinates"][0]["lat"],
+            image["coordinates"][0]["lon"],
+        )
+
+        image_info = image.get("imageinfo")
+        if image_info is not None:
+            image_result.image = image_info[0].get("url", "")
+            image_result.url = image_info[0].get("descriptionurl", "")
+
+            metadata = image_info[0].get("extmetadata", {})
+            if metadata is not None:
+                image_result.license = metadata.get("License", {}).get("value", "")
+                image_result.author = metadata.get("Attribution", {}).get("value", "")
+                image_result.description = metadata.get("ImageDescription", {}).get(
+                    "value", ""
+                )
+        imagedata.append(image_result)
+
+    logger.debug("got image data as %s", imagedata)
 
-    lat_a = float(lat1) * math.pi / 180
-    lng_a = float(lon1) * math.pi / 180
-    lat_b = float(lat2) * math.pi / 180
-    lng_b = float(lon2) * math.pi / 180
-    distance = 6378 * math.acos(
-        math.cos(lat_a) * math.cos(lat_b) * math.cos(lng_b - lng_a)
-        + math.sin(lat_a) * math.sin(lat_b)
+    if nametomatch and any(imagedata):
+        # sorting results by name match ratio
+        logger.debug("matching on name...")
+        with metrics.timer("match_seconds", scorer="partial_ratio"):
+            scores = matcher.partial_ratios(
+                nametomatch, [image.title for image in imagedata]
+            )
+        for image, score in zip(imagedata, scores):
+            image.name_match = score
+        imagedata.sort(key=lambda x: int(x.name_match), reverse=True)
+
+        if matchfilter and any(imagedata):
+            # filtering out matches below filter
+            imagedata = [image for image in imagedata if image.name_match > matchfilter]
+    return imagedata
+
+
+def _parse_nearby_images(
+    response: dict,
+    nametomatch,
+    matchfilter,
+    matcher: NameMatcher = DEFAULT_MATCHER,
+    metrics: Metrics = DEFAULT_METRICS,
+) -> dict:
+    """shapes commons geosearch results into image dictionaries keyed by their
+    position, rated, sorted and filtered on name match if nametomatch is given"""
+    images = _nearby_image_records(response, nametomatch, matchfilter, matcher, metrics)
+    return {i: image.to_dict() for i, image in enumerate(images)}
+
+
+def _page_match_records(
+    search_results: dict,
+    keyword: str,
+    searchlat: float,
+    searchlon: float,
+    bestmatch,
+    maxdistance,
+    name_match_greater,
+    matcher: NameMatcher = DEFAULT_MATCHER,
+    metrics: Metrics = DEFAULT_METRICS,
+):
+    """shapes search results into page match records filtered on distance and
+    name match, the best one alone if bestmatch is given"""
+    data = []
+    for _, info in search_results.items():
+        logger.debug("found %s", info["title"])
+        coordinates = info.get("coordinates")
+        if coordinates is None:
+            logger.debug("cannot find coords for %s", info["title"])
+            logger.debug("full result: %s", info)
+            continue
+
+        result = PageMatch(info["title"], coordinates[0]["lat"], coordinates[0]["lon"])
+
+        terms = info.get("terms")
+        if terms is not None:
+            result.description = terms.get("description")
+            result.label = terms.get("label")
+
+        result.image = info.get("original", {}).get("source")
+        data.append(result)
+
+    if data:
+        # measuring all distances and name matches at once
+        distances = km_distance_matrix(
+            searchlat,
+            searchlon,
+            [result.lat for result in data],
+            [result.lon for result in data],
+        )[0]
+        with metrics.timer("match_seconds", scorer="ratio"):
+            scores = matcher.ratios(keyword, [result.title for result in data])
+        for result, distance, score in zip(data, distances, scores):
+            result.distance = float(distance)
+            result.name_match = score
+
+    logger.debug("results with coords saved from wiki search: %s", len(data))
+    # filtering for relevant results
+    results = [
+        place
+        for place in data
+        if ((place.distance < maxdistance) and (place.name_match > name_match_greater))
+    ]
+    if any(results):
+        # getting top match if requested
+        if bestmatch == "name":
+            results.sort(key=lambda result: int(result.name_match), reverse=True)
+            logger.debug("wikis: %s", results)
+            results = results[0]
+        if bestmatch == "distance":
+            results.sort(key=(lambda result: abs(result.distance)))
+            logger.debug("wikis: %s", results)
+            results = results[0]
+    return results
+
+
+def _parse_page_matches(
+    search_results: dict,
+    keyword: str,
+    searchlat: float,
+    searchlon: float,
+    bestmatch,
+    maxdistance,
+    name_match_greater,
+    matcher: NameMatcher = DEFAULT_MATCHER,
+    metrics: Metrics = DEFAULT_METRICS,
+) -> dict:
+    """shapes search results into page matches filtered on distance and name match"""
+    results = _page_match_records(
+        search_results,
+        keyword,
+        searchlat,
+        searchlon,
+        bestmatch,
+        maxdistance,
+        name_match_greater,
+        matcher,
+        metrics,
     )
-    return distance
+    return {"page_matches": _match_dicts(results)}
+
+
+def _match_dicts(results):
+    """page match records as dictionaries, the best match alone or a list"""
+    if isinstance(results, PageMatch):
+        return results.to_dict()
+    return [result.to_dict() for result in results]
+
+
+def _chunk_titles(titles: Iterable[str], size: int = 50) -> list:
+    """splits unique titles into batches that fit in one request"""
+    unique = list(dict.fromkeys(titles))
+    return [unique[i : i + size] for i in range(0, len(unique), size)]
+
+
+def _resolve_title(title: str, aliases: dict) -> str:
+    """title of the page a given title leads to"""
+    # following normalisation then redirects
+    for _ in range(3):
+        title = aliases.get(title, title)
+    return title
+
+
+def _parse_title_pages(response: dict, aliases: dict, titles: list) -> list:
+    """shapes results of a batched title query into one dictionary per given title,
+    in the order given. pages that don't exist have a pagetitle of None"""
+    by_title = {page["title"]: page for page in response.values()}
+    pages = []
+    for title in titles:
+        result = by_title.get(_resolve_title(title, aliases), {})
+        page = {
+            "title": title,
+            "pagetitle": None,
+            "pageid": result.get("pageid"),
+            "description": None,
+            "coordinates": None,
+            "label": None,
+            "image": result.get("original", {}).get("source"),
+            "extract": result.get("extract"),
+        }
+        if result and "missing" not in result and "invalid" not in result:
+            page["pagetitle"] = result["title"]
+
+        terms = result.get("terms")
+        if terms is not None:
+            page["label"] = terms.get("label")
+            page["description"] = terms.get("description")
+
+        coordinates = result.get("coordinates")
+        if coordinates:
+            page["coordinates"] = {
+                "lat": coordinates[0]["lat"],
+                "lon": coordinates[0]["lon"],
+            }
+        pages.append(page)
+    return pages
+
+
+def _parse_revisions(response: dict, aliases: dict, titles: list) -> dict:
+    """latest revision id of each given title, None for pages that don't exist"""
+    by_title = {page["title"]: page for page in response.values()}
+    return {
+        title: by_title.get(_resolve_title(title, aliases), {}).get("lastrevid")
+        for title in titles
+    }
 
 
 class WikiExtractor:
@@ -30,14 +305,91 @@ class WikiExtractor:
 
     Search wikipedia and return specified information.
 
+    cache: optional ResponseCache used for all queries, see cache.stats() for savings
+
+    ratelimiter: RateLimiter for all requests, by default shared by all instances
+
+    geostore: optional GeoStore that nearby pages are added to and, where the area
+    has already been searched, answered from without sending a request
+
+    matcher: optional NameMatcher for rating name matches, by default shared by all
+    instances and using fuzzywuzzy. NameMatcher(backend='rapidfuzz') is much faster
+    but gives different partial ratio scores
+
+    sessionpool: SessionPool connections are taken from, by default shared by all
+    instances so connections to each wiki are reused
+
+    textstore: optional PageTextStore that scraped page text is kept in and,
+    where the page hasn't changed, reused from
+
+    dumpstore: optional DumpStore built from Wikipedia dumps. If given, nearby pages,
+    page matches and page text are found in the store without sending requests
+
+    metrics: Metrics that request, matching and call timings are reported to,
+    see wikigeo.wikisource.metrics. By default nothing is recorded
+
+    singleflight: SingleFlight that identical searches running at the same time share
+    one request through, by default shared by all instances. None to send every search
+
+    coordprecision: decimal places search coordinates are rounded to (default 5,
+    about 1m), so searches from nearly the same point share requests and cached
+    responses. None to search at the coordinates as given
+
+    records: if True nearby pages, page matches and nearby images are returned as
+    PageResult, PageMatch and ImageResult records (see wikigeo.records), which
+    take less memory than dictionaries and give them with to_dict()
+
     """
 
-    def __init__(self, language: str, userinfo: str):
+    def __init__(
+        self,
+        language: str,
+        userinfo: str,
+        cache: Optional[ResponseCache] = None,
+        ratelimiter: RateLimiter = DEFAULT_LIMITER,
+        geostore: Optional["GeoStore"] = None,
+        matcher: NameMatcher = DEFAULT_MATCHER,
+        sessionpool: SessionPool = DEFAULT_POOL,
+        textstore: Optional[PageTextStore] = None,
+        dumpstore: Optional["DumpStore"] = None,
+        metrics: Metrics = DEFAULT_METRICS,
+        singleflight: Optional[SingleFlight] = DEFAULT_FLIGHTS,
+        coordprecision: Optional[int] = 5,
+        records: bool = False,
+    ):
         self.user = userinfo
         self.language = language
-        self.api = WikipediaAPI("test")
-        self.commonsapi = WikipediaAPI("test", commons=True)
-
+        self.cache = cache
+        self.ratelimiter = ratelimiter
+        self.geostore = geostore
+        self.matcher = matcher
+        self.sessionpool = sessionpool
+        self.textstore = textstore
+        self.dumpstore = dumpstore
+        self.metrics = metrics
+        self.records = records
+        self.api = WikipediaAPI(
+            userinfo,
+            language,
+            cache=cache,
+            ratelimiter=ratelimiter,
+            sessionpool=sessionpool,
+            metrics=metrics,
+            singleflight=singleflight,
+            coordprecision=coordprecision,
+        )
+        self.commonsapi = WikipediaAPI(
+            userinfo,
+            commons=True,
+            cache=cache,
+            ratelimiter=ratelimiter,
+            sessionpool=sessionpool,
+            metrics=metrics,
+            singleflight=singleflight,
+            coordprecision=coordprecision,
+        )
+
+    @timed
     def get_nearby_pages(
         self, lat: float, lon: float, limit: int = 4, radiusmeters: int = 10000
     ) -> list:
@@ -50,43 +402,145 @@ class WikiExtractor:
 
         limit: max number of pages to return (default 4)
 
-        returns list of dictionaries with title, label, description, coordinates, image
+        returns list of dictionaries with title, label, description, coordinates, image,
+        or PageResult records if records is set
 
         """
 
-        pages = []
         query = query_nearby(lat, lon, limit, radiusmeters)
+        if self.dumpstore is not None:
+            return self._pages(
+                _nearby_page_records(
+                    self.dumpstore.nearby(lat, lon, limit, radiusmeters)
+                )
+            )
+        if self.geostore is not None:
+            local = self.geostore.within(lat, lon, radiusmeters, limit)
+            # the local pages are complete if the whole search area has been searched,
+            # or if the area up to the furthest of the closest pages has been
+            if self.geostore.is_covered(lat, lon, radiusmeters) or (
+                len(local) == limit and self.geostore.is_covered(lat, lon, local[-1][1])
+            ):
+                logger.debug("answered nearby search at %s, %s locally", lat, lon)
+                if self.records:
+                    return [PageResult.from_dict(page) for page, _ in local]
+                return [dict(page) for page, _ in local]
         response = self.api.get_data(query)
-        for _, result in response.items():
-            page = {
-                "title": result["title"],
-                "description": None,
-                "coordinates": {
-                    "lat": result["coordinates"][0]["lat"],
-                    "lon": result["coordinates"][0]["lon"],
-                },
-                "label": None,
-                "image": None,
-            }
+        pages = _nearby_page_records(response)
+        if self.geostore is not None:
+            self._store_nearby(
+                [page.to_dict() for page in pages], lat, lon, limit, radiusmeters
+            )
+        return self._pages(pages)
+
+    def _pages(self, records: list) -> list:
+        """records as returned, dictionaries unless records is set"""
+        if self.records:
+            return records
+        return [record.to_dict() for record in records]
+
+    def _store_nearby(self, pages, lat, lon, limit, radiusmeters):
+        """adds nearby pages to the geostore with the circle they fully cover"""
+        self.geostore.add_pages([dict(page) for page in pages])
+        if len(pages) < limit:
+            self.geostore.add_covered(lat, lon, radiusmeters)
+        elif pages:
+            # the closest pages are returned so all pages up to the furthest one are known
+            furthest = max(
+                km_distance(
+                    lat, lon, page["coordinates"]["lat"], page["coordinates"]["lon"]
+                )
+                for page in pages
+            )
+            self.geostore.add_covered(lat, lon, furthest * 1000)
+
+    def get_pages_in_area(
+        self,
+        area,
+        limit: int = 500,
+        maxworkers: int = 10,
+        errors: Optional[list] = None,
+    ) -> Iterator[dict]:
+        """
+
+        Get details for all pages within an area too large for a single nearby search.
 
-            terms = result.get("terms")
-            if terms is not None:
-                page["label"] = terms.get("label")
-                page["description"] = terms.get("description")
+        The area is covered by a hexagonal grid of 10km searches, run concurrently.
+        Searches that hit the limit are split into seven searches of half the radius
+        until none do, so no pages are missed in dense areas.
 
-            thumbnail = result.get("thumbnail")
-            if thumbnail is not None:
-                thumbnail = thumbnail["source"]
-                image = thumbnail.split("/")
-                image.pop(-1)
-                image.remove("thumb")
-                imageurl = "/".join(image)
-                page["image"] = imageurl
+        area: bounding box (south, west, north, east) or list of (lat, lon) points of a polygon
 
-            pages.append(page)
+        limit: max number of pages for each search (default and max 500)
 
-        return pages
+        maxworkers: max number of searches run at once (default 10)
 
+        errors: optional list that (lat, lon, radius, error) is added to for each search
+        that fails with a WikiError. Failed searches are logged and skipped, so the rest
+        of the area is still returned
+
+        yields unique dictionaries with pageid, title, label, description, coordinates, image
+        (or PageResult records if records is set) for pages inside the area,
+        as the searches complete. Searches are only sent as results are taken, and
+        closing the generator early drops the searches not yet started
+
+        """
+        polygon = to_polygon(area)
+        seen = set()
+        queued = collections.deque(
+            (lat, lon, MAX_RADIUS) for lat, lon in hex_cover(polygon, MAX_RADIUS)
+        )
+        logger.debug("covering area with %s searches", len(queued))
+
+        def search(lat, lon, radius):
+            return self.api.get_data(query_nearby(lat, lon, limit, int(radius)))
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxworkers)
+        running = {}
+        try:
+            while queued or running:
+                while queued and len(running) < maxworkers:
+                    tile = queued.popleft()
+                    running[executor.submit(search, *tile)] = tile
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    lat, lon, radius = running.pop(future)
+                    try:
+                        response = future.result()
+                    except WikiError as error:
+                        logger.warning("search at %s, %s failed: %s", lat, lon, error)
+                        if errors is not None:
+                            errors.append((lat, lon, radius, error))
+                        continue
+                    if len(response) >= limit and radius / 2 >= MIN_RADIUS:
+                        # search was capped so there may be more pages here
+                        logger.debug("splitting search at %s, %s", lat, lon)
+                        queued.extend(
+                            (sublat, sublon, radius / 2)
+                            for sublat, sublon in subdivide(lat, lon, radius)
+                            if circle_intersects(polygon, sublat, sublon, radius / 2)
+                        )
+                    for pageid, result in response.items():
+                        if pageid in seen:
+                            continue
+                        coordinates = result["coordinates"][0]
+                        if not contains_point(
+                            polygon, coordinates["lat"], coordinates["lon"]
+                        ):
+                            continue
+                        seen.add(pageid)
+                        page = _nearby_page_records({pageid: result})[0]
+                        page.pageid = result.get("pageid", pageid)
+                        yield page if self.records else page.to_dict()
+        finally:
+            # searches already sent finish in the background, the rest are dropped
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    @timed
     def get_page_text(self, pagetitle: str, limit: bool = False) -> dict:
         """
 
@@ -100,9 +554,115 @@ class WikiExtractor:
         returns a dictionary with pagetitle and text.
 
         """
-        result = scrape_page_text(pagetitle, limit, self.language)
+        if self.dumpstore is not None:
+            return self.dumpstore.page_text(pagetitle, limit)
+        result = scrape_page_text(
+            pagetitle,
+            limit,
+            self.language,
+            self.ratelimiter,
+            self.sessionpool,
+            self.textstore,
+            metrics=self.metrics,
+            headers={"User-agent": self.user},
+        )
         return result
 
+    @timed
+    def get_page_texts(
+        self, titles: Iterable[str], limit: bool = False, maxworkers: int = 10
+    ) -> list:
+        """
+
+        Retrieve the text of many pages by page title.
+
+        With a dumpstore, text is read from the articles dump without any requests.
+        With a textstore, the latest revision of each page is looked up 50 titles
+        per request, and pages whose revision hasn't changed are not downloaded again.
+
+        titles: iterable of exact page titles
+
+        limit: int, character limit of text returned.
+        If set to False then the full text is returned. (default is False).
+
+        maxworkers: max number of pages scraped at once (default 10)
+
+        returns list of dictionaries with title and text in the order of the given titles.
+        text is None for pages that don't exist
+
+        """
+        titles = list(titles)
+        if self.dumpstore is not None:
+            texts = {}
+            for title in dict.fromkeys(titles):
+                try:
+                    texts[title] = self.dumpstore.page_text(title, limit)
+                except APIError:
+                    texts[title] = {"title": title, "text": None}
+            return [dict(texts[title]) for title in titles]
+        if self.textstore is not None:
+            revisions = {}
+            for batch in _chunk_titles(titles):
+                aliases = {}
+                response = self.api.get_data(query_last_revisions(batch), aliases)
+                revisions.update(_parse_revisions(response, aliases, batch))
+        else:
+            # revisions are only needed to skip pages already in the textstore
+            revisions = dict.fromkeys(titles)
+
+        def scrape(title):
+            if self.textstore is not None and revisions[title] is None:
+                return {"title": title, "text": None}
+            try:
+                return scrape_page_text(
+                    title,
+                    limit,
+                    self.language,
+                    self.ratelimiter,
+                    self.sessionpool,
+                    self.textstore,
+                    revisions[title],
+                    metrics=self.metrics,
+                    headers={"User-agent": self.user},
+                )
+            except RequestError as error:
+                if error.status != 404:
+                    raise
+                return {"title": title, "text": None}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=maxworkers) as executor:
+            texts = dict(zip(revisions, executor.map(scrape, revisions)))
+        return [dict(texts[title]) for title in titles]
+
+    @timed
+    def get_pages_by_title(
+        self, titles: Iterable[str], extract_chars: Optional[int] = None
+    ) -> list:
+        """
+
+        Get details for many pages by title, sending up to 20 titles per request,
+        the most that intro extracts are given for at once.
+
+        titles: iterable of page titles, redirects are followed
+
+        extract_chars: optional max number of characters of each intro extract
+        (max 1200). If not given the full intro is returned.
+
+        returns list of dictionaries in the order of the given titles with title, pagetitle,
+        pageid, label, description, coordinates, image and extract.
+        pagetitle is None for pages that don't exist
+
+        """
+        titles = list(titles)
+        pages = {}
+        for batch in _chunk_titles(titles, EXTRACTS_LIMIT):
+            aliases = {}
+            response = self.api.get_data(query_by_titles(batch, extract_chars), aliases)
+            for page in _parse_title_pages(response, aliases, batch):
+                pages[page["title"]] = page
+        return [dict(pages[title]) for title in titles]
+
+    @timed
     def get_nearby_images(
         self,
         lat: float,
@@ -110,10 +670,11 @@ class WikiExtractor:
         radiusmeters=10000,
         nametomatch=False,
         matchfilter=False,
+        limit: int = 5,
     ) -> dict:
         """
 
-        Gets all images nearby given coordinates from Wikimedia Commons.
+        Gets images nearby given coordinates from Wikimedia Commons.
 
         radiusmetres: distance to search, max 10000 (10km)
 
@@ -124,71 +685,29 @@ class WikiExtractor:
         that have a higher rated name match,
         can be between 0 (no matching) and 100 (exact match only)
 
-        returns list of dictionaries containing image data
-        [{'image': i, 'title': t, 'url': url, 'name match': x}, ...]
+        limit: max number of images to search for, up to 500 (default 5)
+
+        returns dictionary of image data keyed by position, best name match first
+        if nametomatch is given
+        {0: {'image': i, 'title': t, 'url': url, 'name match': x}, 1: ...}
+        or a list of ImageResult records in the same order if records is set
 
         Note: if using matchfilter, nametomatch must be set to a string
 
         """
         if matchfilter and (not nametomatch):
             raise ValueError("nametomatch must be set to a name if using a matchfilter")
-        query = query_commons_nearby(lat, lon, radiusmeters)
+        query = query_commons_nearby(lat, lon, radiusmeters, limit)
         response = self.commonsapi.get_data(query)
-        imagedata = []
-        i = 0
-        for _, image in response.items():
-            image_result = {
-                "index": i,
-                "image": "",
-                "title": image.get("title", ""),
-                "url": "",
-                "lat": image["coordinates"][0]["lat"],
-                "lon": image["coordinates"][0]["lon"],
-                "author": "",
-                "license": "",
-                "description": "",
-            }
-
-            image_info = image.get("imageinfo")
-            if image_info is not None:
-                image_result["image"] = image_info[0].get("url", "")
-                image_result["url"] = image_info[0].get("descriptionurl", "")
-
-                metadata = image_info[0].get("extmetadata", {})
-                if metadata is not None:
-                    image_result["license"] = metadata.get("License", {}).get(
-                        "value", ""
-                    )
-                    image_result["author"] = metadata.get("Attribution", {}).get(
-                        "value", ""
-                    )
-                    image_result["description"] = metadata.get(
-                        "ImageDescription", {}
-                    ).get("value", "")
-            i += 1
-            imagedata.append(image_result)
-
-        logging.debug("got image data as %s", imagedata)
-
-        if nametomatch and any(imagedata):
-            # sorting results by name match ratio
-            logging.debug("matching on name...")
-            for image in imagedata:
-                image["name match"] = fuzz.partial_ratio(
-                    nametomatch.lower(), image["title"].lower()
-                )
-            imagedata.sort(key=lambda x: int(x["name match"]), reverse=True)
-
-            if matchfilter and any(imagedata):
-                # filtering out matches below filter
-                imagedata = [
-                    image for image in imagedata if image["name match"] > matchfilter
-                ]
-        image_results = {
-            i: image_result for i in range(len(imagedata)) for image_result in imagedata
-        }
-        return image_results
+        if self.records:
+            return _nearby_image_records(
+                response, nametomatch, matchfilter, self.matcher, self.metrics
+            )
+        return _parse_nearby_images(
+            response, nametomatch, matchfilter, self.matcher, self.metrics
+        )
 
+    @timed
     def get_page_match(
         self,
         keyword: str,
@@ -222,7 +741,7 @@ class WikiExtractor:
 
         returns a dictionary of page matches containing page title, description,
         label, image, distance, coords
-        and match rating
+        and match rating, as PageMatch records if records is set
 
         Note: Works best for unique, proper names of geographically
         located places (e.g. landmarks, buildings, parks)
@@ -230,62 +749,24 @@ class WikiExtractor:
         out entities may not match.
 
         """
-        data = []
-        query = query_by_string(keyword.lower(), limit=3)
-        search_results = self.api.get_data(query)
-
-        for _, info in search_results.items():
-            result = {
-                "title": info["title"],
-                "description": None,
-                "label": None,
-                "image": None,
-                "lat": None,
-                "lon": None,
-                "distance": None,
-                "name match": None,
-            }
-            logging.debug("found %s", result["title"])
-            coordinates = info.get("coordinates")
-            if coordinates is None:
-                logging.debug("cannot find coords for %s", result["title"])
-                logging.debug("full result: %s", info)
-                continue
-
-            result["lat"] = coordinates[0]["lat"]
-            result["lon"] = coordinates[0]["lon"]
-
-            terms = info.get("terms")
-            if terms is not None:
-                result["description"] = terms["description"]
-                result["label"] = terms["label"]
-
-            result["image"] = info.get("original", {}).get("source")
-            result["distance"] = _get_km_distance(
-                searchlat, searchlon, result["lat"], result["lon"]
-            )
-            result["name match"] = fuzz.ratio(result["title"].lower(), keyword.lower())
-            data.append(result)
-
-        logging.debug("final data length: %s", str(len(data)))
-        logging.debug("results with coords saved from wiki search: %s", str(len(data)))
-        # filtering for relevant results
-        results = [
-            place
-            for place in data
-            if (
-                (place["distance"] < maxdistance)
-                and (place["name match"] > name_match_greater)
+        if self.dumpstore is not None:
+            search_results = self.dumpstore.search(
+                keyword, searchlat, searchlon, maxdistance
             )
-        ]
-        if any(results):
-            # getting top match if requested
-            if bestmatch == "name":
-                results.sort(key=lambda result: int(result["name match"]), reverse=True)
-                logging.debug("wikis: %s", str(results))
-                results = results[0]
-            if bestmatch == "distance":
-                results.sort(key=(lambda result: abs(result["distance"])))
-                logging.debug("wikis: %s", str(results))
-                results = results[0]
-        return {"page_matches": results}
+        else:
+            query = query_by_string(keyword.lower(), limit=3)
+            search_results = self.api.get_data(query)
+        results = _page_match_records(
+            search_results,
+            keyword,
+            searchlat,
+            searchlon,
+            bestmatch,
+            maxdistance,
+            name_match_greater,
+            self.matcher,
+            self.metrics,
+        )
+        if self.records:
+            return {"page_matches": results}
+        return {"page_matches": _match_dicts(results)}
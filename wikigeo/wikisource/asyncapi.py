@@ -0,0 +1,166 @@
+"""Querying Wikipedia's APIs with asyncio"""
+import asyncio
+import logging
+from typing import AsyncIterator, Optional, Tuple
+import aiohttp
+from wikigeo.wikisource.cache import ResponseCache
+from wikigeo.wikisource.errors import APIError, RequestError, ThrottledError
+from wikigeo.wikisource.ratelimit import (
+    DEFAULT_LIMITER,
+    RETRY_STATUSES,
+    RateLimiter,
+    backoff_delay,
+    retry_after,
+)
+from wikigeo.wikisource.wikiapi import _request_error, merge_pages
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncWikipediaAPI:
+    """sends queries to the Wikipedia API without blocking the event loop.
+    Queries are passed to each call rather than stored on the instance,
+    so one instance can run any number of queries at once.
+
+    session: optional aiohttp.ClientSession to share a connection pool between
+    instances. If not given a session is created and closed by close()
+
+    cache: optional ResponseCache shared between instances to reuse responses
+
+    ratelimiter, maxlag, retries, backoff: see WikipediaAPI, which raises the
+    same errors"""
+
+    def __init__(
+        self,
+        userinfo: str,
+        language: str = "en",
+        commons: bool = False,
+        session: Optional[aiohttp.ClientSession] = None,
+        cache: Optional[ResponseCache] = None,
+        ratelimiter: RateLimiter = DEFAULT_LIMITER,
+        maxlag: Optional[int] = 5,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        self.headers = {"User-agent": userinfo}
+        self._own_session = session is None
+        self.session = session
+        if commons:
+            self.url = "https://commons.wikimedia.org/w/api.php"
+        else:
+            self.url = f"https://{language}.wikipedia.org/w/api.php"
+        self.cache = cache
+        self.ratelimiter = ratelimiter
+        self.maxlag = maxlag
+        self.retries = retries
+        self.backoff = backoff
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """closes the session if it was created by this instance"""
+        if self._own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def _send_query(self, query: dict) -> Tuple[dict, bool]:
+        """sends query and returns response and whether it was cached"""
+        if self.cache is not None:
+            cached = self.cache.get(self.url, query)
+            if cached is not None:
+                return cached, True
+        logger.debug("sending query: %s", query)
+        params = {param: str(value) for param, value in query.items()}
+        if self.maxlag is not None:
+            params["maxlag"] = str(self.maxlag)
+        limiter = self.ratelimiter.host(self.url)
+        # only checked before the first attempt, as in WikipediaAPI._throttled_get
+        limiter.check()
+        for attempt in range(self.retries + 1):
+            try:
+                async with limiter.async_slot(check=False):
+                    async with self._get_session().get(
+                        self.url, params=params, headers=self.headers
+                    ) as response:
+                        logger.debug(response)
+                        throttled = response.status in RETRY_STATUSES or (
+                            response.headers.get("MediaWiki-API-Error") == "maxlag"
+                        )
+                        if not throttled or attempt == self.retries:
+                            if throttled:
+                                limiter.failed()
+                            else:
+                                limiter.succeeded()
+                            if response.status >= 400:
+                                raise _request_error(response.status, self.url)
+                            result = await response.json(content_type=None)
+                            break
+                        wait = retry_after(response.headers, default=None)
+                        if wait is None:
+                            wait = backoff_delay(attempt, self.backoff)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt == self.retries:
+                    limiter.failed()
+                    raise RequestError(
+                        f"request to {self.url} failed: {error!r}", url=self.url
+                    ) from error
+                wait = backoff_delay(attempt, self.backoff)
+            logger.warning("request to %s retrying in %.2fs", self.url, wait)
+            limiter.pause(wait)
+        error = result.get("error")
+        if error is not None:
+            logger.warning(error)
+            if throttled:
+                raise ThrottledError(
+                    f"{self.url} lagged after {self.retries} retries: {error}",
+                    response.status,
+                    self.url,
+                )
+            raise APIError(
+                "Check parameters; " + str(result),
+                error.get("code", ""),
+                error.get("info", ""),
+            )
+        if self.cache is not None:
+            self.cache.set(self.url, query, result)
+        return result, False
+
+    async def iter_search_results(self, query: dict) -> AsyncIterator[dict]:
+        """yields each page of results for query, following continuations"""
+        query = dict(query)
+        result, _ = await self._send_query(query)
+        yield result
+        while "continue" in result.keys():
+            if "batchcomplete" in result.keys():
+                logger.debug("batchcomplete and continue present")
+                break
+            logger.debug("getting next page from %s", result["continue"])
+            # sending the original query with only the latest continue parameters
+            next_result, _ = await self._send_query(dict(query, **result["continue"]))
+            yield next_result
+            # checking if new results are the same as the previous
+            if next_result == result:
+                logger.debug("got same results")
+                break
+            result = next_result
+
+        if "batchcomplete" in result.keys():
+            logger.debug("batchcomplete")
+        else:
+            logger.warning("continue not in new batch")
+
+    async def get_data(self, query: dict, aliases: Optional[dict] = None) -> dict:
+        """return all data from search, see WikipediaAPI.get_data"""
+        combined_results = {}
+        async for page in self.iter_search_results(query):
+            merge_pages(combined_results, page, aliases)
+        return combined_results
@@ -0,0 +1,260 @@
+"""Caching responses from Wikipedia APIs"""
+import copy
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# seconds a cached response stays valid for each kind of query
+DEFAULT_TTLS = {
+    "geosearch": 7 * 24 * 3600,
+    "search": 24 * 3600,
+    "parse": 24 * 3600,
+    "commons": 7 * 24 * 3600,
+    "wikidata": 7 * 24 * 3600,
+    "default": 3600,
+}
+
+
+def query_kind(url: str, query: dict) -> str:
+    """classifies a query so it can be given its own ttl"""
+    if "commons.wikimedia.org" in url:
+        return "commons"
+    if "wikidata.org" in url:
+        return "wikidata"
+    if query.get("action") == "parse":
+        return "parse"
+    generator = query.get("generator")
+    if generator in ("geosearch", "search"):
+        return generator
+    return "default"
+
+
+def cache_key(url: str, query: dict) -> str:
+    """normalised key for a query sent to the given endpoint"""
+    normalised = {str(param): str(value) for param, value in query.items()}
+    return json.dumps([url, normalised], sort_keys=True)
+
+
+class MemoryCache:
+    """in-memory LRU store of responses"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        """returns the stored response or None if missing/expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict, ttl: float):
+        """stores a response, evicting the least recently used if full"""
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """removes all stored responses"""
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """on-disk store of responses, evicts least recently used rows.
+
+    Access times of hits are kept in memory and written in batches, so reads
+    don't each write to disk. Once there are more than maxsize rows, the least
+    recently used tenth are removed at once."""
+
+    # access times held before they are written
+    ACCESS_BATCH = 1000
+    # seconds to wait for other processes writing to the same file
+    BUSY_TIMEOUT = 30
+
+    def __init__(self, path: str, maxsize: int = 100000):
+        self.path = path
+        self.maxsize = maxsize
+        self._conn = sqlite3.connect(
+            path, timeout=self.BUSY_TIMEOUT, check_same_thread=False
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)"
+        )
+        self._conn.commit()
+        self._accessed = {}
+        # upper bound on the number of rows, counted again before evicting
+        self._count = len(self)
+
+    def get(self, key: str) -> Optional[Tuple[dict, float]]:
+        """returns the stored response and the time it expires,
+        or None if missing/expired"""
+        row = self._conn.execute(
+            "SELECT value, expires FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires < time.time():
+            self._accessed.pop(key, None)
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+            return None
+        self._accessed[key] = time.time()
+        if len(self._accessed) >= self.ACCESS_BATCH:
+            self.flush()
+        return json.loads(value), expires
+
+    def set(self, key: str, value: dict, ttl: float):
+        """stores a response, evicting the least recently used if full"""
+        now = time.time()
+        self._accessed.pop(key, None)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl, now),
+        )
+        self._count += 1
+        if self._count > self.maxsize:
+            self._evict()
+        self._conn.commit()
+
+    def flush(self):
+        """writes the access times of hits held in memory"""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+            self._conn.commit()
+
+    def _evict(self):
+        """removes the least recently used rows once there are more than maxsize"""
+        self._count = len(self)
+        if self._count <= self.maxsize:
+            return
+        self.flush()
+        excess = self._count - self.maxsize + max(1, self.maxsize // 10)
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY accessed LIMIT ?)",
+            (excess,),
+        )
+        logger.debug("evicted %s cached responses", excess)
+        self._count = max(0, self._count - excess)
+
+    def clear(self):
+        """removes all stored responses"""
+        self._accessed.clear()
+        self._conn.execute("DELETE FROM responses")
+        self._conn.commit()
+        self._count = 0
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """two tier cache of API responses keyed on endpoint and query.
+    responses are looked up in memory first and then on disk if a path is given.
+
+    maxsize: max number of responses kept in memory
+
+    path: optional sqlite file to persist responses between runs
+
+    disk_maxsize: max number of responses kept on disk
+
+    ttls: dictionary of seconds to keep responses for each query kind,
+    overrides DEFAULT_TTLS"""
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        path: Optional[str] = None,
+        disk_maxsize: int = 100000,
+        ttls: Optional[dict] = None,
+    ):
+        self.memory = MemoryCache(maxsize)
+        self.disk = SQLiteCache(path, disk_maxsize) if path else None
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, url: str, query: dict) -> Optional[dict]:
+        """returns cached response for query or None"""
+        key = cache_key(url, query)
+        with self._lock:
+            value = self.memory.get(key)
+            if value is None and self.disk is not None:
+                stored = self.disk.get(key)
+                if stored is not None:
+                    # kept in memory only for the rest of its time on disk
+                    value, expires = stored
+                    self.memory.set(key, value, expires - time.time())
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        logger.debug("cache %s for %s", "miss" if value is None else "hit", key)
+        # copying so callers merging results can't alter the cached response
+        return copy.deepcopy(value)
+
+    def set(self, url: str, query: dict, value: dict):
+        """stores response for query"""
+        key = cache_key(url, query)
+        ttl = self._ttl(url, query)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self.memory.set(key, value, ttl)
+            if self.disk is not None:
+                self.disk.set(key, value, ttl)
+
+    def flush(self):
+        """writes access times held in memory to disk, e.g. before exiting"""
+        with self._lock:
+            if self.disk is not None:
+                self.disk.flush()
+
+    def clear(self):
+        """removes all cached responses and resets counters"""
+        with self._lock:
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """returns hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_size": len(self.memory),
+        }
+
+    def _ttl(self, url: str, query: dict) -> float:
+        return self.ttls.get(query_kind(url, query), self.ttls["default"])
@@ -0,0 +1,207 @@
+"""Reading Wikipedia database and article dumps without loading them into memory
+dumps can be downloaded from https://dumps.wikimedia.org/"""
+import bz2
+import concurrent.futures
+import gzip
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from lxml import etree
+
+# page props kept from the page_props dump
+PAGE_PROPS = {"wikibase-shortdesc": "description", "page_image_free": "image"}
+
+_SQL_VALUE = re.compile(
+    r"\s*(?:'((?:[^'\\]|\\.)*)'|(NULL)|([-+0-9.eE]+))\s*([,)])", re.DOTALL
+)
+_SQL_ESCAPE = re.compile(r"\\(.)", re.DOTALL)
+_SQL_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "0": "\0", "Z": "\x1a"}
+
+
+def open_dump(path: str):
+    """opens a plain, gzip or bz2 compressed dump as text"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def _unescape(match) -> str:
+    char = match.group(1)
+    return _SQL_ESCAPES.get(char, char)
+
+
+def parse_insert(line: str) -> List[tuple]:
+    """rows of an INSERT INTO ... VALUES (...),(...); statement from a sql dump.
+    strings are unescaped, numbers converted and NULL returned as None"""
+    start = line.find(" VALUES ")
+    if not line.startswith("INSERT INTO") or start == -1:
+        return []
+    rows = []
+    position = start + len(" VALUES ")
+    while True:
+        position = line.find("(", position)
+        if position == -1:
+            return rows
+        position += 1
+        row = []
+        while True:
+            match = _SQL_VALUE.match(line, position)
+            if match is None:
+                raise ValueError(f"can't parse sql values at {position}")
+            string, null, number, end = match.groups()
+            if string is not None:
+                row.append(_SQL_ESCAPE.sub(_unescape, string))
+            elif null is not None:
+                row.append(None)
+            elif "." in number or "e" in number or "E" in number:
+                row.append(float(number))
+            else:
+                row.append(int(number))
+            position = match.end()
+            if end == ")":
+                break
+        rows.append(tuple(row))
+
+
+def geo_tag_rows(line: str) -> List[Tuple[int, float, float]]:
+    """(page id, lat, lon) of the primary coordinates on earth in a geo_tags
+    INSERT statement. columns are gt_id, gt_page_id, gt_globe, gt_primary, gt_lat, gt_lon, ...
+    """
+    return [
+        (row[1], float(row[4]), float(row[5]))
+        for row in parse_insert(line)
+        if row[2] == "earth"
+        and row[3] == 1
+        and row[4] is not None
+        and row[5] is not None
+    ]
+
+
+def page_prop_rows(line: str) -> List[Tuple[int, str, str]]:
+    """(page id, prop, value) of the PAGE_PROPS in a page_props INSERT statement.
+    columns are pp_page, pp_propname, pp_value, pp_sortkey"""
+    return [
+        (row[0], PAGE_PROPS[row[1]], row[2])
+        for row in parse_insert(line)
+        if row[1] in PAGE_PROPS
+    ]
+
+
+def index_rows(lines: List[str]) -> List[Tuple[int, int, str]]:
+    """(page id, stream offset, title) from lines of a multistream index,
+    which are offset:page id:title"""
+    rows = []
+    for line in lines:
+        offset, pageid, title = line.rstrip("\n").split(":", 2)
+        rows.append((int(pageid), int(offset), title))
+    return rows
+
+
+def iter_inserts(path: str) -> Iterator[str]:
+    """INSERT statements of a sql dump, one per line as written by mysqldump"""
+    with open_dump(path) as dump:
+        for line in dump:
+            if line.startswith("INSERT INTO"):
+                yield line
+
+
+def iter_line_chunks(path: str, size: int = 10000) -> Iterator[List[str]]:
+    """lines of a dump in lists of up to size lines"""
+    with open_dump(path) as dump:
+        chunk = []
+        for line in dump:
+            chunk.append(line)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def map_chunks(
+    function: Callable, chunks: Iterable, processes: Optional[int] = None
+) -> Iterator:
+    """applies function to each chunk in a process pool, yielding results in order.
+    At most two chunks per process are read ahead, so memory stays bounded
+    however large the dump is.
+
+    processes: number of worker processes, None for one per core, 1 to run
+    in this process"""
+    if processes == 1:
+        yield from map(function, chunks)
+        return
+    processes = processes or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        window = 2 * processes
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, chunk))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+@lru_cache(maxsize=16)
+def read_stream(path: str, offset: int) -> dict:
+    """wikitext of the pages in the bz2 stream starting at offset in a multistream
+    articles dump, keyed on page id. Recently read streams are kept in memory"""
+    decompressor = bz2.BZ2Decompressor()
+    data = []
+    with open(path, "rb") as dump:
+        dump.seek(offset)
+        while not decompressor.eof:
+            block = dump.read(65536)
+            if not block:
+                break
+            data.append(decompressor.decompress(block))
+    root = etree.fromstring(
+        b"<pages>" + b"".join(data) + b"</pages>",
+        etree.XMLParser(recover=True, huge_tree=True),
+    )
+    texts = {}
+    for page in root.iter("page"):
+        pageid = page.findtext("id")
+        if pageid is not None:
+            texts[int(pageid)] = page.findtext("revision/text") or ""
+    return texts
+
+
+_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_REF = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.IGNORECASE)
+_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+_TABLE = re.compile(r"\{\|.*?\n\|\}", re.DOTALL)
+_FILE_LINK = re.compile(
+    r"\[\[(?:File|Image|Category):(?:[^\[\]]|\[\[[^\[\]]*\]\])*\]\]", re.IGNORECASE
+)
+_LINK = re.compile(r"\[\[(?:[^\[\]|]*\|)?([^\[\]]*)\]\]")
+_EXTERNAL_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]*\s*([^\]]*)\]")
+_HEADING = re.compile(r"^=+\s*(.*?)\s*=+\s*$", re.MULTILINE)
+_LIST_MARKER = re.compile(r"^[*#:;]+\s*", re.MULTILINE)
+_TAG = re.compile(r"<[^>]+>")
+_QUOTES = re.compile(r"'{2,}")
+
+
+def wikitext_to_text(wikitext: str, char_limit: Optional[int] = None) -> str:
+    """plain text of the paragraphs and headings of a page's wikitext,
+    without templates, tables, references, files or formatting"""
+    text = _COMMENT.sub("", wikitext)
+    text = _REF.sub("", text)
+    # removing nested templates from the inside out
+    removed = 1
+    while removed:
+        text, removed = _TEMPLATE.subn("", text)
+    text = _TABLE.sub("", text)
+    text = _FILE_LINK.sub("", text)
+    text = _LINK.sub(r"\1", text)
+    text = _EXTERNAL_LINK.sub(r"\1", text)
+    text = _HEADING.sub(r"\1", text)
+    text = _LIST_MARKER.sub("", text)
+    text = _TAG.sub("", text)
+    text = _QUOTES.sub("", text)
+    text = " ".join(text.split())
+    return text[:char_limit] if char_limit else text
@@ -0,0 +1,54 @@
+"""Errors raised when requests to Wikipedia and Commons fail.
+All are subclasses of WikiError, so callers can catch every request failure
+without catching bugs"""
+from typing import Optional
+
+
+class WikiError(Exception):
+    """base of all request errors"""
+
+
+class RequestError(WikiError):
+    """request failed, with an error status or without a response.
+
+    status: http status of the response, None if the connection failed
+
+    url: url the request was sent to"""
+
+    def __init__(self, message: str, status: Optional[int] = None, url: str = ""):
+        super().__init__(message)
+        self.status = status
+        self.url = url
+
+
+class ThrottledError(RequestError):
+    """request was still throttled or the server unavailable (429, 5xx or maxlag)
+    after all retries"""
+
+
+class APIError(WikiError):
+    """API answered with an error, e.g. for invalid parameters.
+
+    code: error code given by the API
+
+    info: description of the error given by the API"""
+
+    def __init__(self, message: str, code: str = "", info: str = ""):
+        super().__init__(message)
+        self.code = code
+        self.info = info
+
+
+class CircuitOpenError(WikiError):
+    """requests to a host are failing, so this one was not sent.
+
+    host: host requests are held back from
+
+    retry_in: seconds until a request will be tried again"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(
+            f"requests to {host} are failing, not retrying for {retry_in:.1f}s"
+        )
+        self.host = host
+        self.retry_in = retry_in
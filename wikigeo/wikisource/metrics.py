@@ -0,0 +1,222 @@
+"""Metrics reported from the request and matching hot paths.
+
+WikipediaAPI, WikiExtractor and ConcurrentSearcher take a metrics argument that
+measurements are sent to. The default Metrics does nothing, PrometheusMetrics keeps
+them in memory for the prometheus text format and OpenTelemetryMetrics records them
+with an OpenTelemetry meter.
+
+Measurements, with the labels sent with them:
+
+request_seconds (host): time taken by each http request, per attempt, so a retried
+    request is observed once for each time it is sent
+response_bytes (host): size of each response body
+decode_seconds (host): time taken decoding each json response
+continuations (host): count of continuation requests
+retries (host): count of requests sent again after being throttled, a server error
+    or a failed connection
+ratelimit_wait_seconds (host): time each request attempt waited for the rate limit
+cache_hits, cache_misses (host): count of responses found and not found in the cache
+coalesced (host): count of queries answered by an identical request already in flight
+match_seconds (scorer): time taken rating names against titles
+call_seconds (method): time taken by each WikiExtractor and ConcurrentSearcher call
+call_items (method): number of searches given to each ConcurrentSearcher call"""
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse
+
+_NULL_TIMER = nullcontext()
+
+# upper bounds of histogram buckets for seconds, bytes and numbers of items
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+ITEMS_BUCKETS = (1, 10, 50, 100, 500, 1000, 10000)
+
+
+class Metrics:
+    """receives measurements, doing nothing with them.
+    Subclasses set enabled and override observe and increment"""
+
+    enabled = False
+
+    def observe(self, name: str, value: float, **labels):
+        """records a measured value, e.g. a duration or size"""
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """adds to a count"""
+
+    def timer(self, name: str, **labels):
+        """context manager observing the seconds taken by its block"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name: str, labels: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+
+DEFAULT_METRICS = Metrics()
+
+
+def timed(method):
+    """decorator observing call_seconds of a method of an object with metrics"""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.timer("call_seconds", method=method.__qualname__):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _buckets(name: str) -> tuple:
+    if name.endswith("_bytes"):
+        return BYTES_BUCKETS
+    if name.endswith("_items"):
+        return ITEMS_BUCKETS
+    return SECONDS_BUCKETS
+
+
+def _unit(name: str) -> str:
+    if name.endswith("_bytes"):
+        return "By"
+    if name.endswith("_seconds"):
+        return "s"
+    return "1"
+
+
+def _label_text(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class PrometheusMetrics(Metrics):
+    """keeps counts and histograms of measurements in memory, to be served in
+    the prometheus text format, e.g. from a /metrics endpoint.
+
+    prefix: prefix of each metric name"""
+
+    enabled = True
+
+    def __init__(self, prefix: str = "wikigeo_"):
+        self.prefix = prefix
+        self._counters = defaultdict(float)
+        # name: {labels: [bucket counts..., sum, count]}
+        self._histograms = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = _buckets(name)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = [0] * (len(buckets) + 2)
+                self._histograms[name][key] = series
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def increment(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def totals(self) -> dict:
+        """{name: total} of each count and of the sum of each histogram,
+        over all labels"""
+        totals = defaultdict(float)
+        with self._lock:
+            for (name, _), value in self._counters.items():
+                totals[name] += value
+            for name, series in self._histograms.items():
+                totals[name] = sum(values[-2] for values in series.values())
+        return dict(totals)
+
+    def render(self) -> str:
+        """measurements in the prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = defaultdict(list)
+            for (name, labels), value in sorted(self._counters.items()):
+                counters[name].append((labels, value))
+            for name, series in sorted(counters.items()):
+                metric = f"{self.prefix}{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in series:
+                    lines.append(f"{metric}{_label_text(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                metric = self.prefix + name
+                buckets = _buckets(name)
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, values in sorted(series.items()):
+                    for bound, count in zip(buckets, values):
+                        bucket = _label_text(labels, f'le="{bound:g}"')
+                        lines.append(f"{metric}_bucket{bucket} {count}")
+                    bucket = _label_text(labels, 'le="+Inf"')
+                    lines.append(f"{metric}_bucket{bucket} {values[-1]}")
+                    lines.append(f"{metric}_sum{_label_text(labels)} {values[-2]:g}")
+                    lines.append(f"{metric}_count{_label_text(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """forgets all measurements"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class OpenTelemetryMetrics(Metrics):
+    """records measurements as OpenTelemetry histograms and counters, exported by
+    whichever MeterProvider is configured (pip install opentelemetry-api).
+
+    meter: optional Meter, by default the 'wikigeo' meter of the global provider"""
+
+    enabled = True
+
+    def __init__(self, meter=None, prefix: str = "wikigeo."):
+        if meter is None:
+            try:
+                from opentelemetry import metrics as otel_metrics
+            except ImportError:
+                raise ImportError(
+                    "opentelemetry-api must be installed to use OpenTelemetryMetrics"
+                ) from None
+            meter = otel_metrics.get_meter("wikigeo")
+        self.meter = meter
+        self.prefix = prefix
+        self._instruments = {}
+        self._lock = threading.Lock()
+
+    def _instrument(self, name: str, create):
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    instrument = create(self.prefix + name, unit=_unit(name))
+                    self._instruments[name] = instrument
+        return instrument
+
+    def observe(self, name: str, value: float, **labels):
+        histogram = self._instrument(name, self.meter.create_histogram)
+        histogram.record(value, attributes=labels)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        counter = self._instrument(name, self.meter.create_counter)
+        counter.add(value, attributes=labels)
+
+
+def host_of(url: str) -> str:
+    """host label for a url"""
+    return urlparse(url).netloc or url
@@ -0,0 +1,237 @@
+"""Limiting the rate of requests sent to each wiki, and holding requests back
+from wikis that are failing"""
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+from urllib.parse import urlparse
+from wikigeo.wikisource.errors import CircuitOpenError
+
+# statuses of responses worth sending again after a wait
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HostLimiter:
+    """token bucket, concurrency limit and circuit breaker for requests to one host.
+
+    rate: requests per second, None for no limit
+
+    burst: number of requests that can be sent at once before being limited
+
+    maxconcurrent: max requests in flight at once, None for no limit
+
+    failures: number of failed requests in a row after which requests to the host
+    raise CircuitOpenError without being sent, None to always send
+
+    cooldown: seconds requests are held back for before one is let through to test
+    the host. If it succeeds requests are sent again, if not they are held back again
+
+    name: host name given in errors"""
+
+    def __init__(
+        self,
+        rate: Optional[float] = 10,
+        burst: Optional[int] = None,
+        maxconcurrent: Optional[int] = 10,
+        failures: Optional[int] = 5,
+        cooldown: float = 30,
+        name: str = "",
+    ):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.maxconcurrent = maxconcurrent
+        self.failures = failures
+        self.cooldown = cooldown
+        self.name = name
+        self.waited = 0.0
+        self._failed = 0
+        self._open_until = 0.0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._slots = (
+            threading.BoundedSemaphore(maxconcurrent) if maxconcurrent else None
+        )
+        # asyncio semaphores only work within one event loop, so one is kept per loop
+        self._async_slots = weakref.WeakKeyDictionary()
+
+    def reserve(self) -> float:
+        """takes a token and returns the seconds to wait before sending the request"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.rate is None:
+                return wait
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # tokens go negative to queue requests behind each other
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            self.waited += wait
+            return wait
+
+    def pause(self, seconds: float):
+        """holds back all requests to the host, e.g. for a Retry-After header"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def check(self):
+        """raises CircuitOpenError if requests to the host are being held back"""
+        if self.failures is None:
+            return
+        with self._lock:
+            if self._failed < self.failures:
+                return
+            now = time.monotonic()
+            if now < self._open_until:
+                raise CircuitOpenError(self.name, self._open_until - now)
+            # letting this request through to test the host, holding back the rest
+            self._open_until = now + self.cooldown
+
+    def reset(self):
+        """closes the circuit breaker, e.g. between tests sharing the default limiter"""
+        with self._lock:
+            self._failed = 0
+            self._open_until = 0.0
+
+    def succeeded(self):
+        """records a request the host answered"""
+        with self._lock:
+            self._failed = 0
+
+    def failed(self):
+        """records a request that failed because the host is unavailable or
+        overloaded, holding back requests once there are enough in a row"""
+        with self._lock:
+            self._failed += 1
+            if self.failures is not None and self._failed >= self.failures:
+                self._open_until = time.monotonic() + self.cooldown
+
+    @contextmanager
+    def slot(self, check: bool = True):
+        """blocks until a request can be sent within the limits,
+        raising CircuitOpenError if requests to the host are being held back.
+
+        check: False for retries of a request that was already checked, so the
+        request let through to test the host can back off and retry like any other"""
+        if check:
+            self.check()
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            time.sleep(self.reserve())
+            yield
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    @asynccontextmanager
+    async def async_slot(self, check: bool = True):
+        """slot for coroutines, waiting without blocking the event loop.
+        Coroutines in an event loop are limited to maxconcurrent requests in flight,
+        separately from threads using slot"""
+        import asyncio
+
+        if check:
+            self.check()
+        slots = None
+        if self.maxconcurrent:
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                slots = self._async_slots.get(loop)
+                if slots is None:
+                    slots = self._async_slots[loop] = asyncio.Semaphore(
+                        self.maxconcurrent
+                    )
+        if slots is None:
+            await asyncio.sleep(self.reserve())
+            yield
+            return
+        async with slots:
+            await asyncio.sleep(self.reserve())
+            yield
+
+
+class RateLimiter:
+    """per host request limits, shared by all APIs in a process by default.
+    Each language wiki and commons are limited separately.
+
+    rate: default requests per second for each host, None for no limit
+
+    maxconcurrent: default max requests in flight for each host, None for no limit
+
+    failures, cooldown: default circuit breaker settings for each host, see HostLimiter
+
+    hosts: optional dictionary of host to dictionary of HostLimiter
+    arguments to override the defaults e.g.
+    {'commons.wikimedia.org': {'rate': 2, 'maxconcurrent': 2}}"""
+
+    def __init__(
+        self,
+        rate: Optional[float] = 10,
+        maxconcurrent: Optional[int] = 10,
+        hosts: Optional[dict] = None,
+        failures: Optional[int] = 5,
+        cooldown: float = 30,
+    ):
+        self.rate = rate
+        self.maxconcurrent = maxconcurrent
+        self.failures = failures
+        self.cooldown = cooldown
+        self.hosts = hosts or {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def host(self, url: str) -> HostLimiter:
+        """returns the limiter for the host of the given url"""
+        host = urlparse(url).netloc or url
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                settings = {
+                    "rate": self.rate,
+                    "maxconcurrent": self.maxconcurrent,
+                    "failures": self.failures,
+                    "cooldown": self.cooldown,
+                    "name": host,
+                }
+                settings.update(self.hosts.get(host, {}))
+                limiter = HostLimiter(**settings)
+                self._limiters[host] = limiter
+            return limiter
+
+    def reset(self):
+        """closes the circuit breakers of every host"""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        for limiter in limiters:
+            limiter.reset()
+
+    def waited(self) -> dict:
+        """returns seconds spent waiting for each host"""
+        with self._lock:
+            return {host: limiter.waited for host, limiter in self._limiters.items()}
+
+
+def retry_after(headers, default: Optional[float] = 5) -> Optional[float]:
+    """seconds to wait given in a Retry-After header, or default if not given"""
+    try:
+        return float(headers.get("Retry-After", default))
+    except (TypeError, ValueError):
+        return default
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30) -> float:
+    """seconds to wait before retry number attempt (from 0), doubling each time
+    up to cap, with half of it random so clients retrying together spread out"""
+    delay = min(cap, base * 2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+DEFAULT_LIMITER = RateLimiter()
@@ -0,0 +1,49 @@
+"""Sharing HTTP sessions between all requests to each host"""
+import threading
+from urllib.parse import urlparse
+import requests
+
+
+class SessionPool:
+    """process-wide pool of keep-alive sessions, one per host.
+
+    Sessions are shared by WikipediaAPI instances and the page scraper, so
+    connections (and their TCP and TLS handshakes) are reused between requests
+    and threads. requests does not support HTTP/2, connections are HTTP/1.1 keep-alive.
+
+    maxsize: max number of open connections kept to each host. Threads wait
+    for a free connection rather than opening more"""
+
+    def __init__(self, maxsize: int = 10):
+        self.maxsize = maxsize
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> requests.Session:
+        """returns the shared session for the host of the given url"""
+        host = urlparse(url).netloc or url
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.maxsize, pool_block=True
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def close(self):
+        """closes all sessions and their connections"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+DEFAULT_POOL = SessionPool()
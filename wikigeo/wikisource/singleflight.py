@@ -0,0 +1,89 @@
+"""Sharing one request between concurrent calls sending the same query"""
+import copy
+import threading
+from typing import Callable, Optional, Tuple
+
+# query parameters holding a "lat|lon" coordinate
+COORD_PARAMS = ("ggscoord", "gscoord")
+
+
+def round_coords(query: dict, precision: Optional[int]) -> dict:
+    """query with its coordinates rounded to precision decimal places,
+    so searches from nearly the same point send the same query
+
+    precision: decimal places, None to leave coordinates as given"""
+    if precision is None:
+        return query
+    rounded = dict(query)
+    for param in COORD_PARAMS:
+        coords = rounded.get(param)
+        if coords is None:
+            continue
+        try:
+            lat, lon = (float(value) for value in str(coords).split("|"))
+        except ValueError:
+            continue
+        rounded[param] = f"{round(lat, precision)}|{round(lon, precision)}"
+    return rounded
+
+
+class _Call:
+    """a call in flight and the callers waiting for it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiting = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """runs a function once for concurrent calls with the same key,
+    giving every caller its result or error. Calls made after it returns run again,
+    so nothing is kept once a call completes (see ResponseCache for that).
+
+    Callers waiting on another's call receive copies of the result,
+    so each can merge and alter the results it is given."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, function: Callable[[], dict]) -> Tuple[dict, bool]:
+        """returns function(), or the result of the call already in flight for key,
+        and whether it was the result of a call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiting += 1
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+        try:
+            result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                # no more callers can join once the call is removed
+                del self._calls[key]
+                shared = call.waiting > 0
+            if call.error is None and shared:
+                # a copy the leader can't alter while the others copy it in turn
+                call.result = copy.deepcopy(result)
+            call.done.set()
+        return result, False
+
+    def __len__(self):
+        return len(self._calls)
+
+
+DEFAULT_FLIGHTS = SingleFlight()
@@ -0,0 +1,113 @@
+"""Storing scraped page text so unchanged pages aren't downloaded again"""
+import sqlite3
+import threading
+from typing import Optional
+
+
+class PageTextStore:
+    """store of scraped page text keyed on page title and wiki language.
+
+    Each page's text is kept with its revision id and the ETag and Last-Modified
+    headers of the response it was scraped from, so later scrapes can send a
+    conditional request, and batched revision checks can skip unchanged pages.
+
+    path: optional sqlite file to keep text between runs, in memory by default"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.reused = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pagetext ("
+            "title TEXT, language TEXT, text TEXT, complete INTEGER, revid INTEGER, "
+            "etag TEXT, last_modified TEXT, PRIMARY KEY (title, language))"
+        )
+        self._conn.commit()
+
+    def get(self, title: str, language: str) -> Optional[dict]:
+        """returns the stored page with text, complete, revid, etag and
+        last_modified keys, or None if the page hasn't been stored"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, complete, revid, etag, last_modified FROM pagetext "
+                "WHERE title = ? AND language = ?",
+                (title, language),
+            ).fetchone()
+        if row is None:
+            return None
+        text, complete, revid, etag, last_modified = row
+        return {
+            "text": text,
+            "complete": bool(complete),
+            "revid": revid,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+
+    def set(
+        self,
+        title: str,
+        language: str,
+        text: str,
+        complete: bool,
+        revid: Optional[int] = None,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        """stores the text of a page.
+
+        complete: False if the text was cut short by a character limit"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pagetext VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (title, language, text, int(complete), revid, etag, last_modified),
+            )
+            self._conn.commit()
+            self.fetched += 1
+
+    def set_revid(self, title: str, language: str, revid: int):
+        """records the revision id of a stored page"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE pagetext SET revid = ? WHERE title = ? AND language = ?",
+                (revid, title, language),
+            )
+            self._conn.commit()
+
+    def reuse(self, page: dict, char_limit: Optional[int] = None) -> str:
+        """returns the text of a stored page, counting it as reused"""
+        with self._lock:
+            self.reused += 1
+        return page["text"][:char_limit] if char_limit else page["text"]
+
+    @staticmethod
+    def usable(
+        page: dict, char_limit: Optional[int] = None, revid: Optional[int] = None
+    ) -> bool:
+        """checks if a stored page has enough text for the character limit,
+        and is of the given revision"""
+        if revid is not None and page["revid"] != revid:
+            return False
+        return page["complete"] or bool(char_limit and len(page["text"]) >= char_limit)
+
+    def clear(self):
+        """removes all stored pages and resets counters"""
+        with self._lock:
+            self._conn.execute("DELETE FROM pagetext")
+            self._conn.commit()
+            self.reused = 0
+            self.fetched = 0
+
+    def stats(self) -> dict:
+        """returns counts of pages reused and fetched"""
+        return {
+            "reused": self.reused,
+            "fetched": self.fetched,
+            "size": len(self),
+        }
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pagetext").fetchone()[0]
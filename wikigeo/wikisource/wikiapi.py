@@ -1,86 +1,389 @@
 """Querying Wikipedia's APIs"""
+import concurrent.futures
 import logging
+import threading
 import time
-from typing import Iterator
-import requests_html as r
+from typing import Iterator, Optional, Tuple
+import requests
+from wikigeo.wikisource.cache import ResponseCache, cache_key
+from wikigeo.wikisource.errors import APIError, RequestError, ThrottledError
+from wikigeo.wikisource.metrics import DEFAULT_METRICS, Metrics, host_of
+from wikigeo.wikisource.ratelimit import (
+    DEFAULT_LIMITER,
+    RETRY_STATUSES,
+    RateLimiter,
+    backoff_delay,
+    retry_after,
+)
+from wikigeo.wikisource.sessions import DEFAULT_POOL, SessionPool
+from wikigeo.wikisource.singleflight import DEFAULT_FLIGHTS, SingleFlight, round_coords
+
+logger = logging.getLogger(__name__)
+
+# most pages TextExtracts gives extracts for in one response
+EXTRACTS_LIMIT = 20
 
 
 class WikipediaAPI:
 
     """sends queries to the Wikipedia API
     language options and stats can be found here:
-    https://en.wikipedia.org/wiki/List_of_Wikipedias"""
+    https://en.wikipedia.org/wiki/List_of_Wikipedias
+
+    url: optional api.php endpoint to send queries to instead of the language wiki
+    or commons, e.g. of another MediaWiki site
+
+    cache: optional ResponseCache shared between instances to reuse responses
+
+    ratelimiter: RateLimiter for requests, by default shared by all instances
+
+    maxlag: seconds of database replication lag at which the API asks
+    for requests to be retried later, None to not send maxlag
+    see https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+
+    retries: times to retry a request that was throttled (429 or maxlag), met a server
+    error (5xx) or couldn't connect. Each retry waits for Retry-After if the server
+    gives it, otherwise for a jittered exponential backoff
+
+    backoff: seconds waited before the first retry without Retry-After, doubling
+    for each retry after
+
+    sessionpool: SessionPool the connection to the API is taken from,
+    by default shared by all instances
+
+    prefetch: if True, each continuation is requested as soon as its continue
+    parameters are known, while the previous page of results is being merged
+
+    metrics: Metrics that request timings, sizes, retries and cache hits are
+    reported to, by default not recorded
+
+    singleflight: SingleFlight that identical queries sent at the same time from
+    any thread share one request through, by default shared by all instances.
+    None to send every query
+
+    coordprecision: decimal places coordinates in queries are rounded to, so nearby
+    searches share requests and cached responses (5 is about 1m), None to send
+    coordinates as given
+
+    Failed requests raise a WikiError (see wikigeo.wikisource.errors): ThrottledError
+    once retries run out, RequestError for other error responses, APIError for errors
+    reported by the API and CircuitOpenError without sending the request when
+    requests to the wiki keep failing (see HostLimiter)"""
 
     def __init__(
-        self, userinfo: str, language: str = "en", commons: bool = False
+        self,
+        userinfo: str,
+        language: str = "en",
+        commons: bool = False,
+        cache: Optional[ResponseCache] = None,
+        ratelimiter: RateLimiter = DEFAULT_LIMITER,
+        maxlag: Optional[int] = 5,
+        retries: int = 3,
+        backoff: float = 0.5,
+        sessionpool: SessionPool = DEFAULT_POOL,
+        prefetch: bool = False,
+        metrics: Metrics = DEFAULT_METRICS,
+        singleflight: Optional[SingleFlight] = DEFAULT_FLIGHTS,
+        coordprecision: Optional[int] = 5,
+        url: Optional[str] = None,
     ):
         self.headers = {"User-agent": userinfo}
-        self.session = r.HTMLSession()
-        if commons:
+        if url is not None:
+            self.url = url
+        elif commons:
             self.url = "https://commons.wikimedia.org/w/api.php"
         else:
             self.url = f"https://{language}.wikipedia.org/w/api.php"
-        self.query = None
+        self.session = sessionpool.get(self.url)
+        # query state is kept per thread so one instance can be shared by threads
+        self._local = threading.local()
+        self.cache = cache
+        self.ratelimiter = ratelimiter
+        self.maxlag = maxlag
+        self.retries = retries
+        self.backoff = backoff
+        self.prefetch = prefetch
+        self.metrics = metrics
+        self.singleflight = singleflight
+        self.coordprecision = coordprecision
+
+    @property
+    def query(self) -> Optional[dict]:
+        """query being sent by the current thread"""
+        return getattr(self._local, "query", None)
+
+    @query.setter
+    def query(self, query: dict):
+        self._local.query = query
+
+    @property
+    def from_cache(self) -> bool:
+        """whether the last response in the current thread came from the cache"""
+        return getattr(self._local, "from_cache", False)
+
+    @from_cache.setter
+    def from_cache(self, from_cache: bool):
+        self._local.from_cache = from_cache
 
     def _send_query(self) -> dict:
         """sends query and returns response"""
-        logging.debug("sending query: %s", self.query)
-        response = self.session.get(self.url, params=self.query, headers=self.headers)
-        logging.debug(response)
+        metrics = self.metrics
+        if self.cache is not None:
+            cached = self.cache.get(self.url, self.query)
+            self.from_cache = cached is not None
+            if metrics.enabled:
+                name = "cache_hits" if self.from_cache else "cache_misses"
+                metrics.increment(name, host=host_of(self.url))
+            if self.from_cache:
+                return cached
+        if self.singleflight is None:
+            return self._request()
+        key = cache_key(self.url, self.query)
+        result, coalesced = self.singleflight.do(key, self._request)
+        if coalesced:
+            logger.debug("shared request in flight for %s", self.query)
+            if metrics.enabled:
+                metrics.increment("coalesced", host=host_of(self.url))
+        return result
+
+    def _request(self) -> dict:
+        """sends query to the API and returns response"""
+        metrics = self.metrics
+        logger.debug("sending query: %s", self.query)
+        response = self._throttled_get()
         if not response.ok:
-            raise Exception(response)
-        result = response.json()
+            raise _request_error(response.status_code, self.url)
+        if metrics.enabled:
+            host = host_of(self.url)
+            metrics.observe("response_bytes", len(response.content), host=host)
+            with metrics.timer("decode_seconds", host=host):
+                result = response.json()
+        else:
+            result = response.json()
+        error = result.get("error")
+        if error is not None:
+            logger.warning(error)
+            if _is_throttled(response):
+                raise ThrottledError(
+                    f"{self.url} lagged after {self.retries} retries: {error}",
+                    response.status_code,
+                    self.url,
+                )
+            raise APIError(
+                "Check parameters; " + str(result),
+                error.get("code", ""),
+                error.get("info", ""),
+            )
+        if self.cache is not None:
+            self.cache.set(self.url, self.query, result)
+        return result
+
+    def _throttled_get(self):
+        """sends query within the rate limit for the host, waiting and retrying
+        if the API asks to slow down, is unavailable or can't be reached"""
+        params = dict(self.query)
+        if self.maxlag is not None:
+            params["maxlag"] = self.maxlag
+        limiter = self.ratelimiter.host(self.url)
+        metrics = self.metrics
+        host = host_of(self.url) if metrics.enabled else None
+        # checked once, so retries back off rather than fail while the host is tested
+        limiter.check()
+        for attempt in range(self.retries + 1):
+            queued = time.perf_counter()
+            try:
+                with limiter.slot(check=False):
+                    sent = time.perf_counter()
+                    response = self.session.get(
+                        self.url, params=params, headers=self.headers
+                    )
+            except requests.RequestException as error:
+                if attempt == self.retries:
+                    limiter.failed()
+                    raise RequestError(
+                        f"request to {self.url} failed: {error}", url=self.url
+                    ) from error
+                wait = backoff_delay(attempt, self.backoff)
+                logger.warning(
+                    "request to %s failed, retrying in %.2fs: %s", self.url, wait, error
+                )
+            else:
+                if metrics.enabled:
+                    metrics.observe("ratelimit_wait_seconds", sent - queued, host=host)
+                    metrics.observe(
+                        "request_seconds", time.perf_counter() - sent, host=host
+                    )
+                logger.debug(response)
+                if not _is_throttled(response):
+                    limiter.succeeded()
+                    return response
+                if attempt == self.retries:
+                    limiter.failed()
+                    return response
+                wait = retry_after(response.headers, default=None)
+                if wait is None:
+                    wait = backoff_delay(attempt, self.backoff)
+                logger.warning("throttled by %s, retrying in %.2fs", self.url, wait)
+            metrics.increment("retries", host=host)
+            limiter.pause(wait)
+
+    def _fetch(self, query: dict) -> dict:
+        """sends a query from any thread"""
+        self.query = query
+        return self._send_query()
+
+    def _continue_query(
+        self, query: dict, result: dict, batches: bool
+    ) -> Optional[dict]:
+        """query for the results following result, or None if there are no more"""
+        if "continue" not in result.keys():
+            return None
+        if "batchcomplete" in result.keys() and not batches:
+            logger.debug("batchcomplete and continue present")
+            return None
+        logger.debug("getting next page from %s", result["continue"])
+        if self.metrics.enabled:
+            self.metrics.increment("continuations", host=host_of(self.url))
+        # sending the original query with only the latest continue parameters
+        return dict(query, **result["continue"])
+
+    def _next_search_results(
+        self, result: dict, batches: bool = False
+    ) -> Iterator[dict]:
+        """get next set of results for query response
+
+        batches: if True, continues past the end of each batch of generated pages
+        until the generator has no more results"""
+        # kept as the caller may send other queries in this thread between results
+        query = self.query
+        executor = (
+            concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            if self.prefetch
+            else None
+        )
         try:
-            logging.warning(result["error"])
-            raise Exception("Check parameters; " + str(result))
-        except KeyError:
-            return result
-
-    def _next_search_results(self, result: dict) -> Iterator[dict]:
-        """get next set of results for query response"""
-        yield result
-        while "continue" in result.keys():
-            if "batchcomplete" in result.keys():
-                logging.debug("batchcomplete and continue present")
-                break
-            logging.debug("getting next page from %s", result["continue"])
-            # adding continue parameters to query
-            for cont_param, value in result["continue"].items():
-                self.query[cont_param] = value
-            next_result = self._send_query()
-            time.sleep(1)
-            yield next_result
-            # checking if new results are the same as the previous
-            if next_result == result:
-                logging.debug("got same results")
-                break
-            result = next_result
+            while True:
+                next_query = self._continue_query(query, result, batches)
+                future = None
+                if executor is not None and next_query is not None:
+                    # the next page is fetched while the caller handles this one
+                    future = executor.submit(self._fetch, next_query)
+                yield result
+                if next_query is None:
+                    break
+                next_result = future.result() if future else self._fetch(next_query)
+                # checking if new results are the same as the previous
+                if next_result == result:
+                    logger.debug("got same results")
+                    break
+                result = next_result
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
 
         if "batchcomplete" in result.keys():
-            logging.debug("batchcomplete")
+            logger.debug("batchcomplete")
         else:
-            logging.warning("continue not in new batch")
+            logger.warning("continue not in new batch")
 
-    def get_data(self, query: dict) -> dict:
-        """return all data from search"""
-        self.query = query
+    def get_data(self, query: dict, aliases: Optional[dict] = None) -> dict:
+        """return all data from search
+
+        aliases: optional dictionary filled with the titles the API
+        normalised or redirected, mapped to the title of the page returned"""
+        self.query = round_coords(dict(query), self.coordprecision)
         first_page = self._send_query()
         all_pages = self._next_search_results(first_page)
         combined_results = {}
 
         for page in all_pages:
-            result = page.get('query')
-            if result is None:
-                continue
-            for article, data in result['pages'].items():
-                # updating the old results
-                if article not in combined_results.keys():
-                    combined_results[article] = data
-                else:
-                    combined_results[article].update(data)
+            merge_pages(combined_results, page, aliases)
 
         return combined_results
 
+    def iter_pages(
+        self, query: dict, aliases: Optional[dict] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        """yields (pageid, page) for every page the query returns, following
+        continuation until there are no more results.
+
+        Pages are yielded as each batch completes, once all their props have arrived,
+        and are then dropped, so large generator crawls don't have to fit in memory.
+        dict(api.iter_pages(query)) gives the same pages as get_data for queries
+        that fit in one batch.
+
+        aliases: optional dictionary filled with the titles the API
+        normalised or redirected, mapped to the title of the page returned"""
+        self.query = round_coords(dict(query), self.coordprecision)
+        result = self._send_query()
+        batch = {}
+        for page in self._next_search_results(result, batches=True):
+            merge_pages(batch, page, aliases)
+            if "batchcomplete" in page.keys():
+                yield from batch.items()
+                batch = {}
+        yield from batch.items()
+
+
+def _is_throttled(response) -> bool:
+    """checks if the API asked for the request to be sent again later"""
+    if response.status_code in RETRY_STATUSES:
+        return True
+    return response.headers.get("MediaWiki-API-Error") == "maxlag"
+
+
+def _request_error(status: int, url: str) -> RequestError:
+    """error for a response with an error status"""
+    if status in RETRY_STATUSES:
+        return ThrottledError(
+            f"{status} response from {url} after retries", status, url
+        )
+    return RequestError(f"{status} response from {url}", status, url)
+
+
+def merge_pages(combined_results: dict, page: dict, aliases: Optional[dict] = None):
+    """adds the articles from a page of results to the combined results"""
+    result = page.get('query')
+    if result is None:
+        return
+    if aliases is not None:
+        for alias in result.get('normalized', []) + result.get('redirects', []):
+            aliases[alias['from']] = alias['to']
+    for article, data in result['pages'].items():
+        # updating the old results
+        if article not in combined_results.keys():
+            combined_results[article] = data
+        else:
+            merge_data(combined_results[article], data)
+
+
+def merge_data(combined: dict, data: dict):
+    """merges continued props of a page into the props already received.
+    lists are extended, skipping pages (items with a pageid or title) already in
+    the list, dictionaries merged and other values replaced"""
+    for key, value in data.items():
+        old = combined.get(key)
+        if isinstance(old, dict) and isinstance(value, dict):
+            merge_data(old, value)
+        elif isinstance(old, list) and isinstance(value, list):
+            seen = {_item_key(item) for item in old} - {None}
+            for item in value:
+                item_key = _item_key(item)
+                if item_key is None or item_key not in seen:
+                    old.append(item)
+                    seen.add(item_key)
+        else:
+            combined[key] = value
+
+
+def _item_key(item):
+    """pageid or title of a page in a list prop, None for other items"""
+    if isinstance(item, dict):
+        if "pageid" in item:
+            return item["pageid"]
+        return item.get("title")
+    return None
+
 
 def query_nearby(
     lat: float, lon: float, limit: int, radiusmetres: int
@@ -90,11 +393,11 @@ def query_nearby(
     https://en.wikipedia.org/w/api.php?action=help&modules=query+geosearch"""
 
     if not 10 <= radiusmetres <= 10000:
-        raise Exception(
+        raise ValueError(
             "Check parameters; radiusmetres must be an int between 10 and 10000"
         )
     if not 0 < limit <= 500:
-        raise Exception("Check parameters; limit must be an int between 1 and 500")
+        raise ValueError("Check parameters; limit must be an int between 1 and 500")
 
     query = {
         "format": "json",
@@ -104,6 +407,10 @@ def query_nearby(
         "ggsradius": f"{radiusmetres}",
         "action": "query",
         "prop": "coordinates|pageterms|pageimages",
+        # props default to 10 coordinates and 50 images per response, so large
+        # searches would otherwise need many continuations
+        "colimit": f"{limit}",
+        "pilimit": "max",
     }
     return query
 
@@ -114,7 +421,7 @@ def query_by_string(search_string: str, limit: int = 5) -> dict:
     and for query here: https://www.mediawiki.org/wiki/API:Query"""
 
     if not 0 < limit <= 500:
-        raise Exception("Check parameters; limit must be an int between 1 and 500")
+        raise ValueError("Check parameters; limit must be an int between 1 and 500")
 
     query = {
         "format": "json",
@@ -131,6 +438,55 @@ def query_by_string(search_string: str, limit: int = 5) -> dict:
     return query
 
 
+def query_by_titles(titles: list, extract_chars: Optional[int] = None) -> dict:
+    """query to get coordinates, terms, images and intro extracts for up to 50 pages
+    by title. redirects are followed. Extracts are only given for EXTRACTS_LIMIT
+    pages per response, so more titles need continuations.
+    options for extracts found here: https://www.mediawiki.org/wiki/Extension:TextExtracts
+
+    extract_chars: optional max number of characters of each extract (max 1200)"""
+
+    if not 0 < len(titles) <= 50:
+        raise ValueError("Check parameters; titles must contain between 1 and 50 titles")
+
+    query = {
+        "format": "json",
+        "action": "query",
+        "titles": "|".join(titles),
+        "redirects": "1",
+        "prop": "coordinates|pageterms|pageimages|extracts",
+        "piprop": "original",
+        "pilimit": "max",
+        "colimit": "max",
+        "coprimary": "primary",
+        "exintro": "1",
+        "explaintext": "1",
+        "exlimit": f"{min(len(titles), EXTRACTS_LIMIT)}",
+    }
+    if extract_chars:
+        query["exchars"] = f"{extract_chars}"
+    return query
+
+
+def query_last_revisions(titles: list) -> dict:
+    """query to get the id of the latest revision of up to 50 pages by title,
+    without their content. redirects are followed.
+    options for info found here:
+    https://www.mediawiki.org/wiki/API:Info"""
+
+    if not 0 < len(titles) <= 50:
+        raise ValueError("Check parameters; titles must contain between 1 and 50 titles")
+
+    query = {
+        "format": "json",
+        "action": "query",
+        "titles": "|".join(titles),
+        "redirects": "1",
+        "prop": "info",
+    }
+    return query
+
+
 def query_parse_page(pagetitle: int, to_parse: list) -> dict:
     """query to parse a wiki page by page title.
     options for what to parse can be found here:
@@ -145,23 +501,29 @@ def query_parse_page(pagetitle: int, to_parse: list) -> dict:
     return query
 
 
-def query_commons_nearby(lat: float, lon: float, radiusmetres: int) -> dict:
-    """get images near given coordinates from wikimedia commons.
+def query_commons_nearby(
+    lat: float, lon: float, radiusmetres: int, limit: int = 5
+) -> dict:
+    """get up to limit (max 500) images near given coordinates from wikimedia commons.
+    image info and coordinates for many images arrive over several continuations.
     options for image info are found here:
         https://www.mediawiki.org/w/api.php?action=help&modules=query%2Bimageinfo"""
 
     if not 10 <= radiusmetres <= 10000:
-        raise Exception(
+        raise ValueError(
             "Check parameters; radiusmetres must be an int between 10 and 10000"
         )
+    if not 0 < limit <= 500:
+        raise ValueError("Check parameters; limit must be an int between 1 and 500")
 
     query = {
         "format": "json",
         "action": "query",
         "generator": "geosearch",
         "ggscoord": f"{lat}|{lon}",
-        "ggslimit": 5,
+        "ggslimit": f"{limit}",
         "prop": "imageinfo|imagelabels|coordinates",
+        "colimit": f"{limit}",
         "iilimit": 1,
         "iiprop": "url|extmetadata",
         "iiurlwidth": "250",
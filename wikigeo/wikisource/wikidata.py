@@ -0,0 +1,177 @@
+"""Querying Wikidata for the coordinates, labels and images of many places at once"""
+import logging
+from typing import Iterable, List, Optional, Sequence
+from urllib.parse import quote
+from wikigeo.wikisource.wikiapi import WikipediaAPI
+
+logger = logging.getLogger(__name__)
+
+WIKIDATA_URL = "https://www.wikidata.org/w/api.php"
+
+# properties read from each entity's claims
+COORDINATES = "P625"
+IMAGE = "P18"
+
+
+class WikidataAPI(WikipediaAPI):
+    """sends wbgetentities queries to Wikidata, up to 50 entities per request.
+    Requests share the rate limiting, retries, caching and metrics of WikipediaAPI,
+    with wikidata.org limited as its own host.
+
+    languages: language codes of the labels and descriptions to get
+
+    other arguments: see WikipediaAPI, e.g. cache and ratelimiter"""
+
+    def __init__(
+        self,
+        userinfo: str,
+        languages: Sequence[str] = ("en",),
+        url: str = WIKIDATA_URL,
+        **kwargs,
+    ):
+        super().__init__(userinfo, url=url, **kwargs)
+        self.languages = list(languages)
+
+    def _get_entities(self, query: dict) -> dict:
+        """entities returned for a wbgetentities query"""
+        self.query = query
+        return self._send_query().get("entities", {})
+
+    def get_entities(self, ids: Iterable[str]) -> dict:
+        """
+
+        Get coordinates, labels, descriptions and image of many entities by id,
+        sending up to 50 ids per request.
+
+        ids: Wikidata ids e.g. ['Q1190812', 'Q23311']
+
+        returns dictionary of each given id to its entity (see parse_entity),
+        or None for ids that don't exist
+
+        """
+        ids = list(dict.fromkeys(ids))
+        entities = {}
+        logger.debug("getting %s entities", len(ids))
+        for batch in _chunks(ids):
+            query = query_entities(ids=batch, languages=self.languages)
+            for entity_id, entity in self._get_entities(query).items():
+                entities[entity_id] = parse_entity(entity, self.languages)
+        return {entity_id: entities.get(entity_id) for entity_id in ids}
+
+    def get_entities_by_titles(
+        self, titles: Iterable[str], site: str = "enwiki"
+    ) -> dict:
+        """
+
+        Get the entities of many Wikipedia pages by title, sending up to 50 titles
+        per request, e.g. to find the Wikidata ids of a list of places.
+
+        titles: exact titles of pages on site. Pages are matched to entities by
+        their sitelink, so titles that redirect or need normalising give None
+
+        site: wiki the titles are from, e.g. 'enwiki' or 'dewiki'
+
+        returns dictionary of each given title to its entity (see parse_entity),
+        or None for pages without an entity
+
+        """
+        titles = list(dict.fromkeys(titles))
+        entities = {}
+        for batch in _chunks(titles):
+            query = query_entities(titles=batch, site=site, languages=self.languages)
+            for entity in self._get_entities(query).values():
+                parsed = parse_entity(entity, self.languages)
+                if parsed is not None:
+                    entities[parsed["sitelinks"].get(site)] = parsed
+        logger.debug("found entities for %s of %s titles", len(entities), len(titles))
+        return {title: entities.get(title) for title in titles}
+
+
+def _chunks(values: list, size: int = 50) -> List[list]:
+    """splits values into batches that fit in one request"""
+    return [values[i : i + size] for i in range(0, len(values), size)]
+
+
+def query_entities(
+    ids: Optional[List[str]] = None,
+    titles: Optional[List[str]] = None,
+    site: str = "enwiki",
+    languages: Sequence[str] = ("en",),
+) -> dict:
+    """query to get labels, descriptions, claims and sitelinks of up to 50 entities
+    by id, or by the titles of their pages on site.
+    options for wbgetentities found here:
+    https://www.wikidata.org/w/api.php?action=help&modules=wbgetentities"""
+
+    values = ids if ids is not None else titles
+    if not values or len(values) > 50:
+        raise ValueError("Check parameters; give between 1 and 50 ids or titles")
+
+    query = {
+        "format": "json",
+        "action": "wbgetentities",
+        "props": "labels|descriptions|claims|sitelinks",
+        "languages": "|".join(languages),
+    }
+    if ids is not None:
+        query["ids"] = "|".join(ids)
+    else:
+        query["titles"] = "|".join(titles)
+        query["sites"] = site
+        query["sitefilter"] = site
+    return query
+
+
+def parse_entity(entity: dict, languages: Sequence[str] = ("en",)) -> Optional[dict]:
+    """shapes a wbgetentities entity into a dictionary with id, labels and
+    descriptions in each language, coordinates, image and sitelinks, or None if
+    the entity is missing"""
+    if "missing" in entity:
+        return None
+    claims = entity.get("claims", {})
+    coordinates = _claim_value(claims, COORDINATES)
+    image = _claim_value(claims, IMAGE)
+    return {
+        "id": entity["id"],
+        "labels": _by_language(entity.get("labels", {}), languages),
+        "descriptions": _by_language(entity.get("descriptions", {}), languages),
+        "coordinates": (
+            {"lat": coordinates["latitude"], "lon": coordinates["longitude"]}
+            if coordinates
+            else None
+        ),
+        "image": commons_file_url(image) if image else None,
+        "sitelinks": {
+            site: link["title"] for site, link in entity.get("sitelinks", {}).items()
+        },
+    }
+
+
+def _by_language(terms: dict, languages: Sequence[str]) -> dict:
+    """term in each of the languages it is given in"""
+    return {
+        language: terms[language]["value"]
+        for language in languages
+        if language in terms
+    }
+
+
+def _claim_value(claims: dict, prop: str):
+    """value of the best claim for a property: the first preferred one,
+    otherwise the first that isn't deprecated. None if there is none"""
+    statements = [
+        statement
+        for statement in claims.get(prop, [])
+        if statement.get("rank") != "deprecated"
+        and statement["mainsnak"].get("snaktype") == "value"
+    ]
+    if not statements:
+        return None
+    preferred = [s for s in statements if s.get("rank") == "preferred"]
+    return (preferred or statements)[0]["mainsnak"]["datavalue"]["value"]
+
+
+def commons_file_url(filename: str) -> str:
+    """url that redirects to the file of a Commons image name"""
+    name = quote(filename.replace(" ", "_"))
+    return f"https://commons.wikimedia.org/wiki/Special:FilePath/{name}"
@@ -1,25 +1,244 @@
 """scrape and parse text from wikipedia pages (quicker than using the parse api)"""
 import logging
-from requests_html import HTMLSession
+import time
+from typing import Iterable, Optional, Union
+import requests
+from lxml import etree
+from wikigeo.wikisource.errors import RequestError, ThrottledError
+from wikigeo.wikisource.metrics import DEFAULT_METRICS, Metrics, host_of
+from wikigeo.wikisource.ratelimit import (
+    DEFAULT_LIMITER,
+    RETRY_STATUSES,
+    RateLimiter,
+    backoff_delay,
+    retry_after,
+)
+from wikigeo.wikisource.sessions import DEFAULT_POOL, SessionPool
+from wikigeo.wikisource.textstore import PageTextStore
 
+logger = logging.getLogger(__name__)
 
-def scrape_page_text(pagetitle: str, char_limit: int, wiki_lang: str = "en") -> dict:
-    """returns text on a given wikipedia page.
+CONTENT_ID = "mw-content-text"
+TEXT_TAGS = {"p", "h2", "h3"}
+CHUNK_SIZE = 16384
 
-    pagetitle: string of the extact page title"""
 
+def page_url(pagetitle: str, wiki_lang: str = "en") -> str:
+    """url of the wikipedia page with the given title"""
     url = f"https://{wiki_lang}.wikipedia.org/wiki/"
-    session = HTMLSession()
-    page_url = url + pagetitle.replace(' ', '_')
-    response = session.get(page_url)
-    logging.debug(response)
-    if not response.ok:
-        raise Exception('error response: ' + response)
-    page = response.html
-    page_text = [elem.text for elem in page.find('p, h2, h3')]
-    page_text = ' '.join(page_text).replace('[edit]', '')
-    if char_limit:
-        result = {'title': pagetitle, 'text': page_text[:char_limit]}
+    return url + pagetitle.replace(' ', '_')
+
+
+def _is_skipped(elem) -> bool:
+    """reference markers, [edit] links and inline styles aren't part of the text"""
+    if not isinstance(elem.tag, str) or elem.tag in ("style", "script"):
+        return True
+    classes = elem.get("class", "").split()
+    return "mw-editsection" in classes or (elem.tag == "sup" and "reference" in classes)
+
+
+def _block_text(elem) -> str:
+    """text of a paragraph or heading without skipped elements"""
+    parts = [elem.text or ""]
+    for child in elem:
+        if not _is_skipped(child):
+            parts.append(_block_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def extract_text(
+    chunks: Iterable[Union[bytes, str]], char_limit: Optional[int] = None
+) -> str:
+    """text of the paragraphs and headings in the content div of a wikipedia page.
+
+    The html is parsed incrementally as chunks arrive, and parsing stops once
+    char_limit characters have been collected, so the rest of the page isn't read.
+    If the page has no content div, the whole page is used.
+
+    chunks: iterable of pieces of the page html, e.g. response.iter_content()
+
+    char_limit: max number of characters to return, or None for all the text"""
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    blocks = []
+    outside = []
+    length = 0
+    inblock = 0
+    content = None
+    seen_content = False
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                if elem.tag in TEXT_TAGS:
+                    inblock += 1
+                elif content is None and elem.get("id") == CONTENT_ID:
+                    content = elem
+                    seen_content = True
+                continue
+            if elem is content:
+                content = None
+            elif elem.tag in TEXT_TAGS:
+                inblock -= 1
+                text = " ".join(_block_text(elem).replace("[edit]", "").split())
+                if text and content is not None:
+                    blocks.append(text)
+                    length += len(text) + 1
+                elif text and not seen_content:
+                    outside.append(text)
+            if not inblock:
+                # nothing outside a paragraph or heading is kept, so free it
+                elem.clear(keep_tail=True)
+        if char_limit and length > char_limit:
+            break
     else:
-        result = {'title': pagetitle, 'text': page_text}
-    return result
+        parser.close()
+    page_text = " ".join(blocks if seen_content else outside)
+    return page_text[:char_limit] if char_limit else page_text
+
+
+def parse_page_text(html: str, pagetitle: str, char_limit: int) -> dict:
+    """returns text from the html of a wikipedia page"""
+    return {'title': pagetitle, 'text': extract_text([html], char_limit)}
+
+
+def _counted(chunks: Iterable[bytes], sizes: list) -> Iterable[bytes]:
+    """passes chunks on, adding the size of each to sizes"""
+    for chunk in chunks:
+        sizes.append(len(chunk))
+        yield chunk
+
+
+def _conditional_headers(stored: Optional[dict]) -> dict:
+    """headers asking for the page only if it has changed since it was stored"""
+    headers = {}
+    if stored is not None:
+        if stored["etag"]:
+            headers["If-None-Match"] = stored["etag"]
+        if stored["last_modified"]:
+            headers["If-Modified-Since"] = stored["last_modified"]
+    return headers
+
+
+def scrape_page_text(
+    pagetitle: str,
+    char_limit: int,
+    wiki_lang: str = "en",
+    ratelimiter: RateLimiter = DEFAULT_LIMITER,
+    sessionpool: SessionPool = DEFAULT_POOL,
+    store: Optional[PageTextStore] = None,
+    revid: Optional[int] = None,
+    metrics: Metrics = DEFAULT_METRICS,
+    retries: int = 3,
+    backoff: float = 0.5,
+    headers: Optional[dict] = None,
+) -> dict:
+    """returns text on a given wikipedia page.
+    The page is streamed, and stops downloading once char_limit characters are found.
+
+    pagetitle: string of the extact page title
+
+    store: optional PageTextStore. Stored text is reused without a request if it is
+    of the given revid, otherwise a conditional request is sent and the stored text
+    is reused if the page is not modified
+
+    revid: optional current revision id of the page
+
+    metrics: Metrics the request time, rate limit wait and bytes read are reported to
+
+    retries: times a request is sent again after a 429 or 5xx response or failed
+    connection, waiting for Retry-After or backoff seconds doubling each time
+
+    headers: optional headers sent with the request, e.g. {"User-agent": userinfo}
+
+    raises RequestError (ThrottledError if the wiki is overloaded) for error responses
+    and CircuitOpenError without sending the request while requests to the wiki
+    keep failing"""
+
+    stored = store.get(pagetitle, wiki_lang) if store is not None else None
+    if stored is not None and not store.usable(stored, char_limit):
+        stored = None
+    if stored is not None and revid is not None and stored["revid"] == revid:
+        logger.debug("reusing text of %s revision %s", pagetitle, revid)
+        return {'title': pagetitle, 'text': store.reuse(stored, char_limit)}
+
+    url = page_url(pagetitle, wiki_lang)
+    headers = {**(headers or {}), **_conditional_headers(stored)}
+    session = sessionpool.get(url)
+    sizes = []
+    limiter = ratelimiter.host(url)
+    # retries aren't checked again, see WikipediaAPI._throttled_get
+    limiter.check()
+    for attempt in range(retries + 1):
+        queued = time.perf_counter()
+        with limiter.slot(check=False):
+            sent = time.perf_counter()
+            try:
+                response = session.get(url, headers=headers, stream=True)
+            except requests.RequestException as error:
+                if attempt == retries:
+                    limiter.failed()
+                    raise RequestError(
+                        f"request to {url} failed: {error}", url=url
+                    ) from error
+                response = None
+                wait = backoff_delay(attempt, backoff)
+            if response is not None:
+                logger.debug(response)
+                throttled = response.status_code in RETRY_STATUSES
+                if throttled and attempt < retries:
+                    response.close()
+                    if metrics.enabled:
+                        host = host_of(url)
+                        metrics.observe(
+                            "ratelimit_wait_seconds", sent - queued, host=host
+                        )
+                        elapsed = time.perf_counter() - sent
+                        metrics.observe("request_seconds", elapsed, host=host)
+                    wait = retry_after(response.headers, default=None)
+                    if wait is None:
+                        wait = backoff_delay(attempt, backoff)
+                else:
+                    if throttled:
+                        limiter.failed()
+                    else:
+                        limiter.succeeded()
+                    try:
+                        if stored is not None and response.status_code == 304:
+                            text = store.reuse(stored, char_limit)
+                            if revid is not None:
+                                store.set_revid(pagetitle, wiki_lang, revid)
+                            return {'title': pagetitle, 'text': text}
+                        if not response.ok:
+                            status = response.status_code
+                            error = ThrottledError if throttled else RequestError
+                            raise error(f"{status} response from {url}", status, url)
+                        chunks = response.iter_content(CHUNK_SIZE)
+                        if metrics.enabled:
+                            chunks = _counted(chunks, sizes)
+                        text = extract_text(chunks, char_limit)
+                    finally:
+                        response.close()
+                        if metrics.enabled:
+                            host = host_of(url)
+                            metrics.observe(
+                                "ratelimit_wait_seconds", sent - queued, host=host
+                            )
+                            elapsed = time.perf_counter() - sent
+                            metrics.observe("request_seconds", elapsed, host=host)
+                            metrics.observe("response_bytes", sum(sizes), host=host)
+                    break
+        logger.warning("request to %s retrying in %.2fs", url, wait)
+        metrics.increment("retries", host=host_of(url) if metrics.enabled else None)
+        limiter.pause(wait)
+    if store is not None:
+        store.set(
+            pagetitle,
+            wiki_lang,
+            text,
+            not char_limit or len(text) < char_limit,
+            revid,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+    return {'title': pagetitle, 'text': text}